@@ -0,0 +1,150 @@
+# Copyright 2004-present Facebook. All Rights Reserved.
+
+# @lint-ignore-every PYTHON3COMPATIMPORTS1
+
+"""
+Running statistics of operation durations, updated one duration at a time.
+
+StationStorage keeps one `DurationStatistics` per station, operation and sequence version in the
+operation_durations table and adds the duration of every successful run to it as the run is
+stored, so reading the statistics never scans the operation history.
+
+The mean and variance are kept with Welford's method. The EWMA weighs the latest runs most, so it
+follows an operation that got slower or faster. The medians and 95th percentiles are estimated
+with the P-square algorithm (Jain and Chlamtac, 1985), which keeps five markers per quantile
+instead of the durations - exact for the first five runs, approximate after that.
+"""
+
+import copy
+import math
+from bisect import insort
+
+# Weight of the latest duration in the EWMA - about the last 10 runs count
+EWMA_ALPHA = 0.2
+# Quantiles estimated, with the name of their column
+QUANTILES = (("p50", 0.5), ("p95", 0.95))
+_MARKERS = 5
+
+
+def _parabolic(heights, positions, i, d):
+    """ Height of marker i moved by d, on the parabola through it and its neighbours """
+    return heights[i] + d / (positions[i + 1] - positions[i - 1]) * (
+        (positions[i] - positions[i - 1] + d)
+        * (heights[i + 1] - heights[i])
+        / (positions[i + 1] - positions[i])
+        + (positions[i + 1] - positions[i] - d)
+        * (heights[i] - heights[i - 1])
+        / (positions[i] - positions[i - 1])
+    )
+
+
+def _add_to_markers(markers, quantile, value, count):
+    """
+    Add a value to the P-square markers of a quantile
+
+    :param dict markers: {"heights": [...], "positions": [...]}; changed in place
+    :param float quantile: the quantile the markers estimate, between 0 and 1
+    :param float value: the new value
+    :param int count: number of values, including the new one
+    """
+    heights = markers["heights"]
+    if count <= _MARKERS:
+        # The first values are kept, sorted, until there are enough for the markers
+        insort(heights, value)
+        if count == _MARKERS:
+            markers["positions"] = list(range(1, _MARKERS + 1))
+        return
+
+    positions = markers["positions"]
+    if value < heights[0]:
+        heights[0] = value
+        cell = 0
+    elif value >= heights[-1]:
+        heights[-1] = value
+        cell = _MARKERS - 2
+    else:
+        cell = max(i for i in range(_MARKERS - 1) if heights[i] <= value)
+    for i in range(cell + 1, _MARKERS):
+        positions[i] += 1
+
+    increments = (0.0, quantile / 2, quantile, (1 + quantile) / 2, 1.0)
+    for i in range(1, _MARKERS - 1):
+        d = 1 + (count - 1) * increments[i] - positions[i]
+        if (d >= 1 and positions[i + 1] - positions[i] > 1) or (
+            d <= -1 and positions[i - 1] - positions[i] < -1
+        ):
+            d = 1 if d > 0 else -1
+            height = _parabolic(heights, positions, i, d)
+            if not heights[i - 1] < height < heights[i + 1]:
+                height = heights[i] + d * (heights[i + d] - heights[i]) / (
+                    positions[i + d] - positions[i]
+                )
+            heights[i] = height
+            positions[i] += d
+
+
+def _estimate(markers, quantile, count):
+    """ Current estimate of a quantile from its markers; None before the first value """
+    heights = markers["heights"]
+    if not heights:
+        return None
+    if count <= _MARKERS:
+        # Nearest rank of the values kept so far
+        return heights[max(int(math.ceil(quantile * len(heights))) - 1, 0)]
+    return heights[_MARKERS // 2]
+
+
+class DurationStatistics(object):
+    """ Running statistics of the durations of one operation, in seconds """
+
+    __slots__ = ("count", "mean", "variance", "ewma", "p50", "p95", "markers")
+
+    def __init__(
+        self, count=0, mean=0.0, variance=0.0, ewma=None, p50=None, p95=None, markers=None
+    ):
+        self.count = count or 0
+        self.mean = mean or 0.0
+        # Sample variance; 0 for fewer than two durations
+        self.variance = variance or 0.0
+        self.ewma = ewma
+        self.p50 = p50
+        self.p95 = p95
+        # P-square markers of each quantile, by column name
+        self.markers = markers or {name: {"heights": []} for name, _quantile in QUANTILES}
+
+    @classmethod
+    def from_row(cls, row):
+        """ Statistics of an operation_durations row; the row is not changed by `add` """
+        values = {name: getattr(row, name) for name in cls.__slots__}
+        values["markers"] = copy.deepcopy(values["markers"])
+        return cls(**values)
+
+    def to_dict(self):
+        """ Statistics as column name to value - the columns of an operation_durations row """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def add(self, seconds):
+        """
+        Add the duration of a run
+
+        :param float seconds: the duration
+        """
+        seconds = float(seconds)
+        self.count += 1
+
+        delta = seconds - self.mean
+        self.mean += delta / self.count
+        if self.count > 1:
+            # Welford - the sum of squared differences from the mean, kept as the variance
+            squares = self.variance * (self.count - 2) + delta * (seconds - self.mean)
+            self.variance = squares / (self.count - 1)
+
+        if self.ewma is None:
+            self.ewma = seconds
+        else:
+            self.ewma += EWMA_ALPHA * (seconds - self.ewma)
+
+        for name, quantile in QUANTILES:
+            markers = self.markers.setdefault(name, {"heights": []})
+            _add_to_markers(markers, quantile, seconds, self.count)
+            setattr(self, name, _estimate(markers, quantile, self.count))
@@ -2,12 +2,15 @@
 
 # @lint-ignore-every PYTHON3COMPATIMPORTS1
 
+import math
 import os
+import time
+from collections import OrderedDict
 from contextlib import contextmanager
 from datetime import timedelta
 
 import simplejson
-from sqlalchemy import create_engine, desc, func, inspect
+from sqlalchemy import and_, create_engine, desc, event, func, inspect
 from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.orm import sessionmaker
 from tornado.escape import url_escape
@@ -20,10 +23,12 @@ from stationexec.utilities.time import get_utc_now, local_to_utc, utc_to_local,
 from stationexec.utilities import uuidstr
 from stationexec.web.handlers import ExecutiveHandler
 
+from station_storage.duration_statistics import DurationStatistics
 from station_storage.tables import (
     Base,
     Logging,
     Maintenance,
+    OperationDuration,
     OperationStart,
     OperationEnd,
     ErrorCode,
@@ -32,9 +37,13 @@ from station_storage.tables import (
     SequenceStart,
     SequenceEnd,
     Station,
+    StorageMetadata,
     User,
 )
 
+# StorageMetadata name recording that operation_durations was computed from the history
+_DURATIONS_REBUILT = "operation_durations_rebuilt"
+
 # TODO Allow db password from command line? How to let it not be hardcoded somewhere?
 #  push hard for certs?
 version = "1.3"
@@ -51,9 +60,109 @@ default_configurations = {
     },
     "active_modules": None,
     "log_level": 3,
+    "sqlite_profile": "default",
+    "sqlite_pragmas": None,
+    "wal_checkpoint_period": 60,
+}
+
+# PRAGMAs set on every connection to the local SQLite database, by 'sqlite_profile'.
+# "tuned" lets the web history endpoints read while the storage worker writes (WAL), and syncs
+# to disk at checkpoints instead of at every commit - a power loss can lose the last commits,
+# but never corrupts the database.
+SQLITE_PROFILES = {
+    "default": {},
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        # Negative - in KiB; 64 MB
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
 }
 
 
+def normalize_uuid(value):
+    """
+    UUID in the form it is stored in - 32 lowercase hex digits without dashes
+
+    :param str value: a UUID, with or without dashes, in any case
+    :return: the stored form; None if value is not a complete UUID
+    :rtype: str
+    """
+    try:
+        return uuidstr.uuid2str(uuidstr.str2uuid(value))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def normalize_uuid_prefix(value):
+    """
+    Start of a UUID in the form it is stored in
+
+    :param str value: hex digits of the start of a UUID, dashes allowed
+    :return: lowercase hex digits; None if value is not the start of a UUID
+    :rtype: str
+    """
+    if not isinstance(value, str):
+        return None
+    prefix = value.replace("-", "").lower()
+    if not prefix or len(prefix) > 32 or prefix.strip("0123456789abcdef"):
+        return None
+    return prefix
+
+
+def _version_key(version):
+    """ Sequence version as it is stored in the operation_durations key """
+    return (version or "")[:255]
+
+
+def with_defaults(table, rows):
+    """
+    Rows with the Python 'default' of their columns in place of None, as the ORM applies them -
+    a Core INSERT would write NULL, which NOT NULL columns such as 'passing' refuse
+
+    :param table: mapped class of the table
+    :param list rows: column name to value dicts
+    :return: new dicts, all with the same keys
+    :rtype: list
+    """
+    defaults = {}
+    for column in table.__table__.columns:
+        default = column.default
+        if default is None or not (default.is_scalar or default.is_callable):
+            continue
+        defaults[column.name] = default
+    rows = [dict(row) for row in rows]
+    for name, default in defaults.items():
+        for row in rows:
+            if row.get(name) is None:
+                # Callable defaults are wrapped by SQLAlchemy to take the execution context
+                row[name] = default.arg(None) if default.is_callable else default.arg
+    return rows
+
+
+def uuid_filter(column, uuid=None, prefix=None):
+    """
+    Filter of a UUID column that can use its index. A complete UUID is matched exactly. A prefix
+    is matched as the range of the UUIDs that start with it - every hex digit sorts before "g" -
+    instead of with LIKE, which SQLite and MySQL can not serve from a case sensitive index.
+
+    :param column: the UUID column
+    :param str uuid: [optional] a complete UUID
+    :param str prefix: [optional] start of the UUIDs, used if uuid is not given
+    :return: the filter expression; None if neither is valid
+    """
+    uuid = normalize_uuid(uuid)
+    if uuid is not None:
+        return column == uuid
+    prefix = normalize_uuid_prefix(prefix)
+    if prefix is not None:
+        return and_(column >= prefix, column < prefix + "g")
+    return None
+
+
 class UniqueViolationDbException(Exception):
     # Tried to insert duplicate data in a unique column
     pass
@@ -70,13 +179,26 @@ class StationStorage(Tool):
         sqlite_filename="storage.sqlite",
         custom=False,
         db_base=None,
+        sqlite_profile="default",
+        sqlite_pragmas=None,
+        wal_checkpoint_period=60,
         **kwargs,
     ):
+        """
+        :param dict db_config: MySQL connection settings; the local SQLite database is used
+            without a user and host
+        :param str sqlite_profile: PRAGMAs of the SQLite database - a name in SQLITE_PROFILES
+        :param dict sqlite_pragmas: [optional] PRAGMA name to value, added to or replacing
+            those of the profile
+        :param float wal_checkpoint_period: seconds between checkpoints of the SQLite write-ahead
+            log, when the journal mode is WAL; 0 to leave them to SQLite
+        """
         super(StationStorage, self).__init__(**kwargs)
         known_modules = [
             "logging",
             "operation_starts",
             "operation_ends",
+            "operation_durations",
             "stations",
             "results",
             "data",
@@ -108,6 +230,14 @@ class StationStorage(Tool):
                     )
 
         self._active_modules = active_modules
+        # Duration statistics are kept from the sequence and operation records
+        self._keeps_durations = all(
+            module in active_modules
+            for module in (
+                "operation_durations", "sequence_starts", "operation_starts", "operation_ends"
+            )
+        )
+        self._sqlite_pragmas = {}
 
         if db_config.get("user") and db_config.get("host"):
             # Connect to remote MySQL Host
@@ -132,10 +262,22 @@ class StationStorage(Tool):
             self._engine = create_engine(
                 "sqlite:///{0}".format(sql_file), echo=False, pool_pre_ping=True
             )
+            if sqlite_profile not in SQLITE_PROFILES:
+                raise Exception(
+                    "Unknown SQLite profile '{0}' - use one of: {1}".format(
+                        sqlite_profile, ", ".join(sorted(SQLITE_PROFILES))
+                    )
+                )
+            self._sqlite_pragmas = dict(SQLITE_PROFILES[sqlite_profile], **(sqlite_pragmas or {}))
+            if self._sqlite_pragmas:
+                event.listen(self._engine, "connect", self._set_sqlite_pragmas)
 
         self._session = sessionmaker(bind=self._engine)
         self._is_initialized = False
 
+        self._wal_checkpoint_period = float(wal_checkpoint_period)
+        self._last_checkpoint = time.monotonic()
+
         if custom:
             # This is a custom override of storage class - no need to register for events
             return
@@ -166,6 +308,11 @@ class StationStorage(Tool):
                 RetrievalEvents.GET_OPERATION_AVERAGE_DURATION,
                 self.get_operation_average_duration,
             )
+        if self._keeps_durations:
+            reg(
+                RetrievalEvents.GET_OPERATION_DURATION_STATISTICS,
+                self.get_operation_duration_statistics,
+            )
 
         if "results" in self._active_modules:
             reg(StorageEvents.ON_RESULT_STORE, self.on_result_store)
@@ -207,6 +354,8 @@ class StationStorage(Tool):
                 if "data" in self._active_modules:
                     reg(RetrievalEvents.GET_SEQUENCE_DATA, self.get_sequence_data)
 
+                reg(RetrievalEvents.GET_OPERATION_TIMING, self.get_operation_timing)
+
         # Register Log events last so that the event registrations do not show up in the log
         if "logging" in self._active_modules:
             reg(RetrievalEvents.GET_LOG_DATA, self.get_log_data)
@@ -220,6 +369,9 @@ class StationStorage(Tool):
                 self.db_base.metadata.tables[table] for table in self._active_modules
             ]
             self.db_base.metadata.create_all(bind=self._engine, tables=db_tables)
+            self._create_missing_indexes(db_tables)
+            if self._keeps_durations:
+                StorageMetadata.__table__.create(bind=self._engine, checkfirst=True)
         except OperationalError as e:
             if "timed out" in str(e):
                 log.error("Database connection timeout: {0}".format(str(e)))
@@ -229,6 +381,48 @@ class StationStorage(Tool):
                 raise
         else:
             self._is_initialized = True
+            if self._keeps_durations:
+                self._initialize_operation_durations()
+
+    def _initialize_operation_durations(self):
+        """
+        Compute the duration statistics from the operation history once - on a database of an
+        older version, or with operation_durations newly made active. Whether that was done is
+        kept in storage_metadata, so a database without successful runs is not scanned again at
+        every start.
+        """
+        try:
+            with self.session() as s:
+                if s.get(StorageMetadata, _DURATIONS_REBUILT) is not None:
+                    return
+                if s.query(OperationDuration.station).first() is not None:
+                    # Kept up to date by an earlier start that did not record it
+                    s.add(StorageMetadata(name=_DURATIONS_REBUILT, value="1"))
+                    return
+            self.rebuild_operation_durations()
+        except Exception as e:
+            # Started again at the next initialize
+            log.exception("Unable to compute the operation duration statistics", e)
+
+    def _create_missing_indexes(self, db_tables):
+        """
+        Add the indexes of the table definitions that a database created by an older version
+        does not have - create_all only creates the indexes of new tables
+
+        :param list db_tables: the tables of the active modules
+        :return: None
+        """
+        insp = inspect(self._engine)
+        for table in db_tables:
+            existing = set(index["name"] for index in insp.get_indexes(table.name))
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                log.info(
+                    "Adding index {0} to database table '{1}' - this may take a while on a "
+                    "large database".format(index.name, table.name)
+                )
+                index.create(bind=self._engine)
 
     def verify_status(self):
         """ Check that tool is online; attempt to repair if not. Called every 5 seconds. """
@@ -247,12 +441,59 @@ class StationStorage(Tool):
                 log.exception("Exception while checking database status", e)
                 self.set_offline()
 
+        if self.is_online and self._is_wal():
+            now = time.monotonic()
+            if now - self._last_checkpoint >= self._wal_checkpoint_period:
+                self._last_checkpoint = now
+                self.wal_checkpoint()
+
         if not self.is_online:
             return self.initialize()
 
     def shutdown(self):
         """ Cleanup tool for program shutdown """
-        pass
+        if self._is_wal():
+            # Leave a database file that holds everything, with an empty log
+            self.wal_checkpoint("TRUNCATE")
+
+    def _set_sqlite_pragmas(self, dbapi_connection, _connection_record):
+        """ Set the PRAGMAs of the profile on a new SQLite connection """
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self._sqlite_pragmas.items():
+                cursor.execute("PRAGMA {0}={1}".format(name, value))
+        finally:
+            cursor.close()
+
+    def _is_wal(self):
+        return (
+            self._engine.dialect.name == "sqlite"
+            and self._wal_checkpoint_period > 0
+            and str(self._sqlite_pragmas.get("journal_mode", "")).upper() == "WAL"
+        )
+
+    def wal_checkpoint(self, mode="PASSIVE"):
+        """
+        Copy the pages of the SQLite write-ahead log into the database, so the log does not keep
+        growing while readers are active. Called every 'wal_checkpoint_period' seconds.
+
+        :param str mode: PASSIVE does not wait for readers or writers; TRUNCATE also empties
+            the log file
+        :return: (busy, log pages, pages checkpointed); None if it failed
+        :rtype: tuple
+        """
+        connection = self._engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("PRAGMA wal_checkpoint({0})".format(mode))
+            result = tuple(cursor.fetchone())
+            cursor.close()
+            return result
+        except Exception as e:
+            log.exception("SQLite write-ahead log checkpoint failed", e)
+            return None
+        finally:
+            connection.close()
 
     def on_ui_command(self, command, **kwargs):
         """ Command received from UI """
@@ -354,6 +595,25 @@ class StationStorage(Tool):
         finally:
             s.close()
 
+    def _insert(self, table, rows):
+        """
+        Insert rows into a table with one executemany INSERT in a single transaction.
+
+        DataStorage passes the records of one storage event together, so every batch is one
+        INSERT statement. Core inserts skip the identity map and unit of work of the ORM, which
+        cost more than the INSERT itself for large batches.
+
+        None values are replaced by the default of their column (see `with_defaults`).
+
+        :param table: mapped class of the table
+        :param list rows: column name to value dicts, all with the same keys
+        :return: None
+        """
+        if not rows:
+            return
+        with self.session() as s:
+            s.execute(table.__table__.insert(), with_defaults(table, rows))
+
     # --------------------------------------------------------------------------------------------
 
     def get_user_info(self, name, evt=None):
@@ -400,9 +660,10 @@ class StationStorage(Tool):
         :param str evt: event the data came from
         :return: None
         """
-        with self.session() as s:
-            for seq_start in data:
-                seq_data = {
+        self._insert(
+            SequenceStart,
+            [
+                {
                     "uuid": seq_start.get("uuid"),
                     "station": seq_start.get("station"),
                     "info": seq_start.get("info"),
@@ -410,7 +671,9 @@ class StationStorage(Tool):
                     "version": seq_start.get("version"),
                     "created": seq_start.get("created"),
                 }
-                s.add(SequenceStart(**seq_data))
+                for seq_start in data
+            ],
+        )
 
     def on_sequence_end(self, data, evt=None):
         """
@@ -433,16 +696,19 @@ class StationStorage(Tool):
         :param str evt: event the data came from
         :return: None
         """
-        with self.session() as s:
-            for seq_end in data:
-                seq_data = {
+        self._insert(
+            SequenceEnd,
+            [
+                {
                     "uuid": seq_end.get("uuid"),
                     "passing": seq_end.get("passing"),
                     "duration": seq_end.get("duration_ms"),
                     "info": seq_end.get("info"),
                     "created": seq_end.get("created"),
                 }
-                s.add(SequenceEnd(**seq_data))
+                for seq_end in data
+            ],
+        )
 
     def on_operation_start(self, data, evt=None):
         """
@@ -468,9 +734,10 @@ class StationStorage(Tool):
         :param str evt: event the data came from
         :return: None
         """
-        with self.session() as s:
-            for op_start in data:
-                op_data = {
+        self._insert(
+            OperationStart,
+            [
+                {
                     "uuid": op_start.get("uuid"),
                     "opid": op_start.get("opid"),
                     "name": op_start.get("name"),
@@ -480,7 +747,9 @@ class StationStorage(Tool):
                     "info": op_start.get("info"),
                     "created": op_start.get("created"),
                 }
-                s.add(OperationStart(**op_data))
+                for op_start in data
+            ],
+        )
 
     def on_operation_end(self, data, evt=None):
         """
@@ -501,22 +770,153 @@ class StationStorage(Tool):
         "created" time usually added by caller - time the record was generated (as opposed
         to now, when the record is stored, in case there is a delay)
 
+        The durations of successful runs are added to the operation_durations statistics in the
+        same transaction, by the "station", "opid" and "version" the sequencer adds to the data.
+
         :param list data: operation ending data to store
         :param str evt: event the data came from
         :return: None
         """
+        if not data:
+            return
+        rows = with_defaults(OperationEnd, [
+            {
+                "uuid": op_end.get("uuid"),
+                "passing": op_end.get("passing"),
+                "duration": op_end.get("duration_ms"),
+                "waittime": op_end.get("waittime_ms"),
+                "exitcode": op_end.get("exitcode"),
+                "info": op_end.get("info"),
+                "created": op_end.get("created"),
+            }
+            for op_end in data
+        ])
         with self.session() as s:
-            for op_end in data:
-                op_data = {
-                    "uuid": op_end.get("uuid"),
-                    "passing": op_end.get("passing"),
-                    "duration": op_end.get("duration_ms"),
-                    "waittime": op_end.get("waittime_ms"),
-                    "exitcode": op_end.get("exitcode"),
-                    "info": op_end.get("info"),
-                    "created": op_end.get("created")
-                }
-                s.add(OperationEnd(**op_data))
+            s.execute(OperationEnd.__table__.insert(), rows)
+            if self._keeps_durations:
+                self._add_operation_durations(s, data)
+
+    def _add_operation_durations(self, s, data):
+        """
+        Add the durations of successful operation runs to their operation_durations rows
+
+        :param s: session of the transaction that stores the runs
+        :param list data: operation ending data, as given to on_operation_end
+        :return: None
+        """
+        durations = OrderedDict()
+        runs = {}
+        for op_end in data:
+            if op_end.get("exitcode") != 100 or op_end.get("duration_ms") is None:
+                continue
+            uuid = op_end.get("uuid")
+            durations[uuid] = op_end.get("duration_ms")
+            if op_end.get("opid") is not None and op_end.get("station") is not None:
+                runs[uuid] = (
+                    op_end["station"], op_end["opid"], _version_key(op_end.get("version"))
+                )
+        if not durations:
+            return
+        missing = [uuid for uuid in durations if uuid not in runs]
+        if missing:
+            # Data of older versions - the run is found from its stored start
+            runs.update(
+                (uuid, (station, opid, _version_key(version)))
+                for uuid, opid, station, version in (
+                    s.query(
+                        OperationStart.uuid,
+                        OperationStart.opid,
+                        SequenceStart.station,
+                        SequenceStart.version,
+                    )
+                    .join(SequenceStart, OperationStart.sequence == SequenceStart.uuid)
+                    .filter(OperationStart.uuid.in_(missing))
+                    .all()
+                )
+                if opid is not None
+            )
+        keys = set(runs.values())
+        if not keys:
+            return
+        rows = {
+            (row.station, row.opid, row.version): row
+            for row in s.query(OperationDuration)
+            .filter(OperationDuration.station.in_(set(key[0] for key in keys)))
+            .filter(OperationDuration.opid.in_(set(key[1] for key in keys)))
+            .all()
+        }
+        statistics = {}
+        for uuid, duration_ms in durations.items():
+            key = runs.get(uuid)
+            if key is None:
+                log.debug(
+                    3, "No station and operation for the duration of operation run "
+                    "'{0}'".format(uuid),
+                )
+                continue
+            if key not in statistics:
+                row = rows.get(key)
+                statistics[key] = (
+                    DurationStatistics() if row is None else DurationStatistics.from_row(row)
+                )
+            statistics[key].add(duration_ms / 1000.0)
+
+        now = get_utc_now()
+        for key, stats in statistics.items():
+            row = rows.get(key)
+            if row is None:
+                row = OperationDuration(station=key[0], opid=key[1], version=key[2])
+                s.add(row)
+            for name, value in stats.to_dict().items():
+                setattr(row, name, value)
+            row.updated = now
+
+    def rebuild_operation_durations(self):
+        """
+        Compute the operation_durations statistics again from the whole operation history
+
+        :return: number of operation_durations rows
+        :rtype: int
+        """
+        log.info("Computing the operation duration statistics from the operation history")
+        statistics = OrderedDict()
+        with self.session() as s:
+            runs = (
+                s.query(
+                    OperationStart.opid,
+                    SequenceStart.station,
+                    SequenceStart.version,
+                    OperationEnd.duration,
+                )
+                .join(OperationEnd, OperationEnd.uuid == OperationStart.uuid)
+                .join(SequenceStart, OperationStart.sequence == SequenceStart.uuid)
+                .filter(OperationEnd.exitcode == 100)
+                .order_by(OperationEnd.created)
+            )
+            for opid, station, version, duration in runs.yield_per(1000):
+                if opid is None or duration is None:
+                    continue
+                key = (station, opid, _version_key(version))
+                statistics.setdefault(key, DurationStatistics()).add(duration / 1000.0)
+
+            now = get_utc_now()
+            s.query(OperationDuration).delete()
+            if statistics:
+                s.execute(
+                    OperationDuration.__table__.insert(),
+                    [
+                        dict(
+                            stats.to_dict(),
+                            station=station,
+                            opid=opid,
+                            version=version,
+                            updated=now,
+                        )
+                        for (station, opid, version), stats in statistics.items()
+                    ],
+                )
+            s.merge(StorageMetadata(name=_DURATIONS_REBUILT, value="1", updated=now))
+        return len(statistics)
     
     def on_error_code(self, data, evt=None):
         """
@@ -539,9 +939,10 @@ class StationStorage(Tool):
         :param str evt: event the data came from
         :return: None
         """
-        with self.session() as s:
-            for err_code in data:
-                err_code_data = {
+        self._insert(
+            ErrorCode,
+            [
+                {
                     "uuid": err_code.get("uuid"),
                     "operation": err_code.get("operation"),
                     "project_code": err_code.get("project_code"),
@@ -550,7 +951,9 @@ class StationStorage(Tool):
                     "debug_message": err_code.get("debug_message"),
                     "timestamp": to_datetime(err_code.get("timestamp")),
                 }
-                s.add(ErrorCode(**err_code_data))
+                for err_code in data
+            ],
+        )
 
     def on_result_store(self, data, evt=None):
         """
@@ -582,9 +985,10 @@ class StationStorage(Tool):
         :param str evt: event the data came from
         :return: None
         """
-        with self.session() as s:
-            for result in data:
-                result_data = {
+        self._insert(
+            Result,
+            [
+                {
                     "uuid": result.get("uuid"),
                     "operation": result.get("operation"),
                     "name": result.get("name"),
@@ -599,7 +1003,9 @@ class StationStorage(Tool):
                     "operand3": result.get("operand3"),
                     "created": result.get("created"),
                 }
-                s.add(Result(**result_data))
+                for result in data
+            ],
+        )
 
     def on_data_store(self, data, evt=None):
         """
@@ -628,24 +1034,25 @@ class StationStorage(Tool):
         :param str evt: event the data came from
         :return: None
         """
-        with self.session() as s:
-            for data_object in data:
-                data_store = {
-                    "uuid": data_object.get("uuid"),
-                    "operation": data_object.get("operation"),
-                    "name": data_object.get("name"),
-                    "identifier": data_object.get("identifier"),
-                    "description": data_object.get("description"),
-                    "value": data_object.get("value"),
-                    "mimetype": data_object.get("mimetype"),
-                    "size": data_object.get("size"),
-                    "info": data_object.get("info"),
-                    "created": data_object.get("created"),
-                }
-                # TODO Fix to allow storing non-binary items in blob - expand as needed
-                if type(data_store["value"]) in [int, float, str]:
-                    data_store["value"] = "{0}".format(data_store["value"]).encode()
-                s.add(DataStorage(**data_store))
+        rows = []
+        for data_object in data:
+            data_store = {
+                "uuid": data_object.get("uuid"),
+                "operation": data_object.get("operation"),
+                "name": data_object.get("name"),
+                "identifier": data_object.get("identifier"),
+                "description": data_object.get("description"),
+                "value": data_object.get("value"),
+                "mimetype": data_object.get("mimetype"),
+                "size": data_object.get("size"),
+                "info": data_object.get("info"),
+                "created": data_object.get("created"),
+            }
+            # TODO Fix to allow storing non-binary items in blob - expand as needed
+            if type(data_store["value"]) in [int, float, str]:
+                data_store["value"] = "{0}".format(data_store["value"]).encode()
+            rows.append(data_store)
+        self._insert(DataStorage, rows)
 
     def get_operation_average_duration(self, **kwargs):
         """
@@ -660,6 +1067,16 @@ class StationStorage(Tool):
         :param dict kwargs: arguments necessary for query
         :return list: list of tuples - [(operation_id, avg_seconds), ...]
         """
+        if self._keeps_durations:
+            # The mean of each operation over the sequence versions, from the statistics
+            totals = OrderedDict()
+            for opid, count, mean in self._query_operation_durations(
+                kwargs, OperationDuration.opid, OperationDuration.count, OperationDuration.mean
+            ):
+                runs, total = totals.get(opid, (0, 0.0))
+                totals[opid] = (runs + count, total + count * mean)
+            return [(opid, total / runs) for opid, (runs, total) in totals.items() if runs]
+
         with self.session() as s:
             avg = (
                 s.query(OperationStart.opid, func.avg(OperationEnd.duration))
@@ -674,6 +1091,55 @@ class StationStorage(Tool):
             avg = [(op, time / 1000.0) for op, time in avg]
             return avg
 
+    def get_operation_duration_statistics(self, **kwargs):
+        """
+        Query the duration statistics of every operation from this particular station
+
+        Event emitted in SequenceHistoryHandler
+
+            kwargs = {
+                "stationuuid": unique ID for station,
+                "version": (optional) only the runs of this sequence version
+            }
+
+        :param dict kwargs: arguments necessary for query
+        :return list: list of dicts - opid, version, count, and mean, stdev, ewma, p50 and p95
+            in seconds, one for each operation and sequence version
+        """
+        statistics = []
+        for row in self._query_operation_durations(kwargs, OperationDuration):
+            stats = {
+                "opid": row.opid,
+                "version": row.version,
+                "count": row.count,
+                "mean": row.mean,
+                "stdev": math.sqrt(row.variance),
+                "ewma": row.ewma,
+                "p50": row.p50,
+                "p95": row.p95,
+                "updated": utc_to_local(row.updated).timestamp(),
+            }
+            statistics.append(stats)
+        return statistics
+
+    def _query_operation_durations(self, kwargs, *columns):
+        """
+        Read the operation_durations rows of a station - one read of its primary key
+
+        :param dict kwargs: "stationuuid", and "version" to read one sequence version only
+        :param columns: what to read of the rows
+        :return: the rows
+        :rtype: list
+        """
+        with self.session() as s:
+            query = s.query(*columns).filter(
+                OperationDuration.station == kwargs.get("stationuuid")
+            )
+            if kwargs.get("version") is not None:
+                query = query.filter(OperationDuration.version == _version_key(kwargs["version"]))
+            return query.order_by(OperationDuration.opid).all()
+        return []
+
     # ------------------------------------
 
     def get_sequences(self, **kwargs):
@@ -685,6 +1151,9 @@ class StationStorage(Tool):
             kwargs = {
                 "stationuuid": unique ID for station,
 
+                "sequenceuuid": (optional) the sequence with this UUID
+                "sequenceuuid_prefix": (optional) the sequences whose UUID starts with this
+
                 "starttime": (optional) query all sequences after this date/time - given as local timestamp,
                 "endtime": (optional) query all sequences before this date/time - given as local timestamp,
 
@@ -701,16 +1170,13 @@ class StationStorage(Tool):
         except ValueError:
             stationuuid = None
 
-        sequenceuuid = kwargs.get("sequenceuuid", "none")
-        try:
-            # If sequenceuuid is provided, validate that it is a real uuid
-            if sequenceuuid is not None and len(sequenceuuid) == 8:
-                # Allow for the truncated length
-                uuidstr.str2uuid(sequenceuuid.zfill(32))
-            else:
-                uuidstr.str2uuid(sequenceuuid)
-        except ValueError:
-            sequenceuuid = None
+        sequence_filter = uuid_filter(
+            SequenceStart.uuid, kwargs.get("sequenceuuid"), kwargs.get("sequenceuuid_prefix")
+        )
+        searched = kwargs.get("sequenceuuid") or kwargs.get("sequenceuuid_prefix")
+        if sequence_filter is None and searched:
+            # Searched for something that is not (the start of) a UUID
+            return []
 
         # Set a default start time to 1 week ago if one not provided
         if kwargs.get("starttime", None) is None:
@@ -731,43 +1197,23 @@ class StationStorage(Tool):
         if number is not None:
             number = int(number)
 
-        if sequenceuuid is not None:
-            with self.session() as s:
-                query = (
-                    s.query(
-                        SequenceStart.uuid,
-                        SequenceStart.created,
-                        SequenceEnd.duration,
-                        SequenceEnd.passing,
-                        SequenceEnd.info,
-                    )
-                    .join(SequenceEnd, SequenceEnd.uuid == SequenceStart.uuid)
-                    .filter(SequenceStart.station == stationuuid)
-                    .filter(SequenceStart.created >= starttime)
-                    .filter(SequenceEnd.created <= endtime)
-                    .filter(SequenceStart.uuid.ilike("{0}%".format(sequenceuuid)))
-                    .order_by(desc(SequenceStart.created))
-                    .limit(number)
-                )
-                data = query.all()
-        else:
-            with self.session() as s:
-                query = (
-                    s.query(
-                        SequenceStart.uuid,
-                        SequenceStart.created,
-                        SequenceEnd.duration,
-                        SequenceEnd.passing,
-                        SequenceEnd.info,
-                    )
-                    .join(SequenceEnd, SequenceEnd.uuid == SequenceStart.uuid)
-                    .filter(SequenceStart.station == stationuuid)
-                    .filter(SequenceStart.created >= starttime)
-                    .filter(SequenceEnd.created <= endtime)
-                    .order_by(desc(SequenceStart.created))
-                    .limit(number)
+        with self.session() as s:
+            query = (
+                s.query(
+                    SequenceStart.uuid,
+                    SequenceStart.created,
+                    SequenceEnd.duration,
+                    SequenceEnd.passing,
+                    SequenceEnd.info,
                 )
-                data = query.all()
+                .join(SequenceEnd, SequenceEnd.uuid == SequenceStart.uuid)
+                .filter(SequenceStart.station == stationuuid)
+                .filter(SequenceStart.created >= starttime)
+                .filter(SequenceEnd.created <= endtime)
+            )
+            if sequence_filter is not None:
+                query = query.filter(sequence_filter)
+            data = query.order_by(desc(SequenceStart.created)).limit(number).all()
 
         # Convert results to dictionaries and convert datetimes to timestamps
         history = []
@@ -787,21 +1233,17 @@ class StationStorage(Tool):
             kwargs = {
                 "stationuuid": unique ID for station,
                 "sequenceuuid": unique ID for sequence,
+                "sequenceuuid_prefix": (instead of sequenceuuid) start of the unique ID
             }
 
         :param dict kwargs: arguments necessary for query
         :return list: list of tuples - [(operation_id, avg_seconds), ...]
         """
-        sequenceuuid = kwargs.get("sequenceuuid", "none")
-        try:
-            # If sequenceuuid is provided, validate that it is a real uuid
-            if sequenceuuid is not None and len(sequenceuuid) == 8:
-                # Allow for the truncated length
-                uuidstr.str2uuid(sequenceuuid.zfill(32))
-            else:
-                uuidstr.str2uuid(sequenceuuid)
-        except ValueError:
-            sequenceuuid = None
+        sequence_filter = uuid_filter(
+            OperationStart.sequence, kwargs.get("sequenceuuid"), kwargs.get("sequenceuuid_prefix")
+        )
+        if sequence_filter is None:
+            return []
 
         with self.session() as s:
             query = (
@@ -817,7 +1259,7 @@ class StationStorage(Tool):
                 .join(OperationEnd, OperationEnd.uuid == OperationStart.uuid)
                 .join(SequenceStart, OperationStart.sequence == SequenceStart.uuid)
                 .filter(SequenceStart.station == kwargs.get("stationuuid"))
-                .filter(OperationStart.sequence.ilike("{0}%".format(sequenceuuid)))
+                .filter(sequence_filter)
             )
             return query.all()
 
@@ -830,21 +1272,17 @@ class StationStorage(Tool):
             kwargs = {
                 "stationuuid": unique ID for station,
                 "sequenceuuid": unique ID for sequence,
+                "sequenceuuid_prefix": (instead of sequenceuuid) start of the unique ID
             }
 
         :param dict kwargs: arguments necessary for query
         :return list: list of tuples - [(operation_id, avg_seconds), ...]
         """
-        sequenceuuid = kwargs.get("sequenceuuid", "none")
-        try:
-            # If sequenceuuid is provided, validate that it is a real uuid
-            if sequenceuuid is not None and len(sequenceuuid) == 8:
-                # Allow for the truncated length
-                uuidstr.str2uuid(sequenceuuid.zfill(32))
-            else:
-                uuidstr.str2uuid(sequenceuuid)
-        except ValueError:
-            sequenceuuid = None
+        sequence_filter = uuid_filter(
+            OperationStart.sequence, kwargs.get("sequenceuuid"), kwargs.get("sequenceuuid_prefix")
+        )
+        if sequence_filter is None:
+            return {}
 
         with self.session() as s:
             query = (
@@ -866,7 +1304,7 @@ class StationStorage(Tool):
                 )
                 .outerjoin(Result, Result.operation == OperationStart.uuid)
                 .filter(SequenceStart.station == kwargs.get("stationuuid"))
-                .filter(OperationStart.sequence.ilike("{0}%".format(sequenceuuid)))
+                .filter(sequence_filter)
             )
             op_results = query.all()
 
@@ -886,6 +1324,66 @@ class StationStorage(Tool):
     def get_sequence_data(self, **kwargs):
         pass
 
+    def get_operation_timing(self, **kwargs):
+        """
+        Query the start and end time of every operation in the most recent completed sequences
+        run on this station - used for post-run critical path analysis
+
+        Event emitted in sequencer/handlers.py
+
+            kwargs = {
+                "stationuuid": unique ID for station,
+                "version": (optional) only the sequences of this version of the operations
+                "number": (optional) number of most recent sequences to query - default 10
+            }
+
+        :param dict kwargs: arguments necessary for query
+        :return dict: sequence uuid to list of operation timing dicts -
+            {sequence_uuid: [{opid, start, end, duration_ms, waittime_ms, exitcode}, ...], ...}
+        """
+        number = int(kwargs.get("number") or 10)
+
+        data = []
+        with self.session() as s:
+            sequences = (
+                s.query(SequenceStart.uuid)
+                .join(SequenceEnd, SequenceEnd.uuid == SequenceStart.uuid)
+                .filter(SequenceStart.station == kwargs.get("stationuuid"))
+            )
+            if kwargs.get("version") is not None:
+                sequences = sequences.filter(SequenceStart.version == kwargs["version"])
+            sequences = (
+                sequences.order_by(desc(SequenceStart.created)).limit(number).subquery()
+            )
+            query = (
+                s.query(
+                    OperationStart.sequence,
+                    OperationStart.opid,
+                    OperationStart.created.label("start"),
+                    OperationEnd.created.label("end"),
+                    OperationEnd.duration,
+                    OperationEnd.waittime,
+                    OperationEnd.exitcode,
+                )
+                .join(OperationEnd, OperationEnd.uuid == OperationStart.uuid)
+                .join(sequences, OperationStart.sequence == sequences.c.uuid)
+            )
+            data = query.all()
+
+        timing = {}
+        for op in data:
+            timing.setdefault(op.sequence, []).append(
+                {
+                    "opid": op.opid,
+                    "start": utc_to_local(op.start).timestamp(),
+                    "end": utc_to_local(op.end).timestamp(),
+                    "duration_ms": op.duration,
+                    "waittime_ms": op.waittime,
+                    "exitcode": op.exitcode,
+                }
+            )
+        return timing
+
     # --------------------------------------------------------------------------------------------
 
     def on_register_new_station(self, data, evt=None):
@@ -1011,17 +1509,18 @@ class StationStorage(Tool):
         :param str evt: event the data came from
         :return: None
         """
-        with self.session() as s:
-            for log_data in data:
-                msg = {
-                    "stream": log_data.get("stream"),
-                    "message": log_data.get("message"),
-                    "created": log_data.get("created"),
-                }
-                if log_data.get("stream") == "debug" and self._log_level:
-                    if log_data.get("debug_level") > self._log_level:
-                        continue
-                s.add(Logging(**msg))
+        rows = []
+        for log_data in data:
+            msg = {
+                "stream": log_data.get("stream"),
+                "message": log_data.get("message"),
+                "created": log_data.get("created"),
+            }
+            if log_data.get("stream") == "debug" and self._log_level:
+                if log_data.get("debug_level") > self._log_level:
+                    continue
+            rows.append(msg)
+        self._insert(Logging, rows)
 
     def get_log_data(self, start_time, end_time, stream=None, **_kwargs):
         """
@@ -11,6 +11,8 @@ import simplejson
 from sqlalchemy import (
     Column,
     DateTime,
+    Float,
+    Index,
     Integer,
     LargeBinary,
     Numeric,
@@ -76,6 +78,8 @@ class Station(Base):
 
 class SequenceStart(Base):
     __tablename__ = "sequence_starts"
+    # History of a station, newest first
+    __table_args__ = (Index("ix_sequence_starts_station_created", "station", "created"),)
     uuid = Column(String(32), primary_key=True, unique=True, nullable=False)
     station = Column(String(32), nullable=False)
     info = Column(JSONEncoded, default=None)
@@ -97,7 +101,7 @@ class OperationStart(Base):
     __tablename__ = "operation_starts"
     uuid = Column(String(32), primary_key=True, unique=True, nullable=False)
     opid = Column(String(255), default=None)
-    sequence = Column(String(32), nullable=False)
+    sequence = Column(String(32), nullable=False, index=True)
     name = Column(String(255), nullable=False)
     description = Column(String(255), default=None)
     priority = Column(Integer, nullable=False)
@@ -116,6 +120,33 @@ class OperationEnd(Base):
     created = Column(DateTime, default=get_utc_now, index=True)
 
 
+class OperationDuration(Base):
+    __tablename__ = "operation_durations"
+    # Running statistics of the successful runs of an operation, in seconds - one row per
+    # station, operation and sequence version, updated as each operation ends
+    station = Column(String(32), primary_key=True, nullable=False)
+    opid = Column(String(255), primary_key=True, nullable=False)
+    version = Column(String(255), primary_key=True, nullable=False, default="")
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    variance = Column(Float, nullable=False, default=0.0)
+    ewma = Column(Float)
+    p50 = Column(Float)
+    p95 = Column(Float)
+    # P-square quantile markers - see duration_statistics
+    markers = Column(JSONEncoded, default=None)
+    updated = Column(DateTime, default=get_utc_now)
+
+
+class StorageMetadata(Base):
+    __tablename__ = "storage_metadata"
+    # Facts about the database itself, by name - such as that the operation_durations
+    # statistics were computed from the history
+    name = Column(String(64), primary_key=True, nullable=False)
+    value = Column(String(255))
+    updated = Column(DateTime, default=get_utc_now)
+
+
 class ErrorCode(Base):
     __tablename__ = "error_codes"
     uuid = Column(String(32), primary_key=True, unique=True, nullable=False)
@@ -131,7 +162,7 @@ class ErrorCode(Base):
 class Result(Base):
     __tablename__ = "results"
     uuid = Column(String(32), primary_key=True, unique=True, nullable=False)
-    operation = Column(String(32), nullable=False)
+    operation = Column(String(32), nullable=False, index=True)
     identifier = Column(String(64), default=None, index=True)
     name = Column(String(255), nullable=False)
     description = Column(String(255), default=None)
@@ -148,7 +179,7 @@ class Result(Base):
 class DataStorage(Base):
     __tablename__ = "data"
     uuid = Column(String(32), primary_key=True, unique=True, nullable=False)
-    operation = Column(String(32), nullable=False)
+    operation = Column(String(32), nullable=False, index=True)
     identifier = Column(String(64), default=None, index=True)
     name = Column(String(255), nullable=False)
     description = Column(String(255), default=None)
@@ -162,6 +193,8 @@ class DataStorage(Base):
 
 class Logging(Base):
     __tablename__ = "logging"
+    # Log of one stream over a time range
+    __table_args__ = (Index("ix_logging_stream_created", "stream", "created"),)
     id = Column(
         Integer, primary_key=True, unique=True, nullable=False, autoincrement=True
     )
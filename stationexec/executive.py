@@ -4,6 +4,7 @@
 
 """Executive"""
 import os
+import socket
 import time
 import threading
 from functools import partial
@@ -17,14 +18,20 @@ from stationexec.sequencer.handlers import (
     SequenceStartHandler,
     SequenceStatusHandler,
     SequenceStopHandler,
+    SequenceAnalysisHandler,
     SequenceHistoryHandler,
     SequenceRepeaterHandler,
+    SequenceSimulationHandler,
 )
 from stationexec.sequencer import sequence_factory
+from stationexec.sequencer.simulator import SequenceSimulator, duration_samples_from_timing
 from stationexec.station.data_storage import DataStorage
+from stationexec.station.event_bridge import EventBridge
 from stationexec.station.helpers import update_station_info
 from stationexec.station.events import (
+    configure_event_coalescing,
     emit_event,
+    set_slow_subscriber_threshold,
     emit_event_non_blocking,
     register_for_event,
     register_for_events,
@@ -39,6 +46,9 @@ from stationexec.station.handlers import (
     StationCommand,
     StationHelpHandler,
     PlotterDataHandler,
+    EventStatisticsHandler,
+    StorageDeadLetterHandler,
+    StorageStatusHandler,
 )
 from stationexec.toolbox.toolbox import ToolBox, Tool
 from stationexec.utilities import config, pc_info
@@ -113,11 +123,14 @@ class Executive(object):
 
         self.in_estop = False
         self.station_simple_status = "initializing"
+        self.storage_lagging = False
 
         Logger().init(debug=self.get_cfg("debug"), api_logging=self.get_cfg("api_logging"), prefix=self.station_info.variant)
+        configure_event_coalescing(self.get_cfg("event_coalescing", None))
+        set_slow_subscriber_threshold(self.get_cfg("slow_subscriber_ms", 50) / 1000.0)
 
         log.debug(6, "Creating data storage manager")
-        self._storage_manager = DataStorage()
+        self._storage_manager = DataStorage(**self.get_cfg("data_storage", {}))
 
         log.debug(5, "Creating toolbox")
         self._toolbox = ToolBox(
@@ -148,6 +161,7 @@ class Executive(object):
 
         log.debug(6, "Creating socket manager")
         self._socket_manager = SocketManager()
+        self._event_bridge = None
 
         self._dut_serial_number = DEFAULT_SERIAL_NUMBER
 
@@ -162,6 +176,7 @@ class Executive(object):
         # Load the web socket manager
         log.debug(5, "Initializing socket manager")
         self._socket_manager.initialize()
+        self._start_event_bridge()
 
         # Load tool manifest and initialize tools
         log.debug(5, "Initializing toolbox")
@@ -204,6 +219,7 @@ class Executive(object):
                 InfoEvents.SEQUENCE_FINISHED,
                 InfoEvents.EMERGENCY_STOP,
                 InfoEvents.EMERGENCY_STOP_CLEARED,
+                InfoEvents.STORAGE_LAG,
             ],
             self.station_health,
         )
@@ -408,11 +424,28 @@ class Executive(object):
                 {'station_status': self.station_status},
             ),
             (r"/station/help", StationHelpHandler),
+            (r"/station/events", EventStatisticsHandler),
+            (r"/station/storage", StorageStatusHandler, {"storage": self._storage_manager}),
+            (
+                r"/station/storage/deadletter",
+                StorageDeadLetterHandler,
+                {"storage": self._storage_manager},
+            ),
+            (
+                r"/sequence/analysis",
+                SequenceAnalysisHandler,
+                {"station_uuid": self.station_uuid, "sequencer": self._sequencer},
+            ),
             (
                 r"/sequence/history",
                 SequenceHistoryHandler,
                 {"station_uuid": self.station_uuid, "sequencer": self._sequencer},
             ),
+            (
+                r"/sequence/simulate",
+                SequenceSimulationHandler,
+                {"simulate_sequence": self.simulate_sequence},
+            ),
             (
                 r"/sequence/start",
                 SequenceStartHandler,
@@ -446,6 +479,34 @@ class Executive(object):
             self._toolbox.shutdown()
             self._storage_manager.shutdown()
             self._socket_manager.shutdown()
+            if self._event_bridge is not None:
+                self._event_bridge.stop()
+
+    def _start_event_bridge(self):
+        """ Publish events to local processes, if an 'event_bridge' is configured """
+        bridge_config = self.get_cfg("event_bridge", None)
+        if not bridge_config:
+            return
+        if not hasattr(socket, "AF_UNIX"):
+            log.warning("Event bridge needs Unix domain sockets - not supported on this system")
+            return
+        events = None
+        if bridge_config.get("events"):
+            event_groups = {"InfoEvents": InfoEvents, "ActionEvents": ActionEvents}
+            events = []
+            for name in bridge_config["events"]:
+                group, _, event = name.partition(".")
+                events.append(event_groups[group][event])
+        try:
+            self._event_bridge = EventBridge(
+                bridge_config["path"],
+                events,
+                bridge_config.get("max_pending_bytes", 1024 * 1024),
+            )
+            self._event_bridge.start()
+        except Exception as e:
+            log.exception("Unable to start event bridge", e)
+            self._event_bridge = None
 
     def get_web_info(self):
         """
@@ -690,6 +751,44 @@ class Executive(object):
             n_up=0,
         )
 
+    def simulate_sequence(self, runs=100, threads=None, history=10, seed=None):
+        """
+        Predict the makespan of the station sequence by simulating it on a virtual clock with
+        operation durations drawn from the station history
+
+        Called from: SequenceSimulationHandler - /sequence/simulate
+
+        :param int runs: number of simulated runs
+        :param int threads: thread limit to simulate - the configured limit if None
+        :param int history: number of recent sequences to draw operation durations from
+        :param seed: seed of the duration sampling, for repeatable predictions
+        :return: makespan distribution in seconds
+        :rtype: dict
+        """
+        # Simulated operations stay off of the event bus, so this can run alongside a sequence
+        avg_runtimes = emit_event(
+            RetrievalEvents.GET_OPERATION_AVERAGE_DURATION,
+            {"stationuuid": self.station_info.id},
+        )
+        timing = emit_event(
+            RetrievalEvents.GET_OPERATION_TIMING,
+            {"stationuuid": self.station_info.id, "number": history},
+        )
+
+        simulator = SequenceSimulator.from_file(
+            config.get_all_paths()["operation_config"],
+            config.get_all_paths()["operation_defs"],
+            self.config,
+            self.get_cfg,
+            n_up=0,
+            avg_operation_runtimes=avg_runtimes,
+            duration_samples=duration_samples_from_timing(timing),
+            runtimedata={"dut_serial_number": self._dut_serial_number},
+            threads=threads,
+            seed=seed,
+        )
+        return simulator.run(runs)
+
     def terminate_sequence(self, **kwargs):
         """
         Terminate the active sequence
@@ -777,6 +876,11 @@ class Executive(object):
             status = "ready"
             description = "Ready to run"
 
+        warnings = self._storage_manager.get_lag_warnings()
+        if warnings and status != "down":
+            # Storage is falling behind - runs can continue, but results may be lost
+            description = "{0}. Warning: {1}".format(description, "; ".join(warnings))
+
         if (
             kwargs.get("event") == "InfoEvents.UI_DATA_REQUEST"
             and kwargs.get("requesting") == "station_health"
@@ -789,13 +893,15 @@ class Executive(object):
                 },
             )
 
-        if status != self.station_simple_status:
+        if status != self.station_simple_status or bool(warnings) != self.storage_lagging:
             self.station_simple_status = status
+            self.storage_lagging = bool(warnings)
             emit_event_non_blocking(
                 InfoEvents.STATION_HEALTH,
                 {
                     "status": status,
                     "description": description,
+                    "warnings": warnings,
                 },
             )
 
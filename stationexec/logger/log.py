@@ -21,7 +21,8 @@ import sys
 import traceback
 from enum import Enum, unique
 
-from stationexec.station.events import emit_event, InfoEvents, StorageEvents
+from stationexec.station.events import emit_event, StorageEvents
+from stationexec.station.payloads import LogPayload
 
 
 @unique
@@ -190,18 +191,11 @@ def _publish_log_message(kind, message, debug_level=None, data=None):
         for line in traceback.format_exception(atype, value, tb):
             stack_trace = f"{stack_trace}\n{line}"
 
-    log_data = {
-        "source": "log",
-        "stream": kind.value,
-        "message": message,
-        "debug_level": debug_level,
-        "data": None,
-        "stack_trace": stack_trace,
-        "pid": os.getpid(),
-        "caller": caller,
-    }
+    log_data = LogPayload(
+        kind.value, message, debug_level, None, stack_trace, os.getpid(), caller
+    )
     emit_event(StorageEvents.ON_LOG_DATA, log_data)
-    emit_event(InfoEvents.LOG, log_data)
+    emit_event(log_data.event, log_data)
 
 
 def _get_class_from_frame(fr):
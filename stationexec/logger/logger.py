@@ -8,7 +8,7 @@ import warnings
 
 import colorama
 from stationexec.logger.log import LogKind, _publish_log_message
-from stationexec.station.events import register_for_event, InfoEvents
+from stationexec.station.events import register_for_event, InfoEvents, AsyncSubscriber, Overflow
 from stationexec.utilities.colors import Colors
 from stationexec.utilities.config import get_all_paths
 from stationexec.utilities.singleton import Singleton
@@ -42,9 +42,26 @@ class Logger(Singleton):
 
         warnings.showwarning = self._override_warnings
 
-        register_for_event("logger", InfoEvents.LOG, self.log_message)
-        register_for_event("logger", InfoEvents.SEQUENCE_STARTED, self.on_sequence_start)
-        register_for_event("logger", InfoEvents.SEQUENCE_FINISHED, self.on_sequence_end)
+        # Console and file output happen on a worker thread, so code that logs does not wait on
+        # them. One queue for all three events keeps prefix changes in order with the messages,
+        # and every message is written as it is emitted, even when the UI receives them batched.
+        self._handlers = {
+            InfoEvents.LOG: self.log_message,
+            InfoEvents.SEQUENCE_STARTED: self.on_sequence_start,
+            InfoEvents.SEQUENCE_FINISHED: self.on_sequence_end,
+        }
+        subscriber = AsyncSubscriber(
+            self._handle_event,
+            maxsize=10000,
+            overflow=Overflow.BLOCK,
+            name="logger",
+            skip_coalescing=True,
+        )
+        for event in self._handlers:
+            register_for_event("logger", event, subscriber)
+
+    def _handle_event(self, _event, **kwargs):
+        self._handlers[_event](_event=_event, **kwargs)
 
     def on_sequence_start(self, prefix, **kwargs):
         self.prefix = prefix
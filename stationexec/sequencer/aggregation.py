@@ -0,0 +1,195 @@
+# Copyright 2004-present Facebook. All Rights Reserved.
+
+# @lint-ignore-every PYTHON3COMPATIMPORTS1
+
+"""
+Loop iteration aggregation.
+
+A loop configured with ``"aggregate": true`` does not store every iteration of its member
+operations. The first iteration of each operation is stored as usual, and optionally every
+``sample_every``-th iteration after it; all other iterations only update running statistics of
+their results. When the loop finishes (or the sequence stops) the statistics are stored as a
+``_loop_summary`` data item of the first stored iteration of each operation, so the storage and UI
+cost of a loop does not grow with the number of iterations.
+"""
+
+import math
+
+import simplejson
+from stationexec.utilities.uuidstr import get_uuid
+
+# Name of the data item holding the statistics of an aggregated loop operation
+LOOP_SUMMARY_NAME = "_loop_summary"
+
+
+class ResultStatistics(object):
+    """ Running statistics of one result over the iterations of a loop """
+
+    def __init__(self, name, operation):
+        self.name = name
+        self.operation = operation
+        self.count = 0
+        self.numeric_count = 0
+        self.min = None
+        self.max = None
+        self.mean = None
+        # Sum of squared differences from the mean (Welford's method)
+        self._m2 = 0.0
+        self.fail_count = 0
+        self.first_failure = None
+        self.last_failure = None
+
+    def add(self, iteration, value, passing, is_result):
+        """
+        Add the value of one iteration
+
+        :param int iteration: loop iteration that produced the value
+        :param value: the stored value
+        :param bool passing: whether the value met its condition
+        :param bool is_result: True for results with a pass condition, False for data items
+        """
+        self.count += 1
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            self.numeric_count += 1
+            if self.numeric_count == 1:
+                self.min = self.max = self.mean = value
+            else:
+                self.min = min(self.min, value)
+                self.max = max(self.max, value)
+                delta = value - self.mean
+                self.mean += delta / self.numeric_count
+                self._m2 += delta * (value - self.mean)
+
+        if is_result and not passing:
+            self.fail_count += 1
+            failure = {"iteration": iteration, "value": value}
+            if self.first_failure is None:
+                self.first_failure = failure
+            self.last_failure = failure
+
+    def get_stddev(self):
+        """ Sample standard deviation of the numeric values; None with fewer than two values """
+        if self.numeric_count < 2:
+            return None
+        return math.sqrt(self._m2 / (self.numeric_count - 1))
+
+    def get_status(self):
+        return {
+            "name": self.name,
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "stddev": self.get_stddev(),
+            "fail_count": self.fail_count,
+            "first_failure": self.first_failure,
+            "last_failure": self.last_failure,
+        }
+
+
+class LoopAggregate(object):
+    """ Statistics of the member operations of one aggregating loop """
+
+    def __init__(self, sample_every=0):
+        """
+        :param int sample_every: also store every n-th iteration; 0 to only store the first
+        """
+        self.sample_every = max(int(sample_every or 0), 0)
+        self.summary_stored = False
+        # Iterations started, whether the running iteration is stored, and the uuid of the first
+        # stored iteration - for each operation id
+        self._iterations = {}
+        self._recorded = {}
+        self._anchors = {}
+        # (operation id, result name) to ResultStatistics, in order first seen
+        self._statistics = {}
+
+    def start_iteration(self, operation_id, operation_uuid):
+        """
+        Count a new iteration of an operation
+
+        :param str operation_id: the operation
+        :param str operation_uuid: uuid of this run of the operation
+        :return: True if this iteration is stored individually
+        :rtype: bool
+        """
+        iteration = self._iterations.get(operation_id, 0) + 1
+        self._iterations[operation_id] = iteration
+        if iteration == 1:
+            self._anchors[operation_id] = operation_uuid
+        recorded = iteration == 1 or (
+            self.sample_every > 0 and iteration % self.sample_every == 0
+        )
+        self._recorded[operation_id] = recorded
+        return recorded
+
+    def is_recorded(self, operation_id):
+        """ True if the running iteration of the operation is stored individually """
+        return self._recorded.get(operation_id, True)
+
+    def add_results(self, operation_id, results):
+        """
+        Add the results of the running iteration of an operation to the statistics
+
+        :param str operation_id: the operation
+        :param list results: result status dicts, as from `.Result.get_status`
+        """
+        iteration = self._iterations.get(operation_id, 0)
+        for result in results:
+            if not result["is_processed"]:
+                continue
+            key = (operation_id, result["name"])
+            if key not in self._statistics:
+                self._statistics[key] = ResultStatistics(result["name"], operation_id)
+            self._statistics[key].add(
+                iteration, result["value"], result["passing"], result["is_result"]
+            )
+
+    def get_operation_summary(self, operation_id):
+        return {
+            "iterations": self._iterations.get(operation_id, 0),
+            "sample_every": self.sample_every,
+            "results": [
+                stats.get_status()
+                for (opid, _name), stats in self._statistics.items()
+                if opid == operation_id
+            ],
+        }
+
+    def get_status(self):
+        return {
+            operation_id: self.get_operation_summary(operation_id)
+            for operation_id in self._iterations
+        }
+
+    def get_summary_data(self):
+        """
+        Build the data items that store the statistics - one per operation, attached to the
+        first stored iteration of the operation
+
+        :return: list of data status dicts, in the form of `.Result.get_status`
+        :rtype: list
+        """
+        summaries = []
+        for operation_id, anchor in self._anchors.items():
+            value = simplejson.dumps(self.get_operation_summary(operation_id))
+            summaries.append(
+                {
+                    "uuid": get_uuid(),
+                    "operation": anchor,
+                    "name": LOOP_SUMMARY_NAME,
+                    "identifier": None,
+                    "description": "Result statistics over all loop iterations",
+                    "value": value,
+                    "passing": True,
+                    "operator": None,
+                    "operand2": None,
+                    "operand3": None,
+                    "mimetype": "application/json",
+                    "size": len(value),
+                    "is_result": False,
+                    "parent": operation_id,
+                    "is_processed": True,
+                }
+            )
+        return summaries
@@ -0,0 +1,282 @@
+# Copyright 2004-present Facebook. All Rights Reserved.
+
+# @lint-ignore-every PYTHON3COMPATIMPORTS1
+
+"""
+Post-run timing analysis of finished sequences.
+
+The recorded start and end time of every operation in a run is replayed against the dependency
+graph of the sequence. From that, the analysis reports:
+
+* the realized critical path - the chain of operations that actually determined when the
+  sequence finished
+* the slack of every operation - how much longer it could have taken without delaying the end
+  of the sequence
+* the idle time of every tool used by the sequence
+* the theoretical makespan - how long the sequence would take with unlimited threads and no
+  tool contention, given the durations that were observed
+
+Running the analysis over several past runs (`.analyze_history`) ranks the operations whose
+speedup would actually reduce the cycle time of the station.
+
+Timing records are dictionaries with at least the keys below - the format returned by the
+``GET_OPERATION_TIMING`` retrieval event:
+
+    record = {
+        "opid": identifying name of the operation
+        "start": timestamp (seconds) the operation started
+        "end": timestamp (seconds) the operation ended
+        "duration_ms": (optional) execution time excluding tool wait time
+    }
+"""
+
+from collections import defaultdict
+
+
+def merge_operation_records(records):
+    """
+    Collapse timing records into a single entry per operation id. Operations inside of loops
+    are recorded once per iteration; their first start, last end and summed duration are kept.
+
+    :param list records: timing records of a single sequence run
+    :return: dict of opid to (start, end, duration) in seconds
+    :rtype: dict
+    """
+    timing = {}
+    for record in records:
+        opid = record["opid"]
+        start = float(record["start"])
+        end = max(float(record["end"]), start)
+        if record.get("duration_ms") is None:
+            duration = end - start
+        else:
+            duration = max(record["duration_ms"], 0) / 1000.0
+
+        if opid in timing:
+            first, last, total = timing[opid]
+            timing[opid] = (min(first, start), max(last, end), total + duration)
+        else:
+            timing[opid] = (start, end, duration)
+    return timing
+
+
+def topological_order(dependencies):
+    """
+    Order operations so that every operation comes after all of its dependencies. Dependencies
+    on operations that are not in the graph are ignored.
+
+    :param dict dependencies: dict of opid to list of opids it depends on
+    :return: list of opids
+    :raises ValueError: if the graph contains a cycle
+    """
+    remaining = {
+        op: set(dep for dep in deps if dep in dependencies)
+        for op, deps in dependencies.items()
+    }
+    order = []
+    ready = sorted(op for op, deps in remaining.items() if not deps)
+    while ready:
+        op = ready.pop(0)
+        order.append(op)
+        for other in sorted(remaining):
+            if op in remaining[other]:
+                remaining[other].remove(op)
+                if not remaining[other] and other not in order and other not in ready:
+                    ready.append(other)
+        del remaining[op]
+    if remaining:
+        raise ValueError(
+            "Cycle found in operation graph: {0}".format(", ".join(sorted(remaining)))
+        )
+    return order
+
+
+def analyze_run(records, dependencies, tools=None):
+    """
+    Analyze the timing of one finished sequence run.
+
+    :param list records: timing records of the run (see module documentation)
+    :param dict dependencies: dict of opid to list of opids it depends on
+    :param dict tools: (optional) dict of opid to list of tool ids the operation checks out
+    :return: analysis of the run; all times in seconds relative to the start of the run
+    :rtype: dict
+    """
+    timing = merge_operation_records(records)
+    if not timing:
+        return {
+            "makespan_s": 0.0,
+            "theoretical_makespan_s": 0.0,
+            "critical_path": [],
+            "operations": {},
+            "tools": {},
+        }
+
+    # Only operations that were recorded take part - the graph may have changed since the run
+    graph = {
+        op: [dep for dep in dependencies.get(op, []) if dep in timing] for op in timing
+    }
+    successors = defaultdict(list)
+    for op, deps in graph.items():
+        for dep in deps:
+            successors[dep].append(op)
+
+    origin = min(start for start, _end, _duration in timing.values())
+    finish = max(end for _start, end, _duration in timing.values())
+    makespan = finish - origin
+    order = topological_order(graph)
+
+    # Forward and backward pass with observed durations and unlimited threads
+    earliest_start = {}
+    earliest_finish = {}
+    for op in order:
+        earliest_start[op] = max([earliest_finish[dep] for dep in graph[op]] or [0.0])
+        earliest_finish[op] = earliest_start[op] + timing[op][2]
+    theoretical = max(earliest_finish.values())
+
+    latest_start = {}
+    for op in reversed(order):
+        latest_finish = min(
+            [latest_start[succ] for succ in successors[op]] or [theoretical]
+        )
+        latest_start[op] = latest_finish - timing[op][2]
+
+    # Walk back from the operation that finished last, following the dependency that released
+    # each operation (the one that finished last) - this is the path that set the cycle time
+    critical_path = []
+    op = max(timing, key=lambda x: timing[x][1])
+    while op is not None:
+        critical_path.append(op)
+        deps = [dep for dep in graph[op] if dep not in critical_path]
+        op = max(deps, key=lambda x: timing[x][1]) if deps else None
+    critical_path.reverse()
+
+    operations = {}
+    for op, (start, end, duration) in timing.items():
+        released = max([timing[dep][1] for dep in graph[op]] or [origin])
+        next_start = min([timing[succ][0] for succ in successors[op]] or [finish])
+        operations[op] = {
+            "start_s": start - origin,
+            "end_s": end - origin,
+            "duration_s": duration,
+            # Time spent ready to run but not running - threads, tools or requeues
+            "delay_s": max(start - released, 0.0),
+            # Slack in the graph with unlimited threads and observed durations
+            "slack_s": max(latest_start[op] - earliest_start[op], 0.0),
+            # Slack as it happened - time until the first successor actually started
+            "realized_slack_s": max(next_start - end, 0.0),
+            "critical": op in critical_path,
+        }
+
+    return {
+        "makespan_s": makespan,
+        "theoretical_makespan_s": theoretical,
+        "critical_path": critical_path,
+        "operations": operations,
+        "tools": _tool_usage(timing, tools or {}, makespan),
+    }
+
+
+def _tool_usage(timing, tools, makespan):
+    """ Busy and idle time of each tool over the span of the run """
+    intervals = defaultdict(list)
+    for op, tool_ids in tools.items():
+        if op not in timing:
+            continue
+        for tool_id in tool_ids:
+            intervals[tool_id].append(timing[op][:2])
+
+    usage = {}
+    for tool_id, spans in intervals.items():
+        busy = 0.0
+        current_start, current_end = None, None
+        for start, end in sorted(spans):
+            if current_end is None or start > current_end:
+                if current_end is not None:
+                    busy += current_end - current_start
+                current_start, current_end = start, end
+            else:
+                current_end = max(current_end, end)
+        busy += current_end - current_start
+        usage[tool_id] = {
+            "busy_s": busy,
+            "idle_s": max(makespan - busy, 0.0),
+            "utilization": busy / makespan if makespan > 0 else 0.0,
+        }
+    return usage
+
+
+def analyze_history(runs, dependencies, tools=None):
+    """
+    Analyze the timing of several finished runs of a sequence and rank the operations whose
+    speedup would reduce cycle time.
+
+    An operation is only worth speeding up if it sits on the realized critical path; its
+    'criticality' is the fraction of runs where it did. Candidates are ordered by criticality
+    times mean duration - the cycle time at stake.
+
+    :param dict runs: dict of sequence uuid to list of timing records
+    :param dict dependencies: dict of opid to list of opids it depends on
+    :param dict tools: (optional) dict of opid to list of tool ids the operation checks out
+    :return: per-run analyses and aggregated statistics
+    :rtype: dict
+    """
+    analyses = {
+        uuid: analyze_run(records, dependencies, tools)
+        for uuid, records in runs.items()
+        if records
+    }
+    count = len(analyses)
+    if count == 0:
+        return {"runs": 0, "sequences": {}, "operations": {}, "tools": {}, "candidates": []}
+
+    operations = defaultdict(lambda: defaultdict(float))
+    tool_stats = defaultdict(lambda: defaultdict(float))
+    for analysis in analyses.values():
+        for op, stats in analysis["operations"].items():
+            totals = operations[op]
+            totals["runs"] += 1
+            totals["critical"] += 1 if stats["critical"] else 0
+            totals["duration_s"] += stats["duration_s"]
+            totals["delay_s"] += stats["delay_s"]
+            totals["slack_s"] += stats["slack_s"]
+            totals["realized_slack_s"] += stats["realized_slack_s"]
+        for tool_id, stats in analysis["tools"].items():
+            tool_stats[tool_id]["runs"] += 1
+            tool_stats[tool_id]["idle_s"] += stats["idle_s"]
+            tool_stats[tool_id]["utilization"] += stats["utilization"]
+
+    summary = {}
+    for op, totals in operations.items():
+        runs_seen = totals["runs"]
+        summary[op] = {
+            "runs": int(runs_seen),
+            "criticality": totals["critical"] / count,
+            "mean_duration_s": totals["duration_s"] / runs_seen,
+            "mean_delay_s": totals["delay_s"] / runs_seen,
+            "mean_slack_s": totals["slack_s"] / runs_seen,
+            "mean_realized_slack_s": totals["realized_slack_s"] / runs_seen,
+        }
+
+    candidates = sorted(
+        [op for op, stats in summary.items() if stats["criticality"] > 0],
+        key=lambda x: summary[x]["criticality"] * summary[x]["mean_duration_s"],
+        reverse=True,
+    )
+
+    makespans = [a["makespan_s"] for a in analyses.values()]
+    theoretical = [a["theoretical_makespan_s"] for a in analyses.values()]
+    return {
+        "runs": count,
+        "mean_makespan_s": sum(makespans) / count,
+        "mean_theoretical_makespan_s": sum(theoretical) / count,
+        "sequences": analyses,
+        "operations": summary,
+        "tools": {
+            tool_id: {
+                "mean_idle_s": stats["idle_s"] / stats["runs"],
+                "mean_utilization": stats["utilization"] / stats["runs"],
+            }
+            for tool_id, stats in tool_stats.items()
+        },
+        "candidates": candidates,
+    }
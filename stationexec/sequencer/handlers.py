@@ -2,9 +2,13 @@
 
 # @lint-ignore-every PYTHON3COMPATIMPORTS1
 
+from functools import partial
+from http import HTTPStatus
 from typing import Callable
 
 import simplejson
+from tornado.ioloop import IOLoop
+from stationexec.sequencer.analysis import analyze_history
 from stationexec.station.events import (
     emit_event,
     emit_event_non_blocking,
@@ -78,6 +82,7 @@ class SequenceHistoryHandler(ExecutiveHandler):
                 {
                     "stationuuid": self.station_uuid,
                     "sequenceuuid": self.json_args.get("sequenceuuid", None),
+                    "sequenceuuid_prefix": self.json_args.get("sequenceuuid_prefix", None),
                     "number": self.json_args.get("number", 10),
                     "starttime": self.json_args.get("starttime", None),
                     "endtime": self.json_args.get("endtime", None),
@@ -89,6 +94,7 @@ class SequenceHistoryHandler(ExecutiveHandler):
                 {
                     "stationuuid": self.station_uuid,
                     "sequenceuuid": self.json_args.get("sequenceuuid"),
+                    "sequenceuuid_prefix": self.json_args.get("sequenceuuid_prefix", None),
                 },
             )
         elif history_type == "results":
@@ -97,6 +103,7 @@ class SequenceHistoryHandler(ExecutiveHandler):
                 {
                     "stationuuid": self.station_uuid,
                     "sequenceuuid": self.json_args.get("sequenceuuid", None),
+                    "sequenceuuid_prefix": self.json_args.get("sequenceuuid_prefix", None),
                     "operationuuid": self.json_args.get("operationuuid", None),
                     "operationid": self.json_args.get("operationid", None),
                 },
@@ -107,10 +114,19 @@ class SequenceHistoryHandler(ExecutiveHandler):
                 {
                     "stationuuid": self.station_uuid,
                     "sequenceuuid": self.json_args.get("sequenceuuid", None),
+                    "sequenceuuid_prefix": self.json_args.get("sequenceuuid_prefix", None),
                     "operationuuid": self.json_args.get("operationuuid", None),
                     "operationid": self.json_args.get("operationid", None),
                 },
             )
+        elif history_type == "durations":
+            history = emit_event(
+                RetrievalEvents.GET_OPERATION_DURATION_STATISTICS,
+                {
+                    "stationuuid": self.station_uuid,
+                    "version": self.json_args.get("version", None),
+                },
+            )
         else:
             history = emit_event(
                 RetrievalEvents.GET_SEQUENCES,
@@ -120,6 +136,83 @@ class SequenceHistoryHandler(ExecutiveHandler):
         self.write(simplejson.dumps(history))
 
 
+class SequenceAnalysisHandler(ExecutiveHandler):
+    """
+    This endpoint handler is used to request the critical path and slack analysis of the most
+    recently completed sequences.
+    """
+
+    station_uuid = None
+    sequencer = None
+
+    def initialize(self, **kwargs):
+        """ Prepare to handle endpoint operation """
+        self.station_uuid = kwargs["station_uuid"]
+        self.sequencer = kwargs["sequencer"]
+
+    def post(self):
+        self.get()
+
+    def get(self):
+        """ Write JSON encoded string of the timing analysis """
+        self.set_header("Content-Type", "application/json")
+
+        dependencies, tools = self.sequencer.get_sequence_graph()
+        runs = emit_event(
+            RetrievalEvents.GET_OPERATION_TIMING,
+            {
+                "stationuuid": self.station_uuid,
+                "version": self.sequencer.get_sequence_version(),
+                "number": self.json_args.get("number", 10),
+            },
+        )
+        # Runs of an edited sequence that kept its version do not fit the graph
+        runs = {
+            uuid: records
+            for uuid, records in (runs or {}).items()
+            if all(record["opid"] in dependencies for record in records)
+        }
+        analysis = analyze_history(runs, dependencies, tools)
+        self.write(simplejson.dumps(analysis))
+
+
+class SequenceSimulationHandler(ExecutiveHandler):
+    """
+    This endpoint handler is used to predict the makespan of the station sequence by simulating
+    it with operation durations from the station history.
+    """
+
+    simulate_sequence = None  # type: Callable
+
+    def initialize(self, **kwargs):
+        """ Prepare to handle endpoint operation """
+        self.simulate_sequence = kwargs["simulate_sequence"]
+
+    async def post(self):
+        await self.get()
+
+    async def get(self):
+        """ Write JSON encoded string of the predicted makespan distribution """
+        self.set_header("Content-Type", "application/json")
+        try:
+            # Simulation takes a while for many runs - keep it off of the IOLoop
+            prediction = await IOLoop.current().run_in_executor(
+                None,
+                partial(
+                    self.simulate_sequence,
+                    runs=int(self.json_args.get("runs", 100)),
+                    threads=self.json_args.get("threads"),
+                    history=int(self.json_args.get("history", 10)),
+                    seed=self.json_args.get("seed"),
+                ),
+            )
+        except Exception as e:
+            self.set_status(HTTPStatus.CONFLICT)
+            self.write(simplejson.dumps({"reason": str(e)}))
+            return
+        self.write(simplejson.dumps(prediction))
+
+
 class SequenceRepeaterHandler(ExecutiveHandler):
     """
     This endpoint handler is used to update and get information regarding sequence repeater
@@ -3,6 +3,7 @@
 # @lint-ignore-every PYTHON3COMPATIMPORTS1
 
 from stationexec.logger import log
+from stationexec.sequencer.aggregation import LoopAggregate
 from stationexec.sequencer.utilities import (
     evaluate_conditional,
     parse_conditional_reference,
@@ -37,6 +38,14 @@ class Loop(object):
         self.type = None
         # Special variable used in for loop so that the target iteration value will not change
         self._condition_cache = None
+        # Set once the loop condition says the loop is done
+        self.finished = False
+
+        # Aggregation mode - member iterations update result statistics instead of each being
+        # stored, except the first and every 'sample_every'-th
+        self.aggregate = None
+        if loop.get("aggregate", False):
+            self.aggregate = LoopAggregate(loop.get("sample_every", 0))
 
         # for all loops and conditions, treat a None condition as a value - probably a False.
         # a for loop is a pre-check - if the condition is None, never run it
@@ -157,6 +166,7 @@ class Loop(object):
             "members": self.get_operations(),
             "entrynodes": self.entry_nodes,
             "exitnodes": self.exit_nodes,
+            "aggregate": None if self.aggregate is None else self.aggregate.get_status(),
         }
 
     def is_loop_start(self, op_start_list, storage_cache):
@@ -171,6 +181,7 @@ class Loop(object):
         if found_entry_node:
             if not self._evaluate_loop(storage_cache, "start"):
                 # Condition is False - return all member ops to be moved to done
+                self.finished = True
                 return self.get_operations()
         return []
 
@@ -188,6 +199,7 @@ class Loop(object):
             if self._evaluate_loop(storage_cache, "end"):
                 # Condition is True - return all member ops to be moved to waiting
                 return self.get_operations()
+            self.finished = True
         return []
 
     def _evaluate_loop(self, storage_cache, when):
@@ -13,6 +13,7 @@ from stationexec.sequencer.utilities import evaluate_conditional, flatten_2d_lis
     parse_conditional_reference, parse_data_reference, unique_list
 from stationexec.utilities.exceptions import AbortException, MissingResult, ToolUnavailableException, \
     ToolInUseException
+from stationexec.utilities.cancellation import CancellationToken
 from stationexec.utilities.uuidstr import get_uuid
 from stationexec.utilities.error_codes import ErrorCode
 
@@ -20,8 +21,14 @@ from stationexec.station.events import emit_event, register_for_event, clear_eve
 
 class OpData(object):
     def __init__(self, op_info, system_configs, tool_checkout, report_error, runtimedata=None,
-                 n_pos=0, n_up=1, n_up_operations=None):
+                 n_pos=0, n_up=1, n_up_operations=None, clock=None, register_events=True):
+        """
+        :param bool register_events: register the error code callback of the operation on the
+            event bus; False for operations that never run, like those of a simulation
+        """
         self._report_error = report_error
+        # Source of time for the operation - anything with time() like the time module
+        self._clock = clock if clock is not None else time
         self.uuid = get_uuid()
 
         self.is_n_up = op_info.get("n_up", False) and n_up > 1
@@ -166,8 +173,10 @@ class OpData(object):
 
         # error code event callback
         #if not check_registered_event(self.id, InfoEvents.PASS_ERROR_CODE, self._pass_error_code):  # register here to have a callback for each operation
-        clear_event_subscribers(self.id, InfoEvents.PASS_ERROR_CODE)  # register here to have a callback for each operation
-        register_for_event(self.id, InfoEvents.PASS_ERROR_CODE, self._pass_error_code)  # register here to have a callback for each operation
+        if register_events:
+            # register here to have a callback for each operation
+            clear_event_subscribers(self.id, InfoEvents.PASS_ERROR_CODE)
+            register_for_event(self.id, InfoEvents.PASS_ERROR_CODE, self._pass_error_code)
 
     def _status_string(self):
         return "<OpData id='{0}' priority='{1}'>".format(self.id, self.priority)
@@ -307,7 +316,7 @@ class OpData(object):
             return 0
         elif self.end_time == 0:
             # Operation is still running
-            return int((time.time() - self.start_time) * 1000)
+            return int((self._clock.time() - self.start_time) * 1000)
         else:
             # Operation has completed
             return int((self.end_time - self.start_time - self.tool_wait_time) * 1000)
@@ -323,7 +332,7 @@ class OpData(object):
 
     def set_requeue(self):
         self.set_run_status(OperationState.REQUEUE)
-        self.requeue_time = time.time()
+        self.requeue_time = self._clock.time()
 
     def set_error(self, message):
         self.set_run_status(OperationState.ERROR)
@@ -347,7 +356,7 @@ class OpData(object):
         if not successful_checkout:
             self.return_active_tools()
             self.set_run_status(OperationState.WAITING_ON_TOOL)
-            self.requeue_time = time.time()
+            self.requeue_time = self._clock.time()
             return OperationState.REQUEUE
 
         # Make the tool objects available in the operation object
@@ -376,12 +385,19 @@ class OpData(object):
 
         return prc
 
-    def launch(self):
+    def launch(self, cancel_token=None):
+        """
+        Start the operation thread
+
+        :param CancellationToken cancel_token: [optional] token of the sequence - cancelling it
+            also stops this run of the operation
+        """
         self.message = None
         self.set_run_status(OperationState.RUNNING)
+        self._object.set_cancel_token(CancellationToken(parent=cancel_token))
         self.process = Thread(name=self.id,
                               target=self._object.run)
-        self.start_time = time.time()
+        self.start_time = self._clock.time()
         self.process.start()
         self.thread_id = self.process.ident
 
@@ -389,13 +405,16 @@ class OpData(object):
         if self.process is not None:
             self.process.join()
             self.process = None
-        self.end_time = time.time()
+        self.end_time = self._clock.time()
 
         try:
             self._object.cleanup()
         except Exception as e:
             self.set_error("Exception '{0}' during cleanup".format(e))
             raise
+        finally:
+            # The run is over - the sequence token no longer needs to reach it
+            self._object.get_cancel_token().detach()
 
         self.return_active_tools()
 
@@ -530,9 +549,10 @@ class OpData(object):
         if self._object is None:
             raise Exception("Sequence operation object not yet created")
 
-        if key in ["_results", "_shutdown", "_status", "cleanup", "get_id", "get_results",
-                   "get_status", "is_shutdown", "operation_action", "prepare", "run",
-                   "save_result", "set_status", "shutdown", "ui_log"] or key.startswith("__"):
+        if key in ["_cancel_token", "_results", "_shutdown", "_status", "cleanup",
+                   "get_cancel_token", "get_id", "get_results", "get_status", "is_shutdown",
+                   "operation_action", "prepare", "run", "save_result", "set_cancel_token",
+                   "set_status", "shutdown", "sleep", "ui_log"] or key.startswith("__"):
             raise Exception("Attempting to set protected object attribute: {0}".format(key))
 
         setattr(self._object, key, value)
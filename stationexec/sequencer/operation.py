@@ -11,6 +11,8 @@ of a device. The operations are all performed on one station.
 from stationexec.logger import log
 from stationexec.sequencer.operationstates import OperationState
 from stationexec.station.events import emit_event, InfoEvents
+from stationexec.station.payloads import ObjectUpdatePayload
+from stationexec.utilities.cancellation import CancellationToken, set_current_token
 from stationexec.utilities.exceptions import AbortException, ErrorCodeException
 from stationexec.utilities.error_codes import ComponentCodes, FailureCodes, ErrorCode
 
@@ -39,6 +41,8 @@ class Operation(object):
         """
         # When True, process should shut down quickly
         self._shutdown = False
+        # Cancelled when the operation or its sequence is asked to stop - replaced for each run
+        self._cancel_token = CancellationToken()
         # Unique ID for this operation, matching the class name
         self._operation_id = operation_id
         # Run status of this operation
@@ -86,7 +90,8 @@ class Operation(object):
         Override this method with the actions to perform for this operation.
 
         If self.is_shutdown() becomes true, this method should cleanly exit as soon
-        as possible.
+        as possible. Wait with `self.sleep() <.sleep>` instead of `time.sleep` so that a stop
+        request interrupts the wait.
 
         This method should save results by calling `self.save_result() <.save_result()>`. If the
         method does not create a result for every item in expected_results,
@@ -116,9 +121,12 @@ class Operation(object):
 
         log.debug(2, "running operation {0}".format(self.get_id()))
         self.set_status(OperationState.RUNNING)
+        # Tool calls made by this thread see the token through current_token()
+        set_current_token(self._cancel_token)
 
         # Wrap it, in case user code is bad
         try:
+            self._cancel_token.raise_if_cancelled()
             rc = self.operation_action()
         except AbortException:
             # Operation was asked to shut down while executing
@@ -155,6 +163,8 @@ class Operation(object):
             log.exception(
                 "Operation '{0}' failed with exception".format(self.get_id()), e
             )
+        finally:
+            set_current_token(None)
 
         if rc is None:
             rc = OperationState.COMPLETED
@@ -163,14 +173,41 @@ class Operation(object):
     def shutdown(self):
         """
         Ask the Operation to shut down and stop running. How quickly it does
-        so depends on the implementation.
+        so depends on the implementation - waits in `.sleep` and in tool reads end immediately.
         """
         log.debug(2, "'{0}' asked to shut down".format(self.get_id()))
         self._shutdown = True
+        self._cancel_token.cancel("'{0}' asked to shut down".format(self.get_id()))
 
     def is_shutdown(self):
         """ Returns True if this operation was asked to shutdown(). """
-        return True if self._shutdown else False
+        return True if self._shutdown or self._cancel_token.is_cancelled() else False
+
+    def set_cancel_token(self, token):
+        """
+        Set the cancellation token of the next run - called by the sequence before launch
+
+        :param CancellationToken token: token cancelled when this run should stop
+        """
+        self._cancel_token = token
+
+    def get_cancel_token(self):
+        """
+        Get the cancellation token of this run, to pass to code that does its own waiting
+
+        :rtype: CancellationToken
+        """
+        return self._cancel_token
+
+    def sleep(self, seconds):
+        """
+        Sleep for the given time unless the operation is asked to shut down first
+
+        :param float seconds: seconds to sleep
+        :raise AbortException: if the operation is asked to shut down, which ends the operation
+            as ABORTED
+        """
+        self._cancel_token.sleep(seconds)
 
     def cleanup(self):
         """
@@ -310,11 +347,7 @@ class Operation(object):
         """
         emit_event(
             InfoEvents.OBJECT_UPDATE,
-            {
-                "source": "operation.{0}".format(self.get_id()),
-                "target": target,
-                "value": value,
-            },
+            ObjectUpdatePayload("operation.{0}".format(self.get_id()), target, value),
         )
 
     def get_loop_iteration(self):
@@ -7,6 +7,7 @@ from collections import defaultdict
 from enum import Enum
 from uuid import UUID
 
+import simplejson
 from stationexec.sequencer.loop import Loop
 from stationexec.sequencer.opdata import OpData
 from stationexec.sequencer.operationstates import OperationState
@@ -19,6 +20,7 @@ from stationexec.sequencer.utilities import (
     SequenceLoop,
     unique_list,
 )
+from stationexec.utilities.cancellation import CancellationToken
 from stationexec.utilities.error_codes import ErrorCode
 from stationexec.utilities.uuidstr import get_uuid
 from stationexec.utilities.exceptions import MissingResult
@@ -43,6 +45,8 @@ class Sequence(object):
         n_up=1,
         avg_operation_runtimes=None,
         runtimedata=None,
+        clock=None,
+        register_events=True,
     ):
         self.uuid = get_uuid()  # type: UUID
         self.is_initialized = False
@@ -55,9 +59,17 @@ class Sequence(object):
             avg_operation_runtimes if avg_operation_runtimes is not None else {}
         )
         self._n_up = n_up if n_up >= 1 else 1
+        # Source of time for the sequence - anything with time() like the time module
+        self._clock = clock if clock is not None else time
+        # False for a sequence that never runs on the station - its operations stay off the bus
+        self._register_events = register_events
         self._operations_matrix = None
         self._running_status = SequenceStatus.IDLE
         self._exit_reason = ""
+        # Cancelling it stops every running operation of the sequence at once
+        self.cancel_token = CancellationToken()
+        # Time from the stop request until nothing was left running, if the sequence was stopped
+        self._abort_latency_ms = None
 
         self._error_reports = []
         self._entry_nodes = []
@@ -65,6 +77,8 @@ class Sequence(object):
         self._libraries = get_installed_library_versions()
         self._operations = {}
         self._loops = {}
+        # Operation id to the LoopAggregate of its aggregating loop
+        self._aggregates = {}
         self._storage_cache = defaultdict(dict)
 
         self.start_time = 0
@@ -199,6 +213,8 @@ class Sequence(object):
                 n_pos=n_pos,
                 n_up=self._n_up,
                 n_up_operations=n_up_operations,
+                clock=self._clock,
+                register_events=self._register_events,
             )
             # Update the operations map
             if op.id in self._operations:
@@ -222,6 +238,9 @@ class Sequence(object):
         self._loops[loop.uuid] = loop
         for loop_op in op_info["operations"]:
             self._load_operation(loop_op, n_up_operations)
+        if loop.aggregate is not None:
+            for operation_id in loop.get_operations():
+                self._aggregates[operation_id] = loop.aggregate
 
     def _adjust_priority(self):
         # Calculate priorities
@@ -364,17 +383,17 @@ class Sequence(object):
 
     def sequence_starting(self):
         self._running_status = SequenceStatus.RUNNING
-        self.start_time = time.time()
+        self.start_time = self._clock.time()
 
     def sequence_ending(self):
         if self._running_status != SequenceStatus.ABORTED:
             self._running_status = SequenceStatus.COMPLETED
-        self.end_time = time.time()
+        self.end_time = self._clock.time()
 
     def get_duration_ms(self):
         if self.end_time == 0:
             # Operation is still running
-            return int((time.time() - self.start_time) * 1000)
+            return int((self._clock.time() - self.start_time) * 1000)
         else:
             return int((self.end_time - self.start_time) * 1000)
 
@@ -396,6 +415,8 @@ class Sequence(object):
         }
         if self._exit_reason != "":
             status["info"]["exit_reason"] = self._exit_reason
+        if self._abort_latency_ms is not None:
+            status["info"]["abort_latency_ms"] = self._abort_latency_ms
         return status
 
     def did_pass(self):
@@ -405,6 +426,20 @@ class Sequence(object):
     def set_exit_reason(self, reason):
         self._exit_reason = str(reason)
 
+    def freeze(self):
+        """ Return a compact, read-only `.SequenceSummary` of this finished sequence """
+        return SequenceSummary(
+            self.get_status(), self.get_operation_graph(), self.get_operation_tools()
+        )
+
+    def cancel(self, reason):
+        """ Ask all running operations to stop - operations launched afterwards start cancelled """
+        self._running_status = SequenceStatus.ABORTED
+        self.cancel_token.cancel(str(reason))
+
+    def set_abort_latency(self, latency_ms):
+        self._abort_latency_ms = int(latency_ms)
+
     # ---------- All/Many Operations -----------
 
     def initialize(self, operation_code):
@@ -445,6 +480,14 @@ class Sequence(object):
         all_required_tools = self._for_all_operations("get_object_tools")
         return [tool for _list in all_required_tools for tool in _list]
 
+    def get_operation_graph(self):
+        """ Return dict of every operation id to the list of operation ids it depends on """
+        return {opid: op.get_dependency_list() for opid, op in self._operations.items()}
+
+    def get_operation_tools(self):
+        """ Return dict of every operation id to the list of tools it checks out """
+        return {opid: list(op.get_object_tools()) for opid, op in self._operations.items()}
+
     def get_operation_names(self, sort_by_priority=False):
         """ Return all operation ids - sorted by priority if desired """
         if sort_by_priority:
@@ -502,7 +545,7 @@ class Sequence(object):
 
     def launch_op(self, operation_id):
         """ Start thread of operation main process """
-        return self._operations[operation_id].launch()
+        return self._operations[operation_id].launch(self.cancel_token)
 
     def cleanup_op(self, operation_id):
         try:
@@ -522,6 +565,57 @@ class Sequence(object):
             operation_id, self._operations[operation_id].get_result_values()
         )
 
+    def start_op_iteration(self, operation_id):
+        """
+        Count a run of an operation - returns False if the run is aggregated into the summary of
+        its loop instead of being stored
+        """
+        aggregate = self._aggregates.get(operation_id)
+        if aggregate is None:
+            return True
+        return aggregate.start_iteration(operation_id, self.get_op_uuid(operation_id))
+
+    def is_op_iteration_recorded(self, operation_id):
+        """ False if the current run of the operation is only kept in its loop summary """
+        aggregate = self._aggregates.get(operation_id)
+        return aggregate is None or aggregate.is_recorded(operation_id)
+
+    def aggregate_op_results(self, operation_id):
+        """
+        Add the results of the current run of an operation to its loop statistics, if the loop
+        aggregates
+
+        :return: True if the results of the run should also be stored individually
+        :rtype: bool
+        """
+        aggregate = self._aggregates.get(operation_id)
+        if aggregate is None:
+            return True
+        aggregate.add_results(
+            operation_id,
+            self.get_op_result_data(operation_id) + self.get_op_storage_data(operation_id),
+        )
+        return aggregate.is_recorded(operation_id)
+
+    def pop_loop_summaries(self, finished_only=True):
+        """
+        Get the summary data items of aggregating loops that have not been stored yet
+
+        :param bool finished_only: only loops whose condition has ended the loop; False to also
+            summarize loops cut short by a sequence stop
+        :return: list of data status dicts to store
+        :rtype: list
+        """
+        summaries = []
+        for loop in self._loops.values():
+            if loop.aggregate is None or loop.aggregate.summary_stored:
+                continue
+            if finished_only and not loop.finished:
+                continue
+            loop.aggregate.summary_stored = True
+            summaries.extend(loop.aggregate.get_summary_data())
+        return summaries
+
     def get_op_run_status(self, operation_id):
         return self._operations[operation_id].get_run_status()
 
@@ -548,7 +642,7 @@ class Sequence(object):
         if requeue_time is None:
             return True
 
-        if time.time() - requeue_time < min_requeue_time:
+        if self._clock.time() - requeue_time < min_requeue_time:
             # Requeue time has not yet elapsed
             return False
         else:
@@ -613,3 +707,52 @@ class Sequence(object):
             )
 
         return ops
+
+
+class SequenceSummary(object):
+    """
+    Read-only record of a finished `.Sequence`, kept in the sequence history instead of the
+    sequence itself. It holds the final status and the operation graph as encoded JSON, so none
+    of the operations, results, storage cache or operation code of the sequence stay in memory.
+    """
+
+    __slots__ = (
+        "uuid", "start_time", "duration_ms", "passing", "version", "_status", "_graph", "_tools"
+    )
+
+    def __init__(self, status, graph, tools):
+        """
+        :param dict status: final status of the sequence, from `.Sequence.get_status`
+        :param dict graph: operation id to dependencies, from `.Sequence.get_operation_graph`
+        :param dict tools: operation id to tools, from `.Sequence.get_operation_tools`
+        """
+        self.uuid = status["uuid"]
+        self.start_time = status["start_time"]
+        self.duration_ms = status["duration_ms"]
+        self.passing = status["passing"]
+        self.version = status.get("version")
+        self._status = simplejson.dumps(status)
+        self._graph = simplejson.dumps(graph)
+        self._tools = simplejson.dumps(tools)
+
+    def __str__(self):
+        return "<SequenceSummary id='{0}'>".format(self.uuid)
+
+    def __repr__(self):
+        return "<SequenceSummary id='{0}'>".format(self.uuid)
+
+    def get_status(self):
+        """ Return a new copy of the final status of the sequence """
+        return simplejson.loads(self._status)
+
+    def did_pass(self):
+        return self.passing
+
+    def get_duration_ms(self):
+        return self.duration_ms
+
+    def get_operation_graph(self):
+        return simplejson.loads(self._graph)
+
+    def get_operation_tools(self):
+        return simplejson.loads(self._tools)
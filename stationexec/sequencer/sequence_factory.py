@@ -16,6 +16,7 @@ def from_file(
     n_up=1,
     avg_operation_runtimes=None,
     runtimedata=None,
+    clock=None,
 ):
     with open(code_path) as f:
         op_file = f.read()
@@ -27,6 +28,7 @@ def from_file(
         n_up,
         avg_operation_runtimes,
         runtimedata,
+        clock,
     )
 
 
@@ -38,21 +40,33 @@ def from_text(
     n_up=1,
     avg_operation_runtimes=None,
     runtimedata=None,
+    clock=None,
 ):
-    sequence_module = types.ModuleType("operations")
-    exec(code_text, sequence_module.__dict__)
-    return _factory(
+    return from_module(
         config_text,
-        sequence_module,
+        load_operations(code_text),
         tool_functions,
         system_configs,
         n_up,
         avg_operation_runtimes,
         runtimedata,
+        clock,
     )
 
 
-def _factory(
+def load_operations(code_text):
+    """
+    Run the source of an operations module
+
+    :param str code_text: source of the operations module
+    :return: the module, to build any number of sequences from with `from_module`
+    """
+    sequence_module = types.ModuleType("operations")
+    exec(code_text, sequence_module.__dict__)
+    return sequence_module
+
+
+def from_module(
     sequence_config,
     sequence_module,
     tool_functions,
@@ -60,6 +74,8 @@ def _factory(
     n_up=1,
     avg_operation_runtimes=None,
     runtimedata=None,
+    clock=None,
+    register_events=True,
 ):
     sequence = Sequence(
         sequence_config,
@@ -68,6 +84,8 @@ def _factory(
         avg_operation_runtimes=avg_operation_runtimes,
         runtimedata=runtimedata,
         n_up=n_up,
+        clock=clock,
+        register_events=register_events,
     )
     sequence.initialize(sequence_module)
     return sequence
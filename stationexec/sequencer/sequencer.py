@@ -19,11 +19,14 @@ from stationexec.logger import log
 from stationexec.sequencer.operationstates import OperationState
 from stationexec.sequencer.sequence import Sequence
 from stationexec.station.events import emit_event, InfoEvents, StorageEvents
+from stationexec.station.payloads import SequenceUpdatePayload
 from stationexec.utilities.shutdown import signal_list
 
 
 _LOOP_WAIT_TIME_SEC = 0.5
 _MINIMUM_REQUEUE_WAIT_SECONDS = 1.5
+# How often stopping operations are checked while a sequence aborts
+_ABORT_POLL_SECONDS = 0.05
 
 
 class Sequencer(object):
@@ -32,6 +35,10 @@ class Sequencer(object):
     # Sequence timeouts
     _SEQUENCE_TIMEOUT_SECONDS = 3600
     _OPERATION_TIMEOUT_SECONDS = 600
+    # Abort timeouts - seconds an operation has to stop on its own before it is terminated, and
+    # seconds before an operation that can not be terminated is abandoned
+    _ABORT_GRACE_SECONDS = 1
+    _ABORT_TIMEOUT_SECONDS = 30
     # Internal debug flag
     _debug = False  # type: bool
     # The thread handle
@@ -49,9 +56,15 @@ class Sequencer(object):
         """
         self._SEQUENCE_TIMEOUT_SECONDS = get_cfg("_SEQUENCE_TIMEOUT_SECONDS", 3600)
         self._OPERATION_TIMEOUT_SECONDS = get_cfg("_OPERATION_TIMEOUT_SECONDS", 600)
+        self._ABORT_GRACE_SECONDS = get_cfg("_ABORT_GRACE_SECONDS", 1)
+        self._ABORT_TIMEOUT_SECONDS = get_cfg("_ABORT_TIMEOUT_SECONDS", 30)
+
+        # Logger for sequencer messages
+        self._log = log
 
         self._sequence_queue = deque()
-        self._recent_sequences = deque(maxlen=10)
+        # Finished sequences, frozen into compact SequenceSummary records
+        self._recent_sequences = deque(maxlen=max(int(get_cfg("sequence_history_length", 10)), 1))
 
         self._debug = get_cfg("debug", False)
         # Max task parallelism on this station
@@ -68,6 +81,8 @@ class Sequencer(object):
 
         # If true, Sequencer should stop any currently running operations, then remain ready
         self._stop_requested = False
+        # Time of the first stop request of the running sequence, to measure the abort latency
+        self._stop_time = None
         # If true, all threads should shut down and Sequencer should itself stop
         self._shutdown_requested = False
         # Internal flag: are we preparing to start a sequence? So we don't accept a 2nd request.
@@ -78,10 +93,22 @@ class Sequencer(object):
         self.run_count = 0
         self._iteration = 0
 
+    def _emit_event(self, event, data):
+        """ Emit an event on behalf of the `.Sequencer` """
+        emit_event(event, data)
+
+    def _get_op_status(self, operation_id):
+        """ Status of an operation of the active sequence, with the station and sequence version
+        that storage keeps the operation duration statistics by """
+        status = self.active_sequence.get_op_status(operation_id)
+        status["station"] = self.station_id
+        status["version"] = self.active_sequence.version
+        return status
+
     def _update_ui(self):
         """ Tell the UI that some status has changed in the `.Sequencer` """
         data = simplejson.dumps(self.active_sequence.get_status())
-        emit_event(InfoEvents.SEQUENCE_UPDATE, {"source": "sequencer", "data": data})
+        self._emit_event(InfoEvents.SEQUENCE_UPDATE, SequenceUpdatePayload("sequencer", data))
 
     def get_status(self):
         if self.active_sequence is not None:
@@ -99,13 +126,43 @@ class Sequencer(object):
             history.append(seq.get_status())
         return history
 
+    def get_sequence_graph(self):
+        """
+        Get the operation dependency graph and tool usage of the active sequence, or the most
+        recent sequence if none is active
+
+        :return: tuple of (dict of opid to dependencies, dict of opid to tools); empty if no
+            sequence has been loaded
+        """
+        sequence = self._latest_sequence()
+        if sequence is None:
+            return {}, {}
+        return sequence.get_operation_graph(), sequence.get_operation_tools()
+
+    def get_sequence_version(self):
+        """
+        Get the version of the active sequence, or the most recent sequence if none is active
+
+        :return: version of the operations module; None if no sequence has been loaded
+        :rtype: str
+        """
+        sequence = self._latest_sequence()
+        return None if sequence is None else sequence.version
+
+    def _latest_sequence(self):
+        if self.active_sequence is not None:
+            return self.active_sequence
+        if len(self._recent_sequences) > 0:
+            return self._recent_sequences[-1]
+        return None
+
     def initialize(self):
         """
         Initialize the Sequencer by launching the execution thread that will
 
         :raise InvalidAttribute: if ``operations.json`` file has an error
         """
-        log.info("Sequencer Initialization")
+        self._log.info("Sequencer Initialization")
 
         # Remove main thread signal handlers before we make a launch the run
         disabled_sig_handler = {}
@@ -133,7 +190,7 @@ class Sequencer(object):
             try:
                 self._execute()
             except Exception as e:
-                log.exception("Exception in sequence execution", e)
+                self._log.exception("Exception in sequence execution", e)
 
     def _execute(self):
         self.active_sequence.sequence_starting()
@@ -142,6 +199,7 @@ class Sequencer(object):
         self._starting = True
         self._shutdown_requested = False
         self._stop_requested = False
+        self._stop_time = None
         self.run_count += 1
 
         # Emit message indicating start of sequence run
@@ -152,9 +210,9 @@ class Sequencer(object):
             f"-{self.active_sequence._runtimedata.get('dut_serial_number')}"
             f"-{self.active_sequence.uuid}"
         )
-        emit_event(StorageEvents.ON_SEQUENCE_START, status)
-        emit_event(InfoEvents.SEQUENCE_STARTED, status)
-        emit_event(
+        self._emit_event(StorageEvents.ON_SEQUENCE_START, status)
+        self._emit_event(InfoEvents.SEQUENCE_STARTED, status)
+        self._emit_event(
             InfoEvents.MESSAGE_UPDATE,
             {
                 "source": "sequencer",
@@ -164,7 +222,7 @@ class Sequencer(object):
             },
         )
 
-        log.info(
+        self._log.info(
             "Running sequence {0}, threads={1}, pid={2}".format(
                 self.active_sequence.uuid, self.parallelism, os.getpid()
             )
@@ -200,7 +258,8 @@ class Sequencer(object):
                         )
                     )
 
-                time.sleep(_LOOP_WAIT_TIME_SEC)
+                # Wakes up early when the sequence is cancelled
+                self.active_sequence.cancel_token.wait(_LOOP_WAIT_TIME_SEC)
                 if self._shutdown_requested or self._stop_requested:
                     break
 
@@ -212,69 +271,73 @@ class Sequencer(object):
 
                 # Only ask for ui refresh once per iteration
                 self._update_ui()
-                log.debug(
+                self._log.debug(
                     2, "QWaiting : {0}".format(", ".join(str(x) for x in self._waiting))
                 )
-                log.debug(
+                self._log.debug(
                     2, "QReady   : {0}".format(", ".join(str(x) for x in self._ready))
                 )
-                log.debug(
+                self._log.debug(
                     2, "QRunning : {0}".format(", ".join(str(x) for x in self._running))
                 )
-                log.debug(
+                self._log.debug(
                     2, "QDone    : {0}".format(", ".join(str(x) for x in self._done))
                 )
 
             if self._shutdown_requested or self._stop_requested:
-                log.warning(
+                self._log.warning(
                     "Sequence aborted after {0} iterations".format(self._iteration)
                 )
             else:
-                log.debug(
+                self._log.debug(
                     2, "Sequence completed after {0} iterations".format(self._iteration)
                 )
 
         # End Sequence Run
         except Exception as e:
-            log.exception("Uncaught exception in sequence", e)
+            self._log.exception("Uncaught exception in sequence", e)
             self.active_sequence.set_exit_reason(e)
 
         # Wrap cleanup code to ensure that any unexpected exceptions are cleaned up
         try:
-            # Make sure nobody is left running, regardless of whether we exited the loop
-            # cleanly, or were asked to shutdown now.
-            attempts = 0
-            max_requests_before_terminate = 1
-            while len(self._running) > 0:
-                inactive = self.active_sequence.shutdown_operations(
-                    self._running, nice=attempts < max_requests_before_terminate
-                )
-                attempts += 1
-                for operation_id in inactive:
-                    log.debug(2, "Operation '{0}' has stopped".format(operation_id))
-                    self._running.remove(operation_id)
-                    self._operation_done(operation_id)
-                time.sleep(_LOOP_WAIT_TIME_SEC)
-
-            # Anyone not done is now marked as aborted.
+            # Anyone that has not started is marked as aborted, all in one step.
             self.active_sequence.abort_if_not_complete_or_error(
                 self._waiting + self._ready
             )
 
+            # Make sure nobody is left running, regardless of whether we exited the loop
+            # cleanly, or were asked to shutdown now.
+            if self._running:
+                self.active_sequence.cancel("Sequence stopped")
+                self._stop_running_operations()
+
+            # Loops cut short still store the statistics of the iterations that ran - once the
+            # running iterations have added their results
+            self._store_loop_summaries(finished_only=False)
+
         # End Sequence Cleanup
         except Exception as e:
-            log.exception("Uncaught exception in sequence cleanup", e)
+            self._log.exception("Uncaught exception in sequence cleanup", e)
             self.active_sequence.set_exit_reason(e)
 
+        if self._stop_time is not None:
+            abort_latency_ms = (time.time() - self._stop_time) * 1000
+            self.active_sequence.set_abort_latency(abort_latency_ms)
+            self._log.info(
+                "Sequence {0} stopped {1:.0f}ms after the stop request".format(
+                    self.active_sequence.uuid, abort_latency_ms
+                )
+            )
+
         self._active = False
         self._starting = False
         self.active_sequence.sequence_ending()
 
         status = self.active_sequence.get_status()
         status["station"] = (self.station_id,)
-        emit_event(StorageEvents.ON_SEQUENCE_END, status)
-        emit_event(InfoEvents.SEQUENCE_FINISHED, status)
-        emit_event(
+        self._emit_event(StorageEvents.ON_SEQUENCE_END, status)
+        self._emit_event(InfoEvents.SEQUENCE_FINISHED, status)
+        self._emit_event(
             InfoEvents.MESSAGE_UPDATE,
             {
                 "source": "sequencer",
@@ -285,7 +348,7 @@ class Sequencer(object):
         )
 
         self._update_ui()
-        log.info(
+        self._log.info(
             "Sequence {0} done after {1:.2f}s, thread pid {2} finished".format(
                 self.active_sequence.uuid,
                 self.active_sequence.get_duration_ms() / 1000.0,
@@ -293,7 +356,8 @@ class Sequencer(object):
             )
         )
 
-        self._recent_sequences.append(self.active_sequence)
+        # Keep only a compact record - the full sequence, its operations and results are released
+        self._recent_sequences.append(self.active_sequence.freeze())
         self.active_sequence = None
 
     def stop(self, reason, clear_queue=False):
@@ -306,11 +370,11 @@ class Sequencer(object):
                                  while stopping the current sequence. Otherwise, the next
                                  sequence on the queue will run.
         """
-        log.warning("Sequence stop requested: {0}".format(reason))
+        self._log.warning("Sequence stop requested: {0}".format(reason))
 
         if clear_queue:
             if len(self._sequence_queue) > 0:
-                log.warning(
+                self._log.warning(
                     "'{0}' items cleared out of the sequence queue".format(
                         len(self._sequence_queue)
                     )
@@ -320,18 +384,23 @@ class Sequencer(object):
         self.active_sequence.set_exit_reason(reason)
         if self._active or self._starting:
             self._stop_requested = True
+            if self._stop_time is None:
+                self._stop_time = time.time()
+            # Running operations see the stop right away, wherever they are waiting
+            self.active_sequence.cancel(reason)
 
     def shutdown(self):
         """
         Stop sequencer cleanup resources
         """
-        log.warning("Sequencer shutting down")
+        self._log.warning("Sequencer shutting down")
 
         # Clear the sequence queue
         self._sequence_queue = deque()
 
         if self._active or self._starting:
             self._stop_requested = True
+            self.active_sequence.cancel("Sequencer shutting down")
         self._shutdown_requested = True
 
         self._pmain.join()
@@ -349,7 +418,7 @@ class Sequencer(object):
         #  sequencer get status command will return drawable data
 
         if self._shutdown_requested:
-            log.error("Cannot start Sequencer since in shutdown mode")
+            self._log.error("Cannot start Sequencer since in shutdown mode")
             return
 
         position_in_queue = len(self._sequence_queue) + 1
@@ -377,7 +446,7 @@ class Sequencer(object):
             if self.active_sequence.all_dependencies_completed(
                 operation_id, self._done
             ):
-                log.debug(
+                self._log.debug(
                     2,
                     "Moving operation {0} to ready queue on iteration {1}".format(
                         operation_id, self._iteration
@@ -440,10 +509,13 @@ class Sequencer(object):
                     self.active_sequence.set_operation_status(
                         operation_id, OperationState.SKIPPED
                     )
-                    status = self.active_sequence.get_op_status(operation_id)
-                    emit_event(StorageEvents.ON_OPERATION_START, status)
+                    if not self.active_sequence.start_op_iteration(operation_id):
+                        # Aggregated loop iteration - not stored individually
+                        continue
+                    status = self._get_op_status(operation_id)
+                    self._emit_event(StorageEvents.ON_OPERATION_START, status)
                     # Alert UI that operation was skipped due to condition
-                    emit_event(
+                    self._emit_event(
                         InfoEvents.MESSAGE_UPDATE,
                         {
                             "source": "sequencer",
@@ -453,12 +525,12 @@ class Sequencer(object):
                         },
                     )
                     # Cleanup operation
-                    status = self.active_sequence.get_op_status(operation_id)
-                    emit_event(StorageEvents.ON_OPERATION_END, status)
+                    status = self._get_op_status(operation_id)
+                    self._emit_event(StorageEvents.ON_OPERATION_END, status)
                     continue
 
                 # Run prepare for this operation, check if it asks for requeue or has an error.
-                log.debug(
+                self._log.debug(
                     2,
                     "Preparing operation {0} with priority {2} on iteration {1}".format(
                         operation_id,
@@ -469,7 +541,7 @@ class Sequencer(object):
                 try:
                     prc = self.active_sequence.prepare_op(operation_id)
                 except Exception as e:
-                    log.exception(
+                    self._log.exception(
                         "exception while preparing operation '{0}'".format(
                             operation_id
                         ),
@@ -483,7 +555,7 @@ class Sequencer(object):
                     break
 
                 if prc == OperationState.REQUEUE:
-                    log.debug(
+                    self._log.debug(
                         3,
                         "RE-QUEUING operation '{0}' on iteration {1}".format(
                             operation_id, self._iteration
@@ -491,7 +563,7 @@ class Sequencer(object):
                     )
                     continue
                 if prc == OperationState.ERROR:
-                    log.debug(
+                    self._log.debug(
                         3,
                         "Operation '{0}' FAILED to prepare on iteration {1}".format(
                             operation_id, self._iteration
@@ -504,7 +576,7 @@ class Sequencer(object):
                     )
                     break
 
-                log.debug(
+                self._log.debug(
                     2,
                     "Running operation '{0}' with priority {2} on iteration {1}".format(
                         operation_id,
@@ -517,8 +589,9 @@ class Sequencer(object):
                 self._ready.remove(operation_id)
                 found_runnable = True
 
-                op_info = self.active_sequence.get_op_status(operation_id)
-                emit_event(StorageEvents.ON_OPERATION_START, op_info)
+                if self.active_sequence.start_op_iteration(operation_id):
+                    op_info = self._get_op_status(operation_id)
+                    self._emit_event(StorageEvents.ON_OPERATION_START, op_info)
 
                 self.active_sequence.launch_op(operation_id)
 
@@ -547,7 +620,7 @@ class Sequencer(object):
                 try:
                     operation_rc = self._operation_done(operation_id)
                 except Exception as e:
-                    log.warning(
+                    self._log.warning(
                         "exception while finishing operation '{0}': {1}".format(
                             operation_id, str(e)
                         )
@@ -561,7 +634,7 @@ class Sequencer(object):
 
                 if operation_rc is OperationState.COMPLETED:
                     self._done.append(operation_id)
-                    log.debug(
+                    self._log.debug(
                         3,
                         "COMPLETED: '{0}' on iteration {1}".format(
                             operation_id, str(self._iteration)
@@ -579,17 +652,18 @@ class Sequencer(object):
                             self._waiting.append(member_op_id)
                             if member_op_id in self._done:
                                 self._done.remove(member_op_id)
+                    self._store_loop_summaries()
 
                 elif operation_rc is OperationState.REQUEUE:
                     self._waiting.append(operation_id)
-                    log.debug(
+                    self._log.debug(
                         3,
                         "REQUEUE: {0} on iteration {1}".format(
                             operation_id, self._iteration
                         ),
                     )
                 elif operation_rc is OperationState.ERROR:
-                    log.warning(
+                    self._log.warning(
                         "OPERATION ERROR: {0} on iteration {1}".format(
                             operation_id, self._iteration
                         )
@@ -600,7 +674,7 @@ class Sequencer(object):
                         )
                     )
                 else:
-                    log.error(
+                    self._log.error(
                         "UNKNOWN rc {0} from operation {1} on iteration {2}".format(
                             operation_rc, operation_id, self._iteration
                         )
@@ -611,12 +685,52 @@ class Sequencer(object):
                         )
                     )
 
+    def _stop_running_operations(self):
+        """
+        Wait for the running operations to stop once their sequence is cancelled. Operations
+        still running after the abort grace period are terminated. Operations still running
+        after the abort timeout - stuck in a call that can not be interrupted - are abandoned as
+        ABORTED and keep their tools checked out, so the time to abort is bounded.
+        """
+        start = time.time()
+        last_terminate = None
+        self.active_sequence.shutdown_operations(self._running, nice=True)
+        while self._running:
+            for operation_id in list(self._running):
+                if not self.active_sequence.is_op_alive(operation_id):
+                    self._log.debug(2, "Operation '{0}' has stopped".format(operation_id))
+                    self._running.remove(operation_id)
+                    self._operation_done(operation_id)
+            if not self._running:
+                break
+
+            now = time.time()
+            if now - start >= self._ABORT_TIMEOUT_SECONDS:
+                for operation_id in self._running:
+                    self._log.error(
+                        "Operation '{0}' did not stop within {1}s - abandoning it; its tools "
+                        "remain checked out".format(operation_id, self._ABORT_TIMEOUT_SECONDS)
+                    )
+                    self.active_sequence.set_operation_status(
+                        operation_id, OperationState.ABORTED
+                    )
+                    status = self._get_op_status(operation_id)
+                    self._emit_event(StorageEvents.ON_OPERATION_END, status)
+                self._running = []
+                break
+            if now - start >= self._ABORT_GRACE_SECONDS and (
+                last_terminate is None or now - last_terminate >= _LOOP_WAIT_TIME_SEC
+            ):
+                self.active_sequence.shutdown_operations(self._running, nice=False)
+                last_terminate = now
+            time.sleep(_ABORT_POLL_SECONDS)
+
     def _operation_done(self, operation_id):
         # Cleanup
         try:
             self.active_sequence.cleanup_op(operation_id)
         except Exception as e:
-            emit_event(
+            self._emit_event(
                 InfoEvents.MESSAGE_UPDATE,
                 {
                     "source": "sequencer",
@@ -629,8 +743,9 @@ class Sequencer(object):
         finally:
             self._store_results(operation_id)
             # Notify that operation has completed execution
-            status = self.active_sequence.get_op_status(operation_id)
-            emit_event(StorageEvents.ON_OPERATION_END, status)
+            status = self._get_op_status(operation_id)
+            if self.active_sequence.is_op_iteration_recorded(operation_id):
+                self._emit_event(StorageEvents.ON_OPERATION_END, status)
 
         # Stop sequence if operation has any results that failed and is configured to stop (will continue by default)
         if not status["passing"]:
@@ -645,16 +760,24 @@ class Sequencer(object):
         return self.active_sequence.get_op_run_status(operation_id)
 
     def _store_results(self, operation_id):
+        # Runs inside of an aggregating loop only add to the loop statistics, unless sampled
+        if not self.active_sequence.aggregate_op_results(operation_id):
+            return
         results = self.active_sequence.get_op_result_data(operation_id)
         for result in results:
             result["operation"] = self.active_sequence.get_op_uuid(operation_id)
             if result["is_processed"]:
-                emit_event(StorageEvents.ON_RESULT_STORE, result)
+                self._emit_event(StorageEvents.ON_RESULT_STORE, result)
         storage_data = self.active_sequence.get_op_storage_data(operation_id)
         for data in storage_data:
             data["operation"] = self.active_sequence.get_op_uuid(operation_id)
             if data["is_processed"]:
-                emit_event(StorageEvents.ON_DATA_STORE, data)
+                self._emit_event(StorageEvents.ON_DATA_STORE, data)
+
+    def _store_loop_summaries(self, finished_only=True):
+        """ Store the result statistics of aggregating loops that are done """
+        for summary in self.active_sequence.pop_loop_summaries(finished_only):
+            self._emit_event(StorageEvents.ON_DATA_STORE, summary)
 
     def is_active(self):
         return self._active
@@ -0,0 +1,357 @@
+# Copyright 2004-present Facebook. All Rights Reserved.
+
+# @lint-ignore-every PYTHON3COMPATIMPORTS1
+
+"""
+Predict the cycle time of a sequence before it runs on a station.
+
+The `.SequenceSimulator` loads a sequence through `.sequence_factory` exactly as the station
+does, then replaces the body of every operation with a duration sampled from the execution
+history of that operation. The real `.Sequencer` scheduling methods then run the sequence on a
+virtual clock - the scheduler loop period, the ``threads`` limit, tool checkout contention and
+requeue delays all behave as on the station, but no time is spent sleeping, so an hour-long
+sequence simulates in a fraction of a second.
+
+Limitations - the simulation produces no results, so:
+
+* conditional operations always run
+* loops driven by a result condition run as if the condition is not met ('while' loops do not
+  run, 'dowhile' loops run once); 'repeat' loops run their configured number of times
+* only tools declared with `.require_tools` are modeled; tools checked out inside of
+  ``operation_action`` are not
+"""
+
+import math
+import random
+import statistics
+
+from stationexec.sequencer import sequence_factory
+from stationexec.sequencer.operationstates import OperationState
+from stationexec.sequencer.sequencer import Sequencer, _LOOP_WAIT_TIME_SEC, \
+    _MINIMUM_REQUEUE_WAIT_SECONDS
+from stationexec.utilities import config
+from stationexec.utilities.exceptions import ToolInUseException
+
+# Duration of an operation with no execution history - same default as OpData.avg_duration
+_DEFAULT_DURATION_SECONDS = 1.0
+
+
+class VirtualClock(object):
+    """ Clock for a simulated sequence run - time only moves when set """
+
+    def __init__(self, start=0.0):
+        self._now = start
+
+    def time(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self._now += max(seconds, 0)
+
+    def set(self, timestamp):
+        self._now = timestamp
+
+
+class _VirtualTool(object):
+    def __init__(self, tool_id):
+        self.tool_id = tool_id
+        self.checked_out_by = None
+
+
+class _VirtualToolbox(object):
+    """ Stand-in for `.ToolBox` checkout - every tool is online; only one user at a time """
+
+    def __init__(self):
+        self._tools = {}
+
+    def checkout_tool(self, process, tool_id):
+        tool = self._tools.setdefault(tool_id, _VirtualTool(tool_id))
+        if tool.checked_out_by is not None:
+            raise ToolInUseException(f"Tool '{tool_id}' in use by '{tool.checked_out_by}'")
+        tool.checked_out_by = process
+        return tool
+
+    def return_tool(self, process, tool_obj):
+        tool_obj.checked_out_by = None
+
+
+class _VirtualProcess(object):
+    """ Stand-in for the operation thread - alive until the virtual clock reaches end_time """
+
+    def __init__(self, clock, end_time, operation):
+        self._clock = clock
+        self._operation = operation
+        self.end_time = end_time
+
+    def is_alive(self):
+        return self._clock.time() < self.end_time
+
+    def join(self):
+        self._operation.set_status(OperationState.COMPLETED)
+
+
+class _SilentLog(object):
+    """ Drops log messages - simulated scheduling must not show up in the station log """
+
+    def debug(self, level, message):
+        pass
+
+    def info(self, message):
+        pass
+
+    def warning(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+    def exception(self, message, e):
+        return e
+
+
+class _SimulatedSequencer(Sequencer):
+    """ `.Sequencer` whose events and logs are dropped - a simulated run must not reach storage """
+
+    def __init__(self, get_cfg):
+        super(_SimulatedSequencer, self).__init__(get_cfg)
+        self._log = _SilentLog()
+
+    def _emit_event(self, event, data):
+        pass
+
+
+def _no_action():
+    pass
+
+
+def duration_samples_from_timing(runs):
+    """
+    Build the duration samples of each operation from operation timing history
+
+    :param dict runs: sequence uuid to list of timing records - from the
+        ``GET_OPERATION_TIMING`` retrieval event
+    :return: dict of opid to list of durations in seconds of successful runs
+    :rtype: dict
+    """
+    samples = {}
+    for records in (runs or {}).values():
+        for record in records:
+            if record.get("exitcode", 100) != 100 or record.get("duration_ms") is None:
+                continue
+            samples.setdefault(record["opid"], []).append(record["duration_ms"] / 1000.0)
+    return samples
+
+
+class SequenceSimulator(object):
+    """ Run a sequence on a virtual clock to predict its makespan """
+
+    def __init__(
+        self,
+        sequence_config,
+        code_text,
+        system_configs,
+        get_cfg,
+        n_up=0,
+        avg_operation_runtimes=None,
+        duration_samples=None,
+        runtimedata=None,
+        threads=None,
+        seed=None,
+    ):
+        """
+        :param list sequence_config: loaded operations configuration of the sequence
+        :param str code_text: source of the operations module
+        :param dict system_configs: station configuration
+        :param get_cfg: station configuration getter, as given to the `.Sequencer`
+        :param int n_up: number of parallel DUTs - 0 or 1 for one, as the station loads its
+            sequence
+        :param list avg_operation_runtimes: [(opid, avg_seconds), ...] - from the
+            ``GET_OPERATION_AVERAGE_DURATION`` retrieval event; sets operation priority and the
+            duration of operations without samples
+        :param dict duration_samples: opid to list of observed durations in seconds to draw
+            from - see `.duration_samples_from_timing`
+        :param dict runtimedata: runtime data given to the sequence
+        :param int threads: override the station ``threads`` limit
+        :param seed: seed of the random duration sampling, for repeatable predictions
+        """
+        self._sequence_config = sequence_config
+        # Parsed once - every run builds its sequence from the same module
+        self._operations_module = sequence_factory.load_operations(code_text)
+        self._system_configs = system_configs
+        self._get_cfg = get_cfg
+        self._n_up = n_up
+        self._avg_runtimes = avg_operation_runtimes or []
+        self._samples = duration_samples or {}
+        self._runtimedata = runtimedata or {}
+        self.threads = threads
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_file(cls, config_path, code_path, system_configs, get_cfg, **kwargs):
+        with open(code_path) as f:
+            code_text = f.read()
+        return cls(
+            config.load_config(config_path), code_text, system_configs, get_cfg, **kwargs
+        )
+
+    def _sample_duration(self, opid):
+        """ Draw a duration for one launch of an operation - n_up copies share history """
+        name = opid.split("__")[0]
+        samples = self._samples.get(opid) or self._samples.get(name)
+        if samples:
+            return self._random.choice(samples)
+        for op, duration in self._avg_runtimes:
+            if opid.startswith(op):
+                return duration
+        return _DEFAULT_DURATION_SECONDS
+
+    def _virtualize_operation(self, opdata, clock):
+        """ Replace the body of an operation with a sampled duration on the virtual clock """
+        opdata.is_conditional = False
+        opdata._results = {}
+        operation = opdata._object
+        operation.prepare = _no_action
+        operation.cleanup = _no_action
+
+        def launch(cancel_token=None):
+            opdata.message = None
+            opdata.set_run_status(OperationState.RUNNING)
+            opdata.start_time = clock.time()
+            opdata.process = _VirtualProcess(
+                clock, opdata.start_time + self._sample_duration(opdata.id), operation
+            )
+
+        opdata.launch = launch
+
+    @staticmethod
+    def _next_wake_time(sequence, sequencer):
+        """ Earliest time an operation finishes or a requeued operation may be retried """
+        wake = []
+        for operation_id in sequencer._running:
+            process = sequence._operations[operation_id].process
+            if process is not None:
+                wake.append(process.end_time)
+        for operation_id in sequencer._ready:
+            requeue_time = sequence._operations[operation_id].requeue_time
+            if requeue_time is not None:
+                wake.append(requeue_time + _MINIMUM_REQUEUE_WAIT_SECONDS)
+        return min(wake) if wake else None
+
+    def run_once(self):
+        """
+        Simulate one run of the sequence
+
+        :return: dict with the predicted 'makespan_s', the number of scheduler 'iterations' and
+            'completed' - False if the run stopped, stalled or exceeded the sequence timeout
+        :rtype: dict
+        """
+        clock = VirtualClock()
+        toolbox = _VirtualToolbox()
+        # The simulated operations must not replace the error code callbacks of the operations
+        # of a sequence running on the station meanwhile
+        sequence = sequence_factory.from_module(
+            self._sequence_config,
+            self._operations_module,
+            (toolbox.checkout_tool, toolbox.return_tool),
+            self._system_configs,
+            n_up=self._n_up,
+            avg_operation_runtimes=self._avg_runtimes,
+            runtimedata=dict(self._runtimedata),
+            clock=clock,
+            register_events=False,
+        )
+        for opdata in sequence._operations.values():
+            self._virtualize_operation(opdata, clock)
+
+        sequencer = _SimulatedSequencer(self._get_cfg)
+        if self.threads is not None:
+            sequencer.parallelism = self.threads
+        sequencer.active_sequence = sequence
+        sequencer._active = True
+        sequence.sequence_starting()
+        sequencer._waiting = sequence.get_operation_names(sort_by_priority=True)
+
+        # Mirrors the loop in Sequencer._execute. The real loop sleeps one period per iteration;
+        # when an iteration changed nothing, none will until an operation finishes or a requeue
+        # delay runs out, so skip straight to the iteration where that is first seen.
+        start = clock.time()
+        ticks = 0
+        changed = True
+        completed = True
+        while sequencer._ready or sequencer._waiting or sequencer._running:
+            if clock.time() - start > sequencer._SEQUENCE_TIMEOUT_SECONDS:
+                completed = False
+                break
+
+            if changed:
+                ticks += 1
+            else:
+                wake = self._next_wake_time(sequence, sequencer)
+                if wake is None:
+                    # Nothing running and nothing will become ready - sequence cannot finish
+                    completed = False
+                    break
+                ticks = max(
+                    ticks + 1, int(math.ceil((wake - start) / _LOOP_WAIT_TIME_SEC - 1e-9))
+                )
+            clock.set(start + ticks * _LOOP_WAIT_TIME_SEC)
+
+            if sequencer._stop_requested:
+                completed = False
+                break
+
+            before = (
+                tuple(sequencer._waiting),
+                tuple(sequencer._ready),
+                tuple(sequencer._running),
+                tuple(sequencer._done),
+            )
+            sequencer._iteration += 1
+            sequencer._find_operations_ready_to_run()
+            sequencer._run_ready_operations()
+            sequencer._handle_completed_operations()
+            changed = before != (
+                tuple(sequencer._waiting),
+                tuple(sequencer._ready),
+                tuple(sequencer._running),
+                tuple(sequencer._done),
+            )
+
+        sequence.sequence_ending()
+        return {
+            "makespan_s": sequence.get_duration_ms() / 1000.0,
+            "iterations": sequencer._iteration,
+            "completed": completed,
+        }
+
+    def run(self, runs=100):
+        """
+        Simulate the sequence several times and summarize the predicted makespan
+
+        :param int runs: number of simulated runs
+        :return: makespan distribution in seconds
+        :rtype: dict
+        """
+        results = [self.run_once() for _ in range(max(int(runs), 1))]
+        makespans = sorted(result["makespan_s"] for result in results)
+
+        def percentile(pct):
+            # Nearest-rank percentile
+            rank = int(math.ceil(pct / 100.0 * len(makespans)))
+            return makespans[min(max(rank, 1), len(makespans)) - 1]
+
+        return {
+            "runs": len(results),
+            "incomplete": len([result for result in results if not result["completed"]]),
+            "threads": self.threads if self.threads is not None else self._get_cfg("threads", 10),
+            "makespan_s": {
+                "min": makespans[0],
+                "mean": statistics.mean(makespans),
+                "stdev": statistics.pstdev(makespans),
+                "p50": percentile(50),
+                "p90": percentile(90),
+                "p95": percentile(95),
+                "max": makespans[-1],
+            },
+            "samples": makespans,
+        }
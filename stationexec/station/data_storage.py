@@ -60,28 +60,82 @@ placed into a queue to be processed later.
 
 The queue is organized by data source so that, if applicable, multiple storage events from one
 source can be processed all at once (especially useful when the source is a tool - only have to
-checkout the tool once to process all of the data). The information stored in the queue is as
-follows:
+checkout the tool once to process all of the data). Within a source, every handler has its own
+queue, a `StorageSink`. Each item in the queue is an immutable `StorageRecord` with:
 
 * Source - the source that will handle the event
 * Event enumeration - which storage event caused this handler to be placed into the queue
 * Handling method - the method that will process the event
-* JSON formatted string of data - the data that will be processed for storage
+* Data - a snapshot of the event data that will be processed for storage
 * Timestamp of when data was added to queue - this represents the time of the storage event, in case actual storage doesn't take place until some time later
 
+The worker takes all of the records of a handler at once and passes each run of records of the
+same event to the handler in one call. Records of the runs that were stored are acknowledged;
+the rest are put back at the front of the queue, in order. Triggering threads only append to
+the queue, so they are not held up while a large backlog is stored.
+
+Memory use of a handler whose source is unavailable is bounded. Past 'memory_records' records
+(default 50000) or 'memory_bytes' bytes (default 64 MB) in memory, the oldest of them are moved
+to files in the 'storage_spill' folder of the data folder, and read back in order once the
+source stores again. The files are written by a spill thread of the source; the triggering
+thread only signals it. Triggering a storage event never waits for the source, unless
+'max_pending_records' (default 0 - no limit) records of the source are waiting; then it waits
+until some are stored.
+
+The snapshot copies the dicts and lists of the event data, so later changes by the caller are
+not stored; bytes values are kept by reference, not copied or encoded. All handlers of one event
+share the snapshot. Each handler receives its own top level dict, with "created", "_event" and
+"_source" added, but must not change the nested values. The data is serialized once, when it is
+written to the log.
+
+Each entry is also appended to a write-ahead log (see `stationexec.station.storage_log`) in the
+'storage_log' folder of the data folder before it is queued, and acknowledged there once it is
+stored. Entries that were never stored, because the station was stopped, killed or lost power,
+are read back from the log and stored at the next start. The log is synced to disk at most
+'log_sync_period' seconds after an event, for all events since the last sync together.
+
 
 Storage Worker
 ^^^^^^^^^^^^^^
-The Storage Worker is a thread that will periodically process events in the work queue. It is
-launched in the `initialize` method of DataStorage. Every 'write_period' seconds, the worker will
-attempt to execute storage events for each data source. The configurable period of the worker
-loop is set with the 'write_period' value when creating the DataStorage object.
+Every source has its own Storage Worker (a `StorageWorker`), a thread that processes the events in
+the queues of that source. A slow or unavailable source - a remote database that is timing out -
+only delays its own events; the retries, limits and backlog of each source are separate. The
+workers are launched in the `initialize` method of DataStorage, and each sleeps until a flush of
+its source is due, which is when any of these is reached:
+
+* 'flush_records' events are waiting
+* 'flush_bytes' bytes of event data are waiting
+* the oldest waiting event is 'flush_age' seconds old
+* a sequence ends (ON_SEQUENCE_END)
+
+Small values keep results in memory for less time; larger ones store them in fewer, bigger
+batches. A handler is passed at most 'batch_records' events in one call. The values are set when
+creating the DataStorage object, and can be changed for single sources with its 'sinks'
+argument. `get_status` reports, for each source, how many flushes ran and how long the stored
+events waited.
 
 If the source of a handler is a tool, the worker will check the tool out (otherwise it can process
 the event directly). The worker will attempt loop through all outstanding data storage events for
-that source, calling the handler method with the data. If a storage method raises an exception,
-that object is placed back into the queue to be processed later (in the case that the tool is
-offline or in use).
+that source, calling the handler method with the data. If a storage method raises an exception
+that says the target is unavailable - an OSError, a tool error or a DB-API OperationalError -
+the records are placed back into the queue to be processed later, no sooner than 'write_period'
+seconds later. Any other exception means some of the records can not be stored: the records are
+passed to the handler in halves until those are found, and they are moved to the dead-letter
+store (see `stationexec.station.dead_letter`) so the records after them are not held up. If
+the dead-letter store can not be written either, the records are retried like the records of an
+unavailable target. Records that a call raised for are passed to the handler again, so a handler
+must store all of the records of a call or none of them - one transaction per call, as the
+built-in StationStorage handlers do. The
+``/station/storage/deadletter`` endpoint lists them (GET), requeues one with optionally fixed
+data (POST ``{"id": ..., "data": ...}``) or discards one (DELETE ``?id=``).
+
+`get_status`, also served as JSON by the ``/station/storage`` endpoint, reports for each source
+and each of its handlers how many records are waiting and how old the oldest of them is, and
+for each source the records stored per second over the last minute, the flushes that were
+retried, and histograms of the batch sizes and flush times. When the oldest waiting record of a
+source is older than 'lag_warning_s' seconds (default 120, 0 to never warn), a warning is
+logged, InfoEvents.STORAGE_LAG is emitted and the station health description shows the lag,
+until the source catches up.
 
 Retrieval
 ---------
@@ -103,10 +157,26 @@ triggers will come from stationexec when the data is needed.
 Members of enum `RetrievalEvents`:
 
 * GET_OPERATION_AVERAGE_DURATION
+* GET_OPERATION_DURATION_STATISTICS
 * GET_STATION_DATA
 * GET_LOG_DATA
 * GET_MAINTENANCE_DATA
 
+Retrieval Cache
+^^^^^^^^^^^^^^^
+Retrievals that sequences repeat with the same arguments - operation durations, sequence
+history, station and DUT data - are served from a cache (a `RetrievalCache`) while their result
+is less than 'retrieval_ttl' seconds old (default 60, 0 to not cache). 'retrieval_ttls' sets
+the time for single retrievals by name. When a storage worker stores records of an event that a
+retrieval reads (ON_OPERATION_END for GET_OPERATION_AVERAGE_DURATION and so on), the cached
+results of that retrieval are dropped, so a cached result is never older than the stored data.
+Callers receive a copy of the result.
+
+A retrieval from a tool does not wait for a whole flush of that tool: the storage worker returns
+the tool after its current batch and takes it back once the retrieval is done. While the tool is
+busy, a result that is past its TTL but was not dropped is returned instead of waiting.
+`get_status` counts the hits and misses in "retrieval_cache".
+
 
 How This Works in StationExec
 -----------------------------
@@ -136,19 +206,21 @@ It does not matter if this is the default or a developer-provided handler.
 become required in service of the retrieves. These must be handled by the same source that
 handles the retrieves.
 
-+--------------------------------+-------------------------+
-| **Retrieve**                   | **Store**               |
-+--------------------------------+-------------------------+
-| GET_STATION_DATA               | ON_REGISTER_STATION     |
-|                                | ON_UPDATE_STATION       |
-+--------------------------------+-------------------------+
-| GET_OPERATION_AVERAGE_DURATION | ON_OPERATION_START      |
-|                                | ON_OPERATION_END        |
-+--------------------------------+-------------------------+
-| GET_LOG_DATA                   | ON_LOG_DATA             |
-+--------------------------------+-------------------------+
-| GET_MAINTENANCE_DATA           | ON_MAINTENANCE_EVENT    |
-+--------------------------------+-------------------------+
++-----------------------------------+-------------------------+
+| **Retrieve**                      | **Store**               |
++-----------------------------------+-------------------------+
+| GET_STATION_DATA                  | ON_REGISTER_STATION     |
+|                                   | ON_UPDATE_STATION       |
++-----------------------------------+-------------------------+
+| GET_OPERATION_AVERAGE_DURATION    | ON_OPERATION_START      |
+|                                   | ON_OPERATION_END        |
++-----------------------------------+-------------------------+
+| GET_OPERATION_DURATION_STATISTICS | ON_OPERATION_END        |
++-----------------------------------+-------------------------+
+| GET_LOG_DATA                      | ON_LOG_DATA             |
++-----------------------------------+-------------------------+
+| GET_MAINTENANCE_DATA              | ON_MAINTENANCE_EVENT    |
++-----------------------------------+-------------------------+
 
 These requirements are enforced in the `_handler_audit` method, which will raise an exception
 with error messages describing which events are in violation of the rules.
@@ -156,9 +228,14 @@ with error messages describing which events are in violation of the rules.
 """
 
 import os
+import shutil
 import threading
 import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
 from functools import partial
+from itertools import count, groupby
+from operator import attrgetter
 
 import simplejson
 from stationexec.logger import log
@@ -170,6 +247,8 @@ from stationexec.station.events import (
     StorageEvents,
     InfoEvents,
 )
+from stationexec.station.dead_letter import DeadLetterStore
+from stationexec.station.storage_log import StorageLog, read_segment, write_segment
 from stationexec.utilities.config import get_all_paths
 from stationexec.utilities.exceptions import (
     ToolInUseException,
@@ -178,7 +257,58 @@ from stationexec.utilities.exceptions import (
 )
 from stationexec.utilities.time import to_timestamp, to_datetime, get_utc_now
 
+# Queue file of older versions
 _STORAGE_FILE = "queue.json"
+_STORAGE_LOG_FOLDER = "storage_log"
+_SPILL_FOLDER = "storage_spill"
+_DEAD_LETTER_FOLDER = "storage_dead_letter"
+# Errors that say the storage target is unavailable, not that the data is bad - records that
+# fail with them are retried
+_TRANSIENT_ERRORS = (OSError, ToolInUseException, ToolUnavailableException)
+# Size counted for values other than strings and bytes, for the flush_bytes limit
+_VALUE_SIZE = 8
+# Longest time a retrieval waits to check out its tool, and how often it tries
+_RETRIEVAL_CHECKOUT_TIMEOUT = 3.75
+_RETRIEVAL_CHECKOUT_POLL = 0.01
+# Longest time a storage worker leaves its tool to retrievals in the middle of a flush
+_RETRIEVAL_YIELD_TIMEOUT = 5.0
+# Results kept for each retrieval event; the least recently used ones are dropped
+_RETRIEVAL_CACHE_ENTRIES = 256
+# Upper bounds of the flush latency histogram buckets, in milliseconds
+_FLUSH_BUCKETS_MS = (10, 50, 100, 500, 1000, 5000, 10000, 60000)
+# Upper bounds of the batch size histogram buckets, in records
+_BATCH_BUCKETS = (1, 10, 100, 1000, 10000)
+# Seconds of stores that records_per_s is measured over
+_RATE_WINDOW_S = 60.0
+
+# Storage events whose records a retrieval reads - storing one of them drops the cached results
+# of the retrieval. Retrievals that are not listed are never cached.
+_RETRIEVAL_DEPENDENCIES = {
+    RetrievalEvents.GET_OPERATION_AVERAGE_DURATION: (
+        StorageEvents.ON_OPERATION_START, StorageEvents.ON_OPERATION_END,
+    ),
+    RetrievalEvents.GET_OPERATION_DURATION_STATISTICS: (StorageEvents.ON_OPERATION_END,),
+    RetrievalEvents.GET_OPERATION_TIMING: (
+        StorageEvents.ON_SEQUENCE_START, StorageEvents.ON_SEQUENCE_END,
+        StorageEvents.ON_OPERATION_START, StorageEvents.ON_OPERATION_END,
+    ),
+    RetrievalEvents.GET_STATION_DATA: (
+        StorageEvents.ON_REGISTER_STATION, StorageEvents.ON_UPDATE_STATION,
+    ),
+    RetrievalEvents.GET_STATION_DATA_LOCAL: (StorageEvents.ON_REGISTER_STATION_LOCAL,),
+    RetrievalEvents.GET_MAINTENANCE_DATA: (StorageEvents.ON_MAINTENANCE_EVENT,),
+    RetrievalEvents.GET_SEQUENCES: (
+        StorageEvents.ON_SEQUENCE_START, StorageEvents.ON_SEQUENCE_END,
+    ),
+    RetrievalEvents.GET_SEQUENCE_OPERATIONS: (
+        StorageEvents.ON_OPERATION_START, StorageEvents.ON_OPERATION_END,
+    ),
+    RetrievalEvents.GET_SEQUENCE_RESULTS: (StorageEvents.ON_RESULT_STORE,),
+    RetrievalEvents.GET_SEQUENCE_DATA: (StorageEvents.ON_DATA_STORE,),
+    RetrievalEvents.GET_DUT_DATA: (
+        StorageEvents.ON_ADD_DUT, StorageEvents.ON_SEQUENCE_START, StorageEvents.ON_SEQUENCE_END,
+    ),
+}
 
 
 class StorageShutdown(Exception):
@@ -186,14 +316,911 @@ class StorageShutdown(Exception):
     pass
 
 
+def is_transient_error(error):
+    """
+    Whether a handler exception says that the storage target is unavailable - a file, socket or
+    tool error, or a DB-API OperationalError (lost connection, locked database) - rather than
+    that the data can not be stored
+
+    :param Exception error: what the handler raised
+    :rtype: bool
+    """
+    return isinstance(error, _TRANSIENT_ERRORS) or type(error).__name__ == "OperationalError"
+
+
+def _age(created):
+    """ Seconds since a storage time; None for None """
+    return (get_utc_now() - created).total_seconds() if created is not None else None
+
+
+def _histogram(bounds, counts, unit):
+    """ Histogram counts by bucket label, for get_status """
+    histogram = {"<={0}{1}".format(bound, unit): count for bound, count in zip(bounds, counts)}
+    histogram[">{0}{1}".format(bounds[-1], unit)] = counts[-1]
+    return histogram
+
+
+def snapshot(value):
+    """
+    Copy the dicts and lists of event data, so the caller may change them after the event
+
+    :param value: event data
+    :return: (copy, approximate size in bytes)
+    :rtype: tuple
+    """
+    if isinstance(value, dict):
+        copy = {}
+        size = 0
+        for key, item in value.items():
+            copy[key], item_size = snapshot(item)
+            size += len(key) + item_size if isinstance(key, str) else item_size
+        return copy, size
+    if isinstance(value, (list, tuple)):
+        copy = []
+        size = 0
+        for item in value:
+            item_copy, item_size = snapshot(item)
+            copy.append(item_copy)
+            size += item_size
+        return copy, size
+    if isinstance(value, (str, bytes)):
+        # Immutable - kept by reference
+        return value, len(value)
+    if isinstance(value, bytearray):
+        return bytes(value), len(value)
+    return value, _VALUE_SIZE
+
+
+class StorageSink(object):
+    """
+    The queue of one storage handler. Records are stored oldest first - first the ones put
+    back after a failed store, then the spilled ones, then the ones in memory.
+    """
+
+    __slots__ = (
+        "source", "method", "records", "head", "spilled", "spilled_records", "writing",
+        "memory_bytes", "_lock", "_spill_lock",
+    )
+
+    def __init__(self, source, method):
+        self.source = source
+        self.method = method
+        # StorageRecords, oldest first. Appended by the triggering threads, taken from the
+        # left by the storage worker or to spill.
+        self.records = deque()
+        # Records that were taken but not stored, and records read back from disk
+        self.head = deque()
+        # (path, records, created of the first record) of the spill files, oldest first
+        self.spilled = deque()
+        self.spilled_records = 0
+        # Records being written to a spill file - older than the records left in memory
+        self.writing = []
+        # Size of the records in memory - head and records
+        self.memory_bytes = 0
+        self._lock = threading.Lock()
+        # Held while a spill file is written, without the lock - appends are not held up, and
+        # taking records waits until the older records being written are in the file
+        self._spill_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.head) + self.spilled_records + len(self.writing) + len(self.records)
+
+    def over_limits(self, max_records, max_bytes):
+        """ True if more than the records or bytes given are in memory """
+        return len(self.records) > max_records or self.memory_bytes > max_bytes
+
+    def append(self, record):
+        with self._lock:
+            self.records.append(record)
+            self.memory_bytes += record.size
+
+    def take(self, count):
+        """
+        Take the oldest records, reading spilled records back when they are next
+
+        :param int count: most records to take
+        :return: StorageRecords, oldest first
+        :rtype: list
+        """
+        with self._spill_lock:
+            with self._lock:
+                spilled = self.spilled[0] if not self.head and self.spilled else None
+            if spilled is not None:
+                # Read without the lock, so appends are not held up. The spill lock keeps the
+                # entry first in line - only this call removes it.
+                path, records, _created = spilled
+                read = [self._from_spill(body) for body in read_segment(path)]
+                with self._lock:
+                    self.spilled.popleft()
+                    self.spilled_records -= records
+                    self.head.extend(read)
+                    self.memory_bytes += sum(record.size for record in read)
+                os.remove(path)
+            with self._lock:
+                queue = self.head if self.head else self.records
+                batch = [queue.popleft() for _ in range(min(count, len(queue)))]
+                self.memory_bytes -= sum(record.size for record in batch)
+                return batch
+
+    def oldest_created(self):
+        """ Storage time of the oldest record; None if there are none """
+        with self._lock:
+            if self.head:
+                return self.head[0].created
+            if self.spilled:
+                return self.spilled[0][2]
+            if self.writing:
+                return self.writing[0].created
+            if self.records:
+                return self.records[0].created
+            return None
+
+    def put_back(self, records):
+        """ Return records that could not be stored to the front of the queue, in order """
+        with self._lock:
+            self.head.extendleft(reversed(records))
+            self.memory_bytes += sum(record.size for record in records)
+
+    def spill(self, path, keep_records, keep_bytes):
+        """
+        Move the oldest records in memory to a file until the rest are within the limits
+
+        :param str path: file for the records
+        :param int keep_records: records to keep in memory
+        :param int keep_bytes: bytes of records to keep in memory
+        :return: number of records spilled
+        :rtype: int
+        """
+        with self._spill_lock:
+            with self._lock:
+                while self.records and (
+                    len(self.head) + len(self.records) > keep_records
+                    or self.memory_bytes > keep_bytes
+                ):
+                    record = self.records.popleft()
+                    self.memory_bytes -= record.size
+                    self.writing.append(record)
+                batch = self.writing
+                if not batch:
+                    return 0
+            try:
+                write_segment(path, [
+                    {
+                        "event": record.event.name,
+                        "data": record.data,
+                        "size": record.size,
+                        "created": to_timestamp(record.created),
+                        "log_id": record.log_id,
+                    }
+                    for record in batch
+                ])
+            except Exception:
+                with self._lock:
+                    # Keep them in memory, in order
+                    self.records.extendleft(reversed(batch))
+                    self.memory_bytes += sum(record.size for record in batch)
+                    self.writing = []
+                raise
+            with self._lock:
+                self.spilled.append((path, len(batch), batch[0].created))
+                self.spilled_records += len(batch)
+                self.writing = []
+            return len(batch)
+
+    def clear_spill(self):
+        """ Delete the spill files - their records are read from the log at the next start """
+        with self._spill_lock, self._lock:
+            for path, _records, _created in self.spilled:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.spilled.clear()
+
+    def _from_spill(self, body):
+        return StorageRecord(
+            self.source,
+            StorageEvents[body["event"]],
+            self.method,
+            body["data"],
+            body["size"],
+            to_datetime(body["created"]),
+            body["log_id"],
+        )
+
+
+class StorageRecord(object):
+    """ One storage event waiting in the queue for one of its handlers """
+
+    __slots__ = ("source", "event", "method", "data", "size", "created", "log_id")
+
+    def __init__(self, source, event, method, data, size, created, log_id):
+        """
+        :param str source: source of the handler
+        :param StorageEvents event: the storage event
+        :param method: the handler
+        :param dict data: snapshot of the event data - shared by all handlers of the event
+        :param int size: approximate size of the data in bytes
+        :param datetime created: time of the storage event
+        :param int log_id: id of the record in the write-ahead log
+        """
+        setattr_ = object.__setattr__
+        setattr_(self, "source", source)
+        setattr_(self, "event", event)
+        setattr_(self, "method", method)
+        setattr_(self, "data", data)
+        setattr_(self, "size", size)
+        setattr_(self, "created", created)
+        setattr_(self, "log_id", log_id)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("StorageRecord is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("StorageRecord is immutable")
+
+    def to_handler_data(self):
+        """ The dict passed to the handler - a new top level dict for each call """
+        data = dict(self.data)
+        data["created"] = self.created
+        data["_event"] = self.event
+        data["_source"] = self.source
+        return data
+
+
+class StorageWorker(object):
+    """
+    Stores the queued records of one source on its own thread, with its own flush limits, so a
+    slow or unavailable source does not hold up the others
+    """
+
+    def __init__(
+        self,
+        storage,
+        source,
+        write_period=10,
+        flush_records=100,
+        flush_bytes=1024 * 1024,
+        flush_age=1.0,
+        batch_records=1000,
+        memory_records=50000,
+        memory_bytes=64 * 1024 * 1024,
+        max_pending_records=0,
+        lag_warning_s=120,
+    ):
+        """
+        :param DataStorage storage: the owner - for tool checkout, the log and spill files
+        :param str source: the source whose handlers this worker calls
+        :param float write_period: seconds to wait before retrying events that failed to store
+        :param int flush_records: store as soon as this many events are waiting
+        :param int flush_bytes: store as soon as this much event data is waiting
+        :param float flush_age: store once the oldest waiting event is this many seconds old
+        :param int batch_records: most records passed to a handler in one call
+        :param int memory_records: records of one handler kept in memory; the oldest of any
+            more are spilled to disk
+        :param int memory_bytes: bytes of records of one handler kept in memory
+        :param int max_pending_records: events that trigger storage wait while this many
+            records of the source are waiting to be stored; 0 to never wait
+        :param float lag_warning_s: warn when the oldest waiting record is this many seconds
+            old; 0 to never warn
+        """
+        self.source = source
+        self.write_period = float(write_period)
+        self.flush_records = int(flush_records)
+        self.flush_bytes = int(flush_bytes)
+        self.flush_age = float(flush_age)
+        self.batch_records = max(int(batch_records), 1)
+        self.memory_records = max(int(memory_records), 1)
+        self.memory_bytes = int(memory_bytes)
+        self.max_pending_records = int(max_pending_records)
+        self.lag_warning_s = float(lag_warning_s)
+
+        # Handler method to its StorageSink
+        self.sinks = {}
+        self._storage = storage
+        self._thread = None
+        self._spill_thread = None
+        self._is_shutdown = False
+
+        # Guards the counts; the worker waits on it until a flush is due
+        self._condition = threading.Condition()
+        self._pending_records = 0
+        self._pending_bytes = 0
+        # time.monotonic() when the oldest waiting event was queued
+        self._oldest_pending = None
+        self._flush_requested = False
+        # Sinks over their memory limits, for the spill thread
+        self._spill_requested = set()
+        # After a flush that could not store everything, no retry before this time
+        self._retry_at = None
+
+        # Flush measurements, for get_status
+        self._flush_count = 0
+        self._records_stored = 0
+        self._last_flush_ms = None
+        self._last_wait_ms = None
+        self._max_wait_ms = None
+        self._records_spilled = 0
+        self._producer_waits = 0
+        self._dead_lettered = 0
+        self._retries = 0
+        self._batches = 0
+        # One count per histogram bucket, and one for values above the last bucket
+        self._batch_buckets = [0] * (len(_BATCH_BUCKETS) + 1)
+        self._flush_buckets = [0] * (len(_FLUSH_BUCKETS_MS) + 1)
+        # (time.monotonic(), records) of the stores of the last _RATE_WINDOW_S seconds
+        self._recent_stores = deque()
+        self._started = time.monotonic()
+        # Storage time of the oldest record of the batch being stored
+        self._in_flight = None
+        self._lagging = False
+
+    def add_sink(self, method):
+        if method not in self.sinks:
+            self.sinks[method] = StorageSink(self.source, method)
+
+    def add(self, records, flush=False):
+        """
+        Place records into the queues of their handlers
+
+        :param list records: StorageRecords of this source
+        :param bool flush: store the records right away
+        """
+        with self._condition:
+            if self.max_pending_records and self._pending_records >= self.max_pending_records:
+                # Hard limit - hold the triggering thread until records are stored
+                self._producer_waits += 1
+                while (
+                    self._pending_records >= self.max_pending_records and not self._is_shutdown
+                ):
+                    self._condition.wait()
+            for record in records:
+                self.sinks[record.method].append(record)
+                self._pending_records += 1
+                self._pending_bytes += record.size
+
+            if flush:
+                self._flush_requested = True
+            if self._oldest_pending is None:
+                # Wake the worker to time the age of the first event
+                self._oldest_pending = time.monotonic()
+                self._condition.notify_all()
+            elif self._time_to_flush() == 0:
+                self._condition.notify_all()
+
+            for sink in set(self.sinks[record.method] for record in records):
+                if sink.over_limits(self.memory_records, self.memory_bytes):
+                    # High-water mark - the spill thread moves the oldest records to disk
+                    self._spill_requested.add(sink)
+                    self._condition.notify_all()
+
+    def flush(self):
+        """ Store the waiting events now, instead of when a flush limit is reached """
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+
+    def start(self):
+        self._thread = threading.Thread(
+            name="storage_worker:{0}".format(self.source), target=self._run
+        )
+        self._thread.start()
+        self._spill_thread = threading.Thread(
+            name="storage_spill:{0}".format(self.source), target=self._spill_loop
+        )
+        self._spill_thread.daemon = True
+        self._spill_thread.start()
+
+    def stop(self):
+        """ Stop after the running flush; waiting records stay in the log """
+        with self._condition:
+            self._is_shutdown = True
+            self._condition.notify_all()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def get_status(self):
+        with self._condition:
+            oldest = self._oldest_pending
+            oldest_record_s = self._oldest_record_age()
+            return {
+                "pending_records": self._pending_records,
+                "pending_bytes": self._pending_bytes,
+                "oldest_pending_s": time.monotonic() - oldest if oldest is not None else None,
+                "flushes": self._flush_count,
+                # Records stored by the handler or moved to the dead-letter store
+                "records_stored": self._records_stored - self._dead_lettered,
+                "dead_lettered": self._dead_lettered,
+                "last_flush_ms": self._last_flush_ms,
+                # Time from the storage event to its data being stored
+                "last_wait_ms": self._last_wait_ms,
+                "max_wait_ms": self._max_wait_ms,
+                "flush_records": self.flush_records,
+                "flush_bytes": self.flush_bytes,
+                "flush_age_s": self.flush_age,
+                "batch_records": self.batch_records,
+                "memory_bytes": sum(sink.memory_bytes for sink in self.sinks.values()),
+                "spilled_records": sum(sink.spilled_records for sink in self.sinks.values()),
+                "records_spilled": self._records_spilled,
+                "producer_waits": self._producer_waits,
+                # Age of the oldest record that is not stored yet - how far behind the source is
+                "oldest_record_s": oldest_record_s,
+                "lagging": self._lagging,
+                "lag_warning_s": self.lag_warning_s,
+                "records_per_s": self._records_per_second(),
+                # Flushes that could not store everything and were retried after write_period
+                "retries": self._retries,
+                "batches": self._batches,
+                "batch_histogram": _histogram(_BATCH_BUCKETS, self._batch_buckets, ""),
+                "flush_histogram": _histogram(_FLUSH_BUCKETS_MS, self._flush_buckets, "ms"),
+                "handlers": {
+                    method.__name__: {
+                        "pending_records": len(sink),
+                        "oldest_record_s": _age(sink.oldest_created()),
+                    }
+                    for method, sink in self.sinks.items()
+                },
+            }
+
+    def _oldest_record_age(self):
+        """ Seconds since the oldest record that is not stored yet was queued - call with the
+        condition held """
+        oldest = [sink.oldest_created() for sink in self.sinks.values()]
+        oldest = [created for created in oldest + [self._in_flight] if created is not None]
+        return _age(min(oldest)) if oldest else None
+
+    def _records_per_second(self):
+        """ Records stored per second over the last _RATE_WINDOW_S - call with the condition
+        held """
+        now = time.monotonic()
+        while self._recent_stores and self._recent_stores[0][0] < now - _RATE_WINDOW_S:
+            self._recent_stores.popleft()
+        window = min(_RATE_WINDOW_S, now - self._started)
+        if window <= 0:
+            return 0.0
+        return sum(records for _time, records in self._recent_stores) / window
+
+    def _time_to_flush(self):
+        """
+        Seconds until the next flush is due - 0 if due now, None if nothing is waiting. Call with
+        the condition held.
+        """
+        if self._pending_records == 0:
+            return None
+        now = time.monotonic()
+        if self._retry_at is not None and now < self._retry_at:
+            return self._retry_at - now
+        if (
+            self._flush_requested
+            or self._pending_records >= self.flush_records
+            or self._pending_bytes >= self.flush_bytes
+        ):
+            return 0
+        return max(self._oldest_pending + self.flush_age - now, 0)
+
+    def _wait_for_flush(self):
+        """ Block until a flush is due; raise StorageShutdown when shutting down """
+        with self._condition:
+            while True:
+                if self._is_shutdown:
+                    raise StorageShutdown("Shutdown requested")
+                timeout = self._time_to_flush()
+                if timeout == 0:
+                    break
+                self._condition.wait(timeout)
+            self._flush_requested = False
+            self._retry_at = None
+
+    def _flush_finished(self, started, failed):
+        """
+        Record the measurements of a flush and schedule a retry of what failed
+
+        :param float started: time.monotonic() when the flush began
+        :param bool failed: True if any waiting event could not be stored
+        """
+        with self._condition:
+            if self._pending_records == 0:
+                self._oldest_pending = None
+            else:
+                # What is left either failed or arrived during the flush
+                self._oldest_pending = time.monotonic()
+                if failed:
+                    self._retry_at = self._oldest_pending + self.write_period
+                    self._retries += 1
+
+            self._flush_count += 1
+            self._last_flush_ms = (time.monotonic() - started) * 1000
+            self._flush_buckets[bisect_left(_FLUSH_BUCKETS_MS, self._last_flush_ms)] += 1
+
+            age = self._oldest_record_age()
+            lagging = bool(self.lag_warning_s) and age is not None and age > self.lag_warning_s
+            changed = lagging is not self._lagging
+            self._lagging = lagging
+            pending = self._pending_records
+        if changed:
+            self._storage._lag_changed(self.source, lagging, age, pending)
+
+    def _acknowledge(self, records):
+        """ Remove stored records from the log and the pending counts """
+        if not records:
+            return
+        self._storage._log.ack([record.log_id for record in records])
+        self._storage._retrieval_cache.invalidate(set(record.event for record in records))
+        wait_ms = (get_utc_now() - min(record.created for record in records)).total_seconds()
+        wait_ms *= 1000
+        size = sum(record.size for record in records)
+        with self._condition:
+            self._pending_records -= len(records)
+            self._pending_bytes -= size
+            self._records_stored += len(records)
+            self._recent_stores.append((time.monotonic(), len(records)))
+            self._last_wait_ms = wait_ms
+            self._max_wait_ms = max(self._max_wait_ms or 0, wait_ms)
+            if self.max_pending_records:
+                self._condition.notify_all()
+
+    def _run(self):
+        """ Launched as a thread by "start". Will run until stopped """
+        try:
+            while True:
+                self._wait_for_flush()
+                started = time.monotonic()
+                stored, failed = self._flush()
+                self._flush_finished(started, failed)
+                if stored:
+                    emit_event_non_blocking(InfoEvents.STORAGE_COMPLETE, {})
+
+        except StorageShutdown:
+            # Shutdown received while waiting - part of a clean shutdown
+            pass
+        except Exception as e:
+            log.exception("Unexpected storage worker exception", e)
+            emit_event_non_blocking(ActionEvents.SHUTDOWN, {})
+        finally:
+            with self._condition:
+                # Also stops the spill thread after an unexpected exception
+                self._is_shutdown = True
+                self._condition.notify_all()
+            self._spill_thread.join()
+            for sink in self.sinks.values():
+                sink.clear_spill()
+            self._storage._worker_finished()
+
+    def _spill_loop(self):
+        """ Launched as a thread by "start" - moves records of the sinks over their memory limits
+        to disk, down to half of the limits """
+        while True:
+            with self._condition:
+                while not self._spill_requested and not self._is_shutdown:
+                    self._condition.wait()
+                if self._is_shutdown:
+                    return
+                sinks = list(self._spill_requested)
+                self._spill_requested.clear()
+            for sink in sinks:
+                try:
+                    spilled = sink.spill(
+                        self._storage._get_spill_path(), self.memory_records // 2,
+                        self.memory_bytes // 2,
+                    )
+                except Exception as e:
+                    # The records stay in memory; the next event over the limits tries again
+                    log.exception("Unable to spill storage records to disk", e)
+                    continue
+                with self._condition:
+                    self._records_spilled += spilled
+
+    def _flush(self):
+        """
+        Store the waiting records of every handler
+
+        :return: (number of records stored, True if any could not be stored)
+        :rtype: tuple
+        """
+        try:
+            tool_ref = self._storage._get_tool(self.source)
+        except (ToolInUseException, ToolUnavailableException):
+            # Tool cannot be reserved now - try again after write_period
+            log.debug(
+                4,
+                "Data storage source '{0}' is unavailable; will try "
+                "again later".format(self.source),
+            )
+            return 0, True
+
+        # Source is now reserved (if applicable)
+        stored = 0
+        failed = False
+        try:
+            for sink in list(self.sinks.values()):
+                # Records that arrive while storing stay queued for the next flush
+                remaining = len(sink)
+                while remaining > 0 and not self._is_shutdown:
+                    if tool_ref is not None and self._storage._retrievals_waiting(self.source):
+                        # Let waiting retrievals use the tool between batches
+                        self._storage._ret_tool(tool_ref)
+                        tool_ref = None
+                        self._storage._wait_for_retrievals(self.source)
+                        try:
+                            tool_ref = self._storage._get_tool(self.source)
+                        except (ToolInUseException, ToolUnavailableException):
+                            return stored, True
+                    batch = sink.take(min(remaining, self.batch_records))
+                    if not batch:
+                        break
+                    with self._condition:
+                        self._in_flight = batch[0].created
+                        self._batches += 1
+                        self._batch_buckets[bisect_left(_BATCH_BUCKETS, len(batch))] += 1
+                    done = self._store_records(sink, batch)
+                    self._acknowledge(batch[:done])
+                    stored += done
+                    remaining -= len(batch)
+                    if done < len(batch):
+                        # Put what was not stored back in front, in order
+                        sink.put_back(batch[done:])
+                        failed = True
+                    with self._condition:
+                        self._in_flight = None
+                    if done < len(batch):
+                        break
+        finally:
+            with self._condition:
+                self._in_flight = None
+            # If a tool was checked out earlier, return it now
+            self._storage._ret_tool(tool_ref)
+        return stored, failed
+
+    def _store_records(self, sink, batch):
+        """
+        Pass records to the handler of a sink - one call for each run of records of the same
+        event, in order
+
+        :param StorageSink sink: the handler
+        :param list batch: StorageRecords, oldest first
+        :return: how many records, from the start of the batch, were stored or moved to the
+            dead-letter store
+        :rtype: int
+        """
+        done = 0
+        for event, run in groupby(batch, key=attrgetter("event")):
+            run = list(run)
+            run_done = self._store_run(sink, event, run)
+            done += run_done
+            if run_done < len(run):
+                break
+        return done
+
+    def _store_run(self, sink, event, run):
+        """
+        Store records of one event. If the handler raises for reasons other than an unavailable
+        target, the records are stored in halves until the records it raises for are found;
+        those are moved to the dead-letter store. The handler must be atomic per call - the
+        halves are passed to it again, so records it stored before raising would be stored
+        twice.
+
+        :return: how many records, from the start of the run, were stored or moved to the
+            dead-letter store
+        :rtype: int
+        """
+        try:
+            sink.method(data=[record.to_handler_data() for record in run], evt=event)
+            return len(run)
+        except Exception as e:
+            if is_transient_error(e):
+                # Something didn't work - try again later
+                log.exception("Exception while processing data in storage worker", e)
+                return 0
+            if len(run) == 1:
+                return 1 if self._dead_letter(run[0], e) else 0
+            log.debug(
+                3,
+                "Storage handler {0}.{1} failed for {2} records ({3}); storing them "
+                "in halves".format(self.source, sink.method.__name__, len(run), e),
+            )
+
+        middle = len(run) // 2
+        done = self._store_run(sink, event, run[:middle])
+        if done < middle:
+            return done
+        return middle + self._store_run(sink, event, run[middle:])
+
+    def _dead_letter(self, record, error):
+        """
+        Move a record the handler raised for to the dead-letter store
+
+        :return: False if the store could not be written - the record is retried later
+        :rtype: bool
+        """
+        try:
+            entry_id = self._storage._dead_letters.add(record, error)
+        except Exception as e:
+            log.exception(
+                "Unable to move a {0} record of {1}.{2} to the dead-letter store; will try "
+                "again later".format(record.event.name, self.source, record.method.__name__),
+                e,
+            )
+            return False
+        with self._condition:
+            self._dead_lettered += 1
+        log.error(
+            "Storage handler {0}.{1} can not store a {2} record ({3}: {4}); moved it to the "
+            "dead-letter store as {5}".format(
+                self.source, record.method.__name__, record.event.name, type(error).__name__,
+                error, entry_id,
+            )
+        )
+        return True
+
+
+class RetrievalCache(object):
+    """
+    Results of retrieval handlers, by event and arguments. A result is returned until it is
+    'ttl' seconds old, or until records of a storage event it reads are stored.
+    """
+
+    def __init__(self, ttls):
+        """
+        :param dict ttls: RetrievalEvents to the seconds their results are kept; events that
+            are not in it are not cached
+        """
+        self._ttls = ttls
+        self._lock = threading.Lock()
+        # Event to OrderedDict of arguments key to (expiry time, result), least recently used
+        # first
+        self._results = {event: OrderedDict() for event in ttls}
+        # Storage event to the retrieval events that read its records
+        self._dependents = {}
+        for event in ttls:
+            for storage_event in _RETRIEVAL_DEPENDENCIES[event]:
+                self._dependents.setdefault(storage_event, []).append(event)
+        # Incremented by every invalidation - a result retrieved across one is not kept
+        self._generations = dict.fromkeys(ttls, 0)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def is_cached(self, event):
+        return event in self._ttls
+
+    def get(self, event, key, stale=False):
+        """
+        :param RetrievalEvents event: the retrieval
+        :param str key: the arguments of the retrieval, from `get_key`
+        :param bool stale: also return a result older than the TTL
+        :return: (True, copy of the result) or (False, None) if there is none, and the
+            generation to pass to `put`
+        :rtype: tuple
+        """
+        with self._lock:
+            results = self._results[event]
+            entry = results.get(key)
+            if entry is not None and (stale or entry[0] > time.monotonic()):
+                results.move_to_end(key)
+                if stale:
+                    self.stale_hits += 1
+                else:
+                    self.hits += 1
+                return (True, snapshot(entry[1])[0]), self._generations[event]
+            if not stale:
+                self.misses += 1
+            return (False, None), self._generations[event]
+
+    def put(self, event, key, result, generation):
+        """ Keep a result, unless records it reads were stored since `get` returned generation """
+        result = snapshot(result)[0]
+        with self._lock:
+            if self._generations[event] != generation:
+                return
+            results = self._results[event]
+            results[key] = (time.monotonic() + self._ttls[event], result)
+            results.move_to_end(key)
+            if len(results) > _RETRIEVAL_CACHE_ENTRIES:
+                results.popitem(last=False)
+
+    def invalidate(self, storage_events):
+        """ Drop the results that read records of these storage events """
+        with self._lock:
+            for storage_event in storage_events:
+                for event in self._dependents.get(storage_event, ()):
+                    self._generations[event] += 1
+                    if self._results[event]:
+                        self._results[event].clear()
+                        self.invalidations += 1
+
+    def get_status(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": sum(len(results) for results in self._results.values()),
+            }
+
+    @staticmethod
+    def get_key(data):
+        """ Key of the arguments of a retrieval """
+        return simplejson.dumps(data, sort_keys=True, default=str)
+
+
 class DataStorage(object):
-    def __init__(self, write_period=10):
-        self._write_period = write_period
+    def __init__(
+        self,
+        write_period=10,
+        flush_records=100,
+        flush_bytes=1024 * 1024,
+        flush_age=1.0,
+        batch_records=1000,
+        memory_records=50000,
+        memory_bytes=64 * 1024 * 1024,
+        max_pending_records=0,
+        lag_warning_s=120,
+        log_segment_bytes=4 * 1024 * 1024,
+        log_sync_period=0.05,
+        sinks=None,
+        retrieval_ttl=60,
+        retrieval_ttls=None,
+    ):
+        """
+        The storage limits apply to each source separately; 'sinks' changes them for single
+        sources.
+
+        :param float write_period: seconds to wait before retrying events that failed to store
+        :param int flush_records: store as soon as this many events are waiting
+        :param int flush_bytes: store as soon as this much event data is waiting
+        :param float flush_age: store once the oldest waiting event is this many seconds old
+        :param int batch_records: most records passed to a handler in one call
+        :param int memory_records: records of one handler kept in memory; the oldest of any
+            more are spilled to disk
+        :param int memory_bytes: bytes of records of one handler kept in memory
+        :param int max_pending_records: events that trigger storage wait while this many
+            records of a source are waiting to be stored; 0 to never wait
+        :param float lag_warning_s: warn when the oldest waiting record of a source is this
+            many seconds old; 0 to never warn
+        :param int log_segment_bytes: size of the segment files of the write-ahead log
+        :param float log_sync_period: longest time between a storage event and syncing it to
+            disk
+        :param dict sinks: [optional] source to a dict of the limits above that are different
+            for that source
+        :param float retrieval_ttl: seconds the results of a retrieval are kept; 0 to not keep
+            them
+        :param dict retrieval_ttls: [optional] RetrievalEvents name to its retrieval_ttl, where
+            it is different
+        """
+        self._worker_settings = {
+            "write_period": write_period,
+            "flush_records": flush_records,
+            "flush_bytes": flush_bytes,
+            "flush_age": flush_age,
+            "batch_records": batch_records,
+            "memory_records": memory_records,
+            "memory_bytes": memory_bytes,
+            "max_pending_records": max_pending_records,
+            "lag_warning_s": lag_warning_s,
+        }
+        self._sink_settings = sinks or {}
+
+        ttls = {}
+        for event in _RETRIEVAL_DEPENDENCIES:
+            ttl = float((retrieval_ttls or {}).get(event.name, retrieval_ttl))
+            if ttl > 0:
+                ttls[event] = ttl
+        self._retrieval_cache = RetrievalCache(ttls)
+        # Source to the number of retrievals that want or hold its tool - a storage worker
+        # returns the tool to them between batches
+        self._retrieval_waiters = {}
+        self._retrieval_condition = threading.Condition()
 
         self._storage_events = {}
         self._retrieval_events = {}  # type: dict(str, tuple)
-        self._storage_queue = {}
-        self._worker = None
+        # Source to its StorageWorker
+        self._workers = {}
+        self._running_workers = 0
+        self._workers_lock = threading.Lock()
         self._is_shutdown = False
         self._is_initialized = False
 
@@ -202,8 +1229,20 @@ class DataStorage(object):
         self._return_tool_storage = None
         self._return_tool_retrieval = None
 
-        self._cache_path = os.path.join(get_all_paths()["data_folder"], _STORAGE_FILE)
-        # self._cache_path = _STORAGE_FILE
+        data_folder = get_all_paths()["data_folder"]
+        self._cache_path = os.path.join(data_folder, _STORAGE_FILE)
+        self._log = StorageLog(
+            os.path.join(data_folder, _STORAGE_LOG_FOLDER), log_segment_bytes, log_sync_period
+        )
+        # Entries of previous runs that were never stored - queued in initialize, once their
+        # handlers are registered
+        self._recovered = self._log.open()
+        self._dead_letters = DeadLetterStore(os.path.join(data_folder, _DEAD_LETTER_FOLDER))
+        # Spill files of a previous run hold records that are in the log - start empty
+        self._spill_folder = os.path.join(data_folder, _SPILL_FOLDER)
+        shutil.rmtree(self._spill_folder, ignore_errors=True)
+        os.makedirs(self._spill_folder)
+        self._spill_files = count(1)
 
         # Initialize storage event lists to empty
         for event in list(StorageEvents):
@@ -225,14 +1264,15 @@ class DataStorage(object):
         self._handler_audit()
 
         # Check if there is any leftover data from previous runs
+        self._replay_log()
         self._load_queue_from_file()
 
         # Must wait to run this until the end of initializations, after all handlers
         # have been registered
-        self._worker = threading.Thread(
-            name="storage_worker", target=self._storage_worker
-        )
-        self._worker.start()
+        with self._workers_lock:
+            self._running_workers = len(self._workers)
+        for worker in self._workers.values():
+            worker.start()
 
         self._is_initialized = True
 
@@ -250,6 +1290,143 @@ class DataStorage(object):
     def shutdown(self):
         """ Cleanup """
         self._is_shutdown = True
+        for worker in self._workers.values():
+            worker.stop()
+        with self._workers_lock:
+            running = self._running_workers
+        if running == 0:
+            self._log.close()
+
+    def join(self, timeout=None):
+        """ Wait for the storage workers to stop after `shutdown` """
+        for worker in self._workers.values():
+            worker.join(timeout)
+
+    def flush(self):
+        """ Store the waiting events of every source now """
+        for worker in self._workers.values():
+            worker.flush()
+
+    def get_status(self):
+        """
+        Get the state of the storage queues and measurements of the flushes so far - totals,
+        and each source in "sinks"
+
+        :rtype: dict
+        """
+        sinks = {source: worker.get_status() for source, worker in self._workers.items()}
+        waits = [sink["max_wait_ms"] for sink in sinks.values() if sink["max_wait_ms"] is not None]
+        ages = [
+            sink["oldest_record_s"] for sink in sinks.values()
+            if sink["oldest_record_s"] is not None
+        ]
+        return {
+            "pending_records": sum(sink["pending_records"] for sink in sinks.values()),
+            "pending_bytes": sum(sink["pending_bytes"] for sink in sinks.values()),
+            "flushes": sum(sink["flushes"] for sink in sinks.values()),
+            "records_stored": sum(sink["records_stored"] for sink in sinks.values()),
+            "records_per_s": sum(sink["records_per_s"] for sink in sinks.values()),
+            "retries": sum(sink["retries"] for sink in sinks.values()),
+            "max_wait_ms": max(waits) if waits else None,
+            "oldest_record_s": max(ages) if ages else None,
+            "lagging": sorted(source for source, sink in sinks.items() if sink["lagging"]),
+            "sinks": sinks,
+            "log": self._log.get_status(),
+            "retrieval_cache": self._retrieval_cache.get_status(),
+        }
+
+    def get_lag_warnings(self):
+        """
+        Describe the sources whose oldest waiting record is older than their 'lag_warning_s',
+        for the station health
+
+        :return: one message for each lagging source
+        :rtype: list
+        """
+        warnings = []
+        for source, worker in self._workers.items():
+            status = worker.get_status()
+            age = status["oldest_record_s"]
+            if worker.lag_warning_s and age is not None and age > worker.lag_warning_s:
+                warnings.append(
+                    "Storage to '{0}' is {1:.0f} s behind ({2} records waiting)".format(
+                        source, age, status["pending_records"]
+                    )
+                )
+        return warnings
+
+    def get_dead_letters(self, source=None):
+        """
+        Get the records that were moved to the dead-letter store
+
+        :param str source: [optional] only the records of this source
+        :return: entries with the record, the exception and an "id"
+        :rtype: list
+        """
+        return self._dead_letters.get_entries(source)
+
+    def requeue_dead_letter(self, entry_id, data=None):
+        """
+        Move a record from the dead-letter store back into the queue of its handler
+
+        :param str entry_id: id of the entry
+        :param dict data: [optional] fixed data to store instead of the original
+        :return: False if there is no such entry
+        :rtype: bool
+        :raise KeyError: if the handler of the record is not registered
+        """
+        entry = self._dead_letters.get(entry_id)
+        if entry is None:
+            return False
+        if data is not None:
+            entry["data"] = data
+        try:
+            queue_entry = self._from_log_record(entry)
+        except Exception as e:
+            raise KeyError(str(e))
+        if self._dead_letters.remove(entry_id) is None:
+            # Requeued or discarded meanwhile
+            return False
+        self._enqueue([queue_entry], flush=True)
+        return True
+
+    def discard_dead_letter(self, entry_id):
+        """
+        Delete a record from the dead-letter store
+
+        :param str entry_id: id of the entry
+        :return: False if there is no such entry
+        :rtype: bool
+        """
+        return self._dead_letters.remove(entry_id) is not None
+
+    def _get_spill_path(self):
+        return os.path.join(self._spill_folder, "{0:08d}.spill".format(next(self._spill_files)))
+
+    def _lag_changed(self, source, lagging, age, pending):
+        """ Called by a StorageWorker when its oldest waiting record passes 'lag_warning_s', or
+        when it catches up again """
+        if lagging:
+            log.warning(
+                "Storage to '{0}' is {1:.0f} s behind ({2} records waiting)".format(
+                    source, age, pending
+                )
+            )
+        else:
+            log.info("Storage to '{0}' caught up".format(source))
+        emit_event_non_blocking(
+            InfoEvents.STORAGE_LAG,
+            {"source": source, "lagging": lagging, "oldest_record_s": age, "pending": pending},
+        )
+
+    def _worker_finished(self):
+        """ Called by each StorageWorker as it stops; the last one closes the log """
+        with self._workers_lock:
+            self._running_workers -= 1
+            last = self._running_workers == 0
+        if last:
+            # Outstanding data stays in the log to be processed in the next session
+            self._log.close()
 
     def _handler_audit(self):
         """
@@ -308,6 +1485,10 @@ class DataStorage(object):
             RetrievalEvents.GET_OPERATION_AVERAGE_DURATION,
             StorageEvents.ON_OPERATION_END,
         )
+        check_required_pair(
+            RetrievalEvents.GET_OPERATION_DURATION_STATISTICS,
+            StorageEvents.ON_OPERATION_END,
+        )
         # Log
         check_required_pair(RetrievalEvents.GET_LOG_DATA, StorageEvents.ON_LOG_DATA)
         # Maintenance
@@ -357,6 +1538,10 @@ class DataStorage(object):
             "Registering data storage handler {0}.{1}".format(source, method.__name__),
         )
         self._storage_events[event].append((source, event, method))
+        if source not in self._workers:
+            settings = dict(self._worker_settings, **self._sink_settings.get(source, {}))
+            self._workers[source] = StorageWorker(self, source, **settings)
+        self._workers[source].add_sink(method)
 
     def _register_for_retrieval_event(self, source, event, method):
         """
@@ -396,24 +1581,49 @@ class DataStorage(object):
         """
         assert isinstance(event, StorageEvents)
         assert type(data) is dict
-        for storage in self._storage_events[event]:
-            source, evt, method = storage
-
-            # Queues are organized by sources to streamline tool accesses
-            if source not in self._storage_queue:
-                self._storage_queue[source] = {}
-            if method not in self._storage_queue[source]:
-                self._storage_queue[source][method] = []
-
-            # Place data and timestamp into write queue
-            self._storage_queue[source][method].append(
-                (source, evt, method, simplejson.dumps(data), get_utc_now())
-            )
+        handlers = self._storage_events[event]
+        if not handlers:
+            return
+        data, size = snapshot(data)
+        created = get_utc_now()
+        self._enqueue(
+            [(source, evt, method, data, size, created) for source, evt, method in handlers],
+            flush=event is StorageEvents.ON_SEQUENCE_END,
+        )
+
+    def _enqueue(self, entries, flush=False, log_ids=None):
+        """
+        Write entries to the log and place them into the work queue
+
+        :param list entries: (source, event, method, data, size, storage time) - the arguments
+            of `StorageRecord` without the log id
+        :param bool flush: store the entries right away
+        :param list log_ids: [optional] ids of entries that are already in the log
+        """
+        if log_ids is None:
+            log_ids = self._log.append([
+                {
+                    "source": source,
+                    "event": event.name,
+                    "method": method.__name__,
+                    "data": data,
+                    "created": to_timestamp(created),
+                }
+                for source, event, method, data, _size, created in entries
+            ])
+        by_source = {}
+        for entry, log_id in zip(entries, log_ids):
+            record = StorageRecord(*entry, log_id=log_id)
+            by_source.setdefault(record.source, []).append(record)
+        # flush - store the results of a finished sequence right away
+        for source, records in by_source.items():
+            self._workers[source].add(records, flush)
 
     def _trigger_retrieval_event(self, event, data):
         """
         Cause the specified retrieval event to fire, which calls the registered event handler
-        (if it exists). Event is processed immediately and data is returned to the caller
+        (if it exists). Event is processed immediately and data is returned to the caller. The
+        results of the retrievals in _RETRIEVAL_DEPENDENCIES are kept in the retrieval cache.
 
         :param RetrievalEvents event: identifier for the event that will trigger
         :param dict data: all data that the handler may need to process the event
@@ -424,32 +1634,56 @@ class DataStorage(object):
         if event not in self._retrieval_events:
             return None
 
-        ret = None
         retrieval = self._retrieval_events[event]  # type: tuple
-        if retrieval is not None:
-            tool_ref = None
-            source, evt, method = retrieval
-            data["source"] = source
-            data["event"] = evt
-
-            # If this source is a tool, check it out to prevent other processes from accessing it.
-            # Since the event has a method tied to it, we will not use the tool object that we
-            # checkout, but checking it out will lock it to this process for the duration.
-            # Source = None indicates a non-tool based storage method and will not need a tool
-            # checkout
-            if source.startswith("tool."):
+        if retrieval is None:
+            return None
+
+        cache = self._retrieval_cache
+        cached = cache.is_cached(event)
+        if cached:
+            key = cache.get_key(data)
+            (found, ret), generation = cache.get(event, key)
+            if found:
+                return ret
+
+        ret = None
+        tool_ref = None
+        source, evt, method = retrieval
+        data["source"] = source
+        data["event"] = evt
+
+        # If this source is a tool, check it out to prevent other processes from accessing it.
+        # Since the event has a method tied to it, we will not use the tool object that we
+        # checkout, but checking it out will lock it to this process for the duration.
+        # Source = None indicates a non-tool based storage method and will not need a tool
+        # checkout
+        is_tool = source.startswith("tool.")
+        if is_tool:
+            if self._checkout_tool_retrieval is None:
+                return None
+            # Ask the storage worker of the tool to return it between batches
+            with self._retrieval_condition:
+                self._retrieval_waiters[source] = self._retrieval_waiters.get(source, 0) + 1
+
+        try:
+            if is_tool:
                 # Source is a tool - checkout the tool to prevent other processes from using it
                 # and allow all exceptions to bubble out
                 _, tool_id = source.split(".", 1)
-                if self._checkout_tool_retrieval is not None:
-                    # TODO Increase robustness (wait longer? log failed attempts? show number of attempts,
-                    #  who has the tool already, etc
-                    tool_ref = self._checkout_tool_retry_exp(tool_id, 5)
-                else:
-                    return None
+                try:
+                    tool_ref = self._checkout_tool_retrieval(tool_id)
+                except (ToolInUseException, ToolUnavailableException):
+                    if cached:
+                        (found, ret), _ = cache.get(event, key, stale=True)
+                        if found:
+                            # The tool is busy - an expired result beats waiting for it
+                            return ret
+                    tool_ref = self._checkout_tool_retry(tool_id)
 
             try:
                 ret = method(**data)
+                if cached:
+                    cache.put(event, key, ret, generation)
             except Exception as e:
                 log.exception(
                     "Exception while processing retrieval method '{0}' for "
@@ -465,27 +1699,52 @@ class DataStorage(object):
                     log.exception("Unable to return tool in trigger retrieval event", e)
 
             return ret
+        finally:
+            if is_tool:
+                with self._retrieval_condition:
+                    self._retrieval_waiters[source] -= 1
+                    self._retrieval_condition.notify_all()
 
-    def _checkout_tool_retry_exp(self, tool_id, num_retries):
-        assert num_retries >= 0
-
-        delays = [0.25 * (2 ** x) for x in range(num_retries)]
-
-        for idx, n in enumerate(delays):
+    def _checkout_tool_retry(self, tool_id):
+        """
+        Check out the tool of a retrieval, trying again every _RETRIEVAL_CHECKOUT_POLL seconds
+        for up to _RETRIEVAL_CHECKOUT_TIMEOUT seconds. A storage worker that is flushing to the
+        tool returns it after its current batch.
+        """
+        end = time.monotonic() + _RETRIEVAL_CHECKOUT_TIMEOUT
+        while True:
             try:
                 return self._checkout_tool_retrieval(tool_id)
             except (ToolInUseException, ToolUnavailableException):
                 if self._is_shutdown:
                     # Shutting down - return value is unimportant
                     return None
-                if idx >= num_retries - 1:
+                if time.monotonic() >= end:
                     raise
-                time.sleep(n)
+                time.sleep(_RETRIEVAL_CHECKOUT_POLL)
+
+    def _retrievals_waiting(self, source):
+        """ Whether a retrieval wants or holds the tool of a source """
+        with self._retrieval_condition:
+            return self._retrieval_waiters.get(source, 0) > 0
+
+    def _wait_for_retrievals(self, source):
+        """
+        Block until no retrieval wants or holds the tool of a source, for at most
+        _RETRIEVAL_YIELD_TIMEOUT seconds so a stream of retrievals can not stop storage
+        """
+        end = time.monotonic() + _RETRIEVAL_YIELD_TIMEOUT
+        with self._retrieval_condition:
+            while self._retrieval_waiters.get(source, 0) > 0 and not self._is_shutdown:
+                timeout = end - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._retrieval_condition.wait(timeout)
 
     def _load_queue_from_file(self):
         """
-        Load queue data from file and populate storage_queue with data storage requests from
-        previous runs
+        Load the queue file of older versions, which saved the queue only at shutdown, into the
+        log and the storage queue
         :return: None
         """
         if os.path.exists(self._cache_path):
@@ -499,165 +1758,70 @@ class DataStorage(object):
             )
             with open(self._cache_path, "r") as f:
                 queue_data = f.readlines()
-            # Read was successful - delete file
-            os.remove(self._cache_path)
         else:
             log.debug(5, "No previous data queue file found to read from")
             return
 
-        def rehydrate(chunk):
-            """ Turn JSON string into valid queue data """
-            obj = simplejson.loads(chunk)
-            source = (
-                None
-                if (obj["source"] == 'null' or obj["source"] == 'None')
-                else obj["source"]
-            )
-            event = StorageEvents[obj["event"]]
-
-            method = None
-            method_name = obj["method"]
-            # Search through currently registered events for the same source as this object
-            # and try to find a handler method with the same name as this one from the same
-            # source. If found, assign that callback to this queue item
-            for evt in self._storage_events[event]:
-                if evt[0] == source and evt[2].__name__ == method_name:
-                    method = evt[2]
-            if method is None:
-                raise Exception(
-                    "Unable to find active method to assign to previous data queue "
-                    "item. Cannot locate {0}.{1}".format(source, method_name)
-                )
-
-            data_blob = obj["data"]
-            storage_time = to_datetime(obj["created"])
-            return source, event, method, data_blob, storage_time
-
+        entries = []
         for data in queue_data:
             try:
-                queue_entry = rehydrate(data)
+                entries.append(self._from_log_record(simplejson.loads(data)))
             except Exception as e:
                 log.exception(
                     "Failed to load object from previous run storage queue", e
                 )
-                continue
-            else:
-                data_source = queue_entry[0]
-                method = queue_entry[2]
-                if data_source not in self._storage_queue:
-                    self._storage_queue[data_source] = {}
-                if method not in self._storage_queue[data_source]:
-                    self._storage_queue[data_source][method] = []
-                self._storage_queue[data_source][method].append(queue_entry)
-
-    def _dump_queue_to_file(self):
-        """
-        Process items still remaining in storage queue and write them out to file for
-        processing next time
-        :return:
-        """
-
-        def dehydrate(chk):
-            """ Turn queue data into JSON string """
-            src, event, mthd, data, storage_time = chk
-            obj = {
-                "source": src,
-                "event": event.name,
-                "method": mthd.__name__,
-                "data": data,
-                "created": to_timestamp(storage_time),
-            }
-            return simplejson.dumps(obj)
-
-        for source in self._storage_queue.keys():
-            to_delete = []
-            for method in self._storage_queue[source].keys():
-                for chunk in self._storage_queue[source][method]:
-                    with open(self._cache_path, "a") as f:
-                        f.write("{0}\n".format(dehydrate(chunk)))
-                to_delete.append((source, method))
-            for del_source, del_method in to_delete:
-                # Remove processed data from the queue
-                del self._storage_queue[del_source][del_method]
-
-    def _sleep(self):
-        """ Sleep for looping with checks for shutdown signal to aid in quick shutdown """
-        period = float(self._write_period) / 0.5
-        for _idx in range(int(period)):
-            if self._is_shutdown:
-                raise StorageShutdown("Shutdown requested")
-            time.sleep(0.5)
-
-    def _storage_worker(self):
-        """ Launched as a thread inside "initialize". Will run until self._is_shutdown is True """
-        # from timeit import default_timer
-
-        try:
-            while not self._is_shutdown:
-                did_write_data = False
-                storage_sources = list(self._storage_queue.keys())
-                for source in storage_sources:
-                    if self._is_shutdown:
-                        break
-
-                    if len(self._storage_queue[source]) == 0:
-                        # Queue is empty - no need to process
-                        continue
-
-                    try:
-                        tool_ref = self._get_tool(source)
-                    except (ToolInUseException, ToolUnavailableException):
-                        # Tool cannot be reserved now - try again on the next loop iteration
-                        log.debug(
-                            4,
-                            "Data storage source '{0}' is unavailable; will try "
-                            "again later".format(source),
-                        )
-                        continue
-
-                    # Source is now reserved (if applicable)
-                    # Attempt to process all items in the queue for this source
-                    methods = list(self._storage_queue[source].keys())
-                    for method in methods:
-                        if self._is_shutdown:
-                            break
-
-                        try:
-                            stored_records = self._store_records(source, method)
-                            did_write_data = True
-                        except Exception as e:
-                            # Something didn't work - exit and try again later
-                            log.exception(
-                                "Exception while processing data in storage worker", e
-                            )
-                            continue
-
-                        records = self._storage_queue[source][method]
-
-                        for record in stored_records:
-                            records.remove(record)
-
-                        if len(records) == 0:
-                            del self._storage_queue[source][method]
-                            continue
-
-                    # If a tool was checked out earlier, return it now
-                    self._ret_tool(tool_ref)
-
-                # Writing finished for now - rest for a while
-                if did_write_data:
-                    emit_event_non_blocking(InfoEvents.STORAGE_COMPLETE, {})
-                self._sleep()
+        self._enqueue(entries, flush=True)
+        # The entries are in the log now - delete file
+        os.remove(self._cache_path)
+
+    def _replay_log(self):
+        """ Place the entries that were never stored in a previous run back into the queue """
+        entries = []
+        log_ids = []
+        dropped = []
+        for record in self._recovered:
+            try:
+                entries.append(self._from_log_record(record))
+                log_ids.append(record["id"])
+            except Exception as e:
+                log.exception("Failed to load object from previous run storage log", e)
+                dropped.append(record["id"])
+        self._recovered = []
+        if entries:
+            log.debug(3, "Storing {0} entries from the previous run".format(len(entries)))
+            self._enqueue(entries, flush=True, log_ids=log_ids)
+        self._log.ack(dropped)
+
+    def _from_log_record(self, obj):
+        """ Turn a record of the storage log (or the queue file) into valid queue data """
+        source = (
+            None
+            if (obj["source"] == 'null' or obj["source"] == 'None')
+            else obj["source"]
+        )
+        event = StorageEvents[obj["event"]]
+
+        method = None
+        method_name = obj["method"]
+        # Search through currently registered events for the same source as this object
+        # and try to find a handler method with the same name as this one from the same
+        # source. If found, assign that callback to this queue item
+        for evt in self._storage_events[event]:
+            if evt[0] == source and evt[2].__name__ == method_name:
+                method = evt[2]
+        if method is None:
+            raise Exception(
+                "Unable to find active method to assign to previous data queue "
+                "item. Cannot locate {0}.{1}".format(source, method_name)
+            )
 
-        except StorageShutdown:
-            # Shutdown received while sleeping - part of a clean shutdown
-            pass
-        except Exception as e:
-            log.exception("Unexpected storage worker exception", e)
-            emit_event_non_blocking(ActionEvents.SHUTDOWN, {})
-        finally:
-            # On exit, always save all outstanding data to be processed in the next session
-            self._dump_queue_to_file()
+        data_blob = obj["data"]
+        if isinstance(data_blob, str):
+            # Queue file of older versions - data is a JSON string
+            data_blob = simplejson.loads(data_blob)
+        data, size = snapshot(data_blob)
+        storage_time = to_datetime(obj["created"])
+        return source, event, method, data, size, storage_time
 
     def _get_tool(self, source):
         # If this source is a tool, check it out to prevent other processes from
@@ -689,28 +1853,6 @@ class DataStorage(object):
             except Exception as e:
                 log.exception("Unable to return tool in storage worker", e)
 
-    def _store_records(self, source, method):
-        """ Store all records that share the same source and call-back method (but perhaps different events) """
-        formatted_records = {}
-        stored_records = []
-
-        for record in self._storage_queue[source][method]:
-            _src, event, _method, json_data, storage_time = record
-            if event not in formatted_records:
-                formatted_records[event] = []
-
-            data = simplejson.loads(json_data)
-            data["created"] = storage_time
-            data["_event"] = event
-            data["_source"] = source
-
-            formatted_records[event].append(data)
-            stored_records.append(record)
-        for evt in formatted_records.keys():
-            method(data=formatted_records[evt], evt=evt)
-
-        return stored_records
-
 if __name__ == "__main__":
 
     def checkout_tool(source):
@@ -0,0 +1,119 @@
+# Copyright 2004-present Facebook. All Rights Reserved.
+
+# @lint-ignore-every PYTHON3COMPATIMPORTS1
+
+"""
+Dead-letter store of storage records that a handler can not store.
+
+When a handler raises for a batch of records, and the error does not say that the storage
+target is unavailable (see `.is_transient_error`), DataStorage splits the batch in halves and
+stores them separately until the records that make the handler raise are found. Those records
+are moved here, with the exception, so the records after them are stored as usual.
+
+Each handler has a file of its own in the 'storage_dead_letter' folder of the data folder, with
+one entry per frame of the storage log format (see `stationexec.station.storage_log`), so bytes
+values are written as they are. The entries can be inspected, fixed and requeued, or discarded,
+with the ``/station/storage/deadletter`` endpoint.
+"""
+
+import os
+import re
+import threading
+
+from stationexec.station.storage_log import read_segment, write_segment
+from stationexec.utilities.time import get_utc_formated, to_timestamp
+from stationexec.utilities.uuidstr import get_uuid
+
+_SUFFIX = ".log"
+
+
+class DeadLetterStore(object):
+    def __init__(self, folder):
+        """
+        :param str folder: folder of the dead-letter files; created if missing
+        """
+        self._folder = folder
+        self._lock = threading.Lock()
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    def add(self, record, error):
+        """
+        Move a record to the store
+
+        :param StorageRecord record: the record the handler raised for
+        :param Exception error: what the handler raised
+        :return: id of the entry
+        :rtype: str
+        """
+        entry = {
+            "id": get_uuid(),
+            "source": record.source,
+            "method": record.method.__name__,
+            "event": record.event.name,
+            "data": record.data,
+            "created": to_timestamp(record.created),
+            "exception": type(error).__name__,
+            "error": str(error),
+            "failed_at": get_utc_formated(),
+        }
+        with self._lock:
+            write_segment(self._path(entry["source"], entry["method"]), [entry], append=True)
+        return entry["id"]
+
+    def get_entries(self, source=None):
+        """
+        Get the entries in the store
+
+        :param str source: [optional] only the entries of this source
+        :return: entry dicts, oldest first for each handler
+        :rtype: list
+        """
+        entries = []
+        with self._lock:
+            for name in sorted(os.listdir(self._folder)):
+                if name.endswith(_SUFFIX):
+                    entries.extend(read_segment(os.path.join(self._folder, name)))
+        if source is not None:
+            entries = [entry for entry in entries if entry["source"] == source]
+        return entries
+
+    def get(self, entry_id):
+        """
+        :param str entry_id: id of the entry
+        :return: the entry; None if there is none with this id
+        :rtype: dict
+        """
+        for entry in self.get_entries():
+            if entry["id"] == entry_id:
+                return entry
+        return None
+
+    def remove(self, entry_id):
+        """
+        Remove an entry from the store
+
+        :param str entry_id: id of the entry
+        :return: the entry; None if there is none with this id
+        :rtype: dict
+        """
+        with self._lock:
+            for name in os.listdir(self._folder):
+                if not name.endswith(_SUFFIX):
+                    continue
+                path = os.path.join(self._folder, name)
+                entries = read_segment(path)
+                for index, entry in enumerate(entries):
+                    if entry["id"] != entry_id:
+                        continue
+                    del entries[index]
+                    if not entries:
+                        os.remove(path)
+                    else:
+                        write_segment(path, entries)
+                    return entry
+        return None
+
+    def _path(self, source, method):
+        name = re.sub(r"[^\w.-]", "_", "{0}.{1}".format(source, method))
+        return os.path.join(self._folder, name + _SUFFIX)
@@ -0,0 +1,488 @@
+# Copyright 2004-present Facebook. All Rights Reserved.
+
+# @lint-ignore-every PYTHON3COMPATIMPORTS1
+
+"""
+Publish station events to other processes on the same machine.
+
+The `.EventBridge` listens on a Unix domain socket. A consumer connects, sends one frame with the
+list of topics it wants - event names such as ``InfoEvents.LOG``, or prefixes such as
+``InfoEvents.`` - and then receives a frame for every matching event. It may send a new topic
+list at any time; an empty list receives every published event.
+
+Frames are a 4-byte big-endian length followed by the body; the body of an event frame is the
+topic, the emit time and the payload, in the compact binary encoding of `.encode_value`.
+`.EventBridgeClient` reads them in Python.
+
+Events are stamped with their emit time on the emitting thread, then encoded once, on the
+bridge's own worker, and written to consumers without blocking. A consumer that falls more
+than ``max_pending_bytes`` behind is disconnected, so a slow consumer never slows down the
+station.
+"""
+
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+
+from stationexec.logger import log
+from stationexec.station.events import (
+    register_for_event,
+    unregister_from_event,
+    AsyncSubscriber,
+    Overflow,
+    InfoEvents,
+)
+
+_FRAME_HEADER = struct.Struct("!I")
+# Largest frame a consumer may send - a topic list
+_MAX_CLIENT_FRAME_BYTES = 64 * 1024
+
+# Type tags of the value encoding
+_NONE = b"N"
+_TRUE = b"T"
+_FALSE = b"F"
+_INT = b"i"
+_FLOAT = b"d"
+_STR = b"s"
+_BYTES = b"b"
+_LIST = b"l"
+_DICT = b"m"
+
+_LENGTH = struct.Struct("!I")
+_INT64 = struct.Struct("!q")
+_DOUBLE = struct.Struct("!d")
+
+
+def _encode(value, out):
+    if value is None:
+        out += _NONE
+    elif value is True:
+        out += _TRUE
+    elif value is False:
+        out += _FALSE
+    elif isinstance(value, int) and -(2 ** 63) <= value < 2 ** 63:
+        out += _INT
+        out += _INT64.pack(value)
+    elif isinstance(value, float):
+        out += _FLOAT
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, (bytes, bytearray)):
+        out += _BYTES
+        out += _LENGTH.pack(len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        out += _LIST
+        out += _LENGTH.pack(len(value))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out += _DICT
+        out += _LENGTH.pack(len(value))
+        for key, item in value.items():
+            _encode(str(key), out)
+            _encode(item, out)
+    else:
+        # Strings, and anything else by its string form
+        data = str(value).encode("utf-8")
+        out += _STR
+        out += _LENGTH.pack(len(data))
+        out += data
+
+
+def encode_value(value):
+    """
+    Encode a value: None, bool, int, float, str, bytes, lists and dicts of them. Other objects
+    are encoded as their string form.
+
+    :rtype: bytes
+    """
+    out = bytearray()
+    _encode(value, out)
+    return bytes(out)
+
+
+def _decode(data, offset):
+    tag = data[offset:offset + 1]
+    offset += 1
+    if tag == _NONE:
+        return None, offset
+    if tag == _TRUE:
+        return True, offset
+    if tag == _FALSE:
+        return False, offset
+    if tag == _INT:
+        return _INT64.unpack_from(data, offset)[0], offset + _INT64.size
+    if tag == _FLOAT:
+        return _DOUBLE.unpack_from(data, offset)[0], offset + _DOUBLE.size
+
+    length = _LENGTH.unpack_from(data, offset)[0]
+    offset += _LENGTH.size
+    if tag == _STR:
+        return bytes(data[offset:offset + length]).decode("utf-8"), offset + length
+    if tag == _BYTES:
+        return bytes(data[offset:offset + length]), offset + length
+    if tag == _LIST:
+        items = []
+        for _ in range(length):
+            item, offset = _decode(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == _DICT:
+        items = {}
+        for _ in range(length):
+            key, offset = _decode(data, offset)
+            items[key], offset = _decode(data, offset)
+        return items, offset
+    raise ValueError("Unknown type tag {0!r} in event bridge data".format(tag))
+
+
+def decode_value(data):
+    """ Decode a value encoded with `.encode_value` """
+    value, _offset = _decode(data, 0)
+    return value
+
+
+def encode_frame(body):
+    """ Prefix an encoded body with its length """
+    return _FRAME_HEADER.pack(len(body)) + body
+
+
+def encode_event(topic, payload, timestamp=None):
+    """
+    Build the frame of one event
+
+    :param str topic: event name, as in 'InfoEvents.LOG'
+    :param dict payload: event data
+    :param float timestamp: [optional] emit time, seconds since the epoch; default now
+    :rtype: bytes
+    """
+    out = bytearray(_FRAME_HEADER.size)
+    _encode(topic, out)
+    _encode(time.time() if timestamp is None else timestamp, out)
+    _encode(payload, out)
+    _FRAME_HEADER.pack_into(out, 0, len(out) - _FRAME_HEADER.size)
+    return bytes(out)
+
+
+def decode_event(body):
+    """
+    Decode the body of an event frame
+
+    :return: (topic, timestamp, payload)
+    :rtype: tuple
+    """
+    topic, offset = _decode(body, 0)
+    timestamp, offset = _decode(body, offset)
+    payload, _offset = _decode(body, offset)
+    return topic, timestamp, payload
+
+
+class _EmitTimeStamper(object):
+    """ Queues each event on the bridge worker with the time it was emitted """
+
+    # Called with typed payloads as they are; they are only turned into dicts on the worker
+    receives_payload = True
+
+    def __init__(self, subscriber):
+        self.subscriber = subscriber
+
+    def __call__(self, *typed_payload, **payload):
+        self.subscriber(
+            {"_payload": typed_payload[0] if typed_payload else payload, "_emitted": time.time()}
+        )
+
+
+class _BridgeClient(object):
+    """ One connected consumer """
+
+    def __init__(self, connection):
+        self.connection = connection
+        # None until the consumer sends its topics - nothing is sent before that
+        self.topics = None
+        self.received = bytearray()
+        self.pending = bytearray()
+        self.dropped = False
+
+    def wants(self, topic):
+        if self.topics is None:
+            return False
+        if not self.topics:
+            return True
+        for prefix in self.topics:
+            if topic.startswith(prefix):
+                return True
+        return False
+
+
+class EventBridge(object):
+    """ Publishes selected events on a Unix domain socket """
+
+    def __init__(self, path, events=None, max_pending_bytes=1024 * 1024):
+        """
+        :param str path: path of the socket file
+        :param list events: [optional] events to publish; default all `.InfoEvents`
+        :param int max_pending_bytes: most bytes a consumer may fall behind before it is
+            disconnected
+        """
+        self.path = path
+        self.events = list(events) if events is not None else list(InfoEvents)
+        self.max_pending_bytes = int(max_pending_bytes)
+        # Consumers disconnected for falling behind
+        self.dropped_clients = 0
+
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._selector = None
+        self._server = None
+        self._thread = None
+        self._running = False
+        self._wake_read, self._wake_write = None, None
+        # Encodes and queues events on its own worker - never on the emitting thread
+        self._subscriber = AsyncSubscriber(
+            self._publish, maxsize=10000, overflow=Overflow.DROP_OLDEST, name="event-bridge"
+        )
+        self._stamper = _EmitTimeStamper(self._subscriber)
+
+    def start(self):
+        """ Open the socket and start publishing """
+        if os.path.exists(self.path):
+            # Left behind by a station that did not shut down cleanly
+            os.unlink(self.path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen()
+        self._server.setblocking(False)
+        self._wake_read, self._wake_write = socket.socketpair()
+        self._wake_read.setblocking(False)
+        self._wake_write.setblocking(False)
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._server, selectors.EVENT_READ)
+        self._selector.register(self._wake_read, selectors.EVENT_READ)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="event-bridge-io", daemon=True)
+        self._thread.start()
+
+        for event in self.events:
+            register_for_event("event_bridge", event, self._stamper)
+        log.info("Publishing events on '{0}'".format(self.path))
+
+    def stop(self):
+        """ Stop publishing and disconnect all consumers """
+        if not self._running:
+            return
+        for event in self.events:
+            unregister_from_event("event_bridge", event, self._stamper)
+        self._subscriber.close(1)
+        self._running = False
+        self._wake()
+        self._thread.join(2)
+
+    def get_status(self):
+        with self._lock:
+            clients = [
+                {"topics": client.topics, "pending_bytes": len(client.pending)}
+                for client in self._clients.values()
+            ]
+        return {
+            "path": self.path,
+            "clients": clients,
+            "dropped_clients": self.dropped_clients,
+            "queue_depth": self._subscriber.get_depth(),
+        }
+
+    def _publish(self, _payload, _emitted):
+        payload = dict(_payload) if isinstance(_payload, dict) else _payload.to_event_dict()
+        topic = str(payload.pop("_event"))
+        with self._lock:
+            clients = [client for client in self._clients.values() if client.wants(topic)]
+        if not clients:
+            return
+        frame = encode_event(topic, payload, _emitted)
+        with self._lock:
+            for client in clients:
+                if client.dropped:
+                    continue
+                if len(client.pending) + len(frame) > self.max_pending_bytes:
+                    client.dropped = True
+                    continue
+                client.pending += frame
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_write.send(b"\0")
+        except (BlockingIOError, OSError):
+            # Already woken, or stopped
+            pass
+
+    def _run(self):
+        try:
+            while self._running:
+                self._update_write_interest()
+                for key, mask in self._selector.select(timeout=1):
+                    if key.fileobj is self._server:
+                        self._accept()
+                    elif key.fileobj is self._wake_read:
+                        self._drain_wake()
+                    else:
+                        client = key.data
+                        if mask & selectors.EVENT_READ:
+                            self._read(client)
+                        if mask & selectors.EVENT_WRITE:
+                            self._write(client)
+        except Exception as e:
+            log.exception("Event bridge stopped", e)
+        finally:
+            self._close()
+
+    def _accept(self):
+        try:
+            connection, _address = self._server.accept()
+        except (BlockingIOError, OSError):
+            return
+        connection.setblocking(False)
+        client = _BridgeClient(connection)
+        with self._lock:
+            self._clients[connection.fileno()] = client
+        self._selector.register(connection, selectors.EVENT_READ, client)
+
+    def _drain_wake(self):
+        try:
+            while self._wake_read.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _update_write_interest(self):
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            if client.dropped:
+                self.dropped_clients += 1
+                log.warning("Event bridge consumer fell behind - disconnected")
+                self._disconnect(client)
+                continue
+            events = selectors.EVENT_READ
+            if client.pending:
+                events |= selectors.EVENT_WRITE
+            if self._selector.get_key(client.connection).events != events:
+                self._selector.modify(client.connection, events, client)
+
+    def _read(self, client):
+        try:
+            data = client.connection.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._disconnect(client)
+            return
+        client.received += data
+        while len(client.received) >= _FRAME_HEADER.size:
+            length = _FRAME_HEADER.unpack_from(client.received)[0]
+            if length > _MAX_CLIENT_FRAME_BYTES:
+                self._disconnect(client)
+                return
+            end = _FRAME_HEADER.size + length
+            if len(client.received) < end:
+                break
+            body = bytes(client.received[_FRAME_HEADER.size:end])
+            del client.received[:end]
+            try:
+                topics = decode_value(body)
+            except (ValueError, struct.error, UnicodeDecodeError):
+                topics = None
+            if not isinstance(topics, list):
+                self._disconnect(client)
+                return
+            with self._lock:
+                client.topics = [str(topic) for topic in topics]
+
+    def _write(self, client):
+        # The pending bytes are sent in place, so the buffer must not grow while they are - the
+        # send never blocks
+        with self._lock:
+            if not client.pending:
+                return
+            with memoryview(client.pending) as data:
+                try:
+                    sent = client.connection.send(data)
+                except (BlockingIOError, InterruptedError):
+                    return
+                except OSError:
+                    sent = None
+            if sent is not None:
+                del client.pending[:sent]
+                return
+        self._disconnect(client)
+
+    def _disconnect(self, client):
+        with self._lock:
+            self._clients.pop(client.connection.fileno(), None)
+        try:
+            self._selector.unregister(client.connection)
+        except (KeyError, ValueError):
+            pass
+        client.connection.close()
+
+    def _close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            self._disconnect(client)
+        self._selector.close()
+        self._server.close()
+        self._wake_read.close()
+        self._wake_write.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class EventBridgeClient(object):
+    """ Receive events from an `.EventBridge` """
+
+    def __init__(self, path, topics=None, timeout=None):
+        """
+        :param str path: path of the bridge socket file
+        :param list topics: [optional] event names or name prefixes to receive; default all
+        :param float timeout: [optional] seconds `.receive` waits for an event
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(path)
+        self._buffer = bytearray()
+        self.subscribe(topics or [])
+
+    def subscribe(self, topics):
+        """ Replace the topics received """
+        self._socket.sendall(encode_frame(encode_value(list(topics))))
+
+    def receive(self):
+        """
+        Wait for the next event
+
+        :return: (topic, timestamp, payload)
+        :rtype: tuple
+        :raise ConnectionError: if the bridge closed the connection
+        :raise socket.timeout: if no event arrived within the timeout
+        """
+        while True:
+            if len(self._buffer) >= _FRAME_HEADER.size:
+                end = _FRAME_HEADER.size + _FRAME_HEADER.unpack_from(self._buffer)[0]
+                if len(self._buffer) >= end:
+                    body = bytes(self._buffer[_FRAME_HEADER.size:end])
+                    del self._buffer[:end]
+                    return decode_event(body)
+            data = self._socket.recv(65536)
+            if not data:
+                raise ConnectionError("Event bridge closed the connection")
+            self._buffer += data
+
+    def close(self):
+        self._socket.close()
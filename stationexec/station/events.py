@@ -2,13 +2,36 @@
 
 # @lint-ignore-every PYTHON3COMPATIMPORTS1
 
-from collections import defaultdict
+import threading
+from bisect import bisect_left
+import weakref
+from collections import deque
 from enum import Enum, EnumMeta, unique
+from time import perf_counter
 
 from stationexec.logger import log
 from stationexec.utilities.ioloop_ref import IoLoop
 
-_known_events = defaultdict(list)
+# Event enum to an immutable tuple of (source, event, callback) subscribers. Changes build a new
+# tuple and swap it in under the lock, so emitting reads the current tuple without locking and
+# registrations made by other threads during an emit never disturb it.
+_known_events = {}
+_registry_lock = threading.Lock()
+
+# Event enum to the _CoalescingWindow that holds back its bursts - see set_event_coalescing
+_coalescing_windows = {}
+
+# Instrumentation - see get_event_statistics. Emit counts are updated under the registry lock,
+# as events are emitted from many threads.
+_emit_counts = {}
+_deferred_emit_counts = {}
+# Subscriber (source, event, callback) tuple to its _SubscriberStatistics. Only subscribers that
+# are registered are added, and unregistering removes them.
+_subscriber_stats = {}
+# Upper bounds of the call latency histogram buckets, in milliseconds
+_LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+# Subscribers whose recent call latency is above this are flagged as slow
+_slow_subscriber_seconds = 0.05
 
 # Callback methods for tooling in DataStorage
 __reg_callback = None
@@ -40,7 +63,9 @@ def register_for_event(source, event_enum, callback):
         # Tell DataStorage about Storage or Retrieval event registrations exclusively
         __reg_callback(source, event_enum, callback)
     else:
-        _known_events[event_enum].append((source, event_enum, callback))
+        with _registry_lock:
+            subscribers = _known_events.get(event_enum, ())
+            _known_events[event_enum] = subscribers + ((source, event_enum, callback),)
 
 def clear_event_subscribers(source, event_enum):
     global _known_events
@@ -53,9 +78,14 @@ def clear_event_subscribers(source, event_enum):
     if storage_event and __reg_callback is not None:
         log.warning("Clearing event subscribers for StorageEvents is not supported")
     else:
-        for reg_source, reg_event, reg_callback in _known_events[event_enum]:
-            if reg_source == source:
-                _known_events[event_enum].remove((reg_source, reg_event, reg_callback))
+        with _registry_lock:
+            subscribers = _known_events.get(event_enum, ())
+            _known_events[event_enum] = tuple(
+                subscriber for subscriber in subscribers if subscriber[0] != source
+            )
+            for subscriber in subscribers:
+                if subscriber[0] == source:
+                    _subscriber_stats.pop(subscriber, None)
 
 def unregister_from_event(source, event_enum, callback):
     global _known_events
@@ -67,7 +97,17 @@ def unregister_from_event(source, event_enum, callback):
     if storage_event and __reg_callback is not None:
         __unreg_callback(source, event_enum, callback)
     else:
-        _known_events[event_enum].remove((source, event_enum, callback))
+        with _registry_lock:
+            subscribers = list(_known_events.get(event_enum, ()))
+            # Raises ValueError if not registered, as before
+            removed = subscribers.pop(subscribers.index((source, event_enum, callback)))
+            _known_events[event_enum] = tuple(subscribers)
+            _subscriber_stats.pop(removed, None)
+
+
+def get_event_subscribers(event_enum):
+    """ Return the current (source, event, callback) subscribers of an event """
+    return _known_events.get(event_enum, ())
 
 
 def emit_event(event_enum, data_dict=None):
@@ -78,6 +118,8 @@ def emit_event(event_enum, data_dict=None):
     if not data_dict:
         data_dict = {}
 
+    with _registry_lock:
+        _emit_counts[event_enum] = _emit_counts.get(event_enum, 0) + 1
     storage_event = isinstance(event_enum, StorageEvents) or isinstance(
         event_enum, RetrievalEvents
     )
@@ -85,24 +127,645 @@ def emit_event(event_enum, data_dict=None):
         if __trig_callback is None:
             return None
         # Tell DataStorage about Storage or Retrieval event triggers exclusively
-        ret_data = __trig_callback(event_enum, data_dict)
+        if not isinstance(data_dict, dict):
+            data_dict = data_dict.to_dict()
+        start = perf_counter()
+        try:
+            ret_data = __trig_callback(event_enum, data_dict)
+        finally:
+            _record_call(_storage_subscriber(event_enum), perf_counter() - start, False)
     else:
-        for subscriber in _known_events[event_enum]:
-            # Log source and maybe the subscribers
-            source, event, callback = subscriber
-            data_dict["_event"] = event
+        subscribers = _known_events.get(event_enum, ())
+        if subscribers:
+            if isinstance(data_dict, dict):
+                # The emitter's dict is left untouched; keyword argument unpacking gives every
+                # subscriber its own copy of the top level of the payload
+                payload = dict(data_dict)
+                payload["_event"] = event_enum
+            else:
+                # Typed payload (see stationexec.station.payloads) - the dict is only built if
+                # a subscriber needs it
+                payload = data_dict
+            window = _coalescing_windows.get(event_enum)
+            if window is None or not window.hold(payload):
+                _deliver(subscribers, payload)
+            else:
+                _deliver([sub for sub in subscribers if _skips_coalescing(sub)], payload)
+
+    # Allow retrieval events to return data immediately - no other events return data
+    return ret_data
+
+
+def _deliver(subscribers, payload):
+    typed = None if isinstance(payload, dict) else payload
+    kwargs = payload if typed is None else None
+    for subscriber in subscribers:
+        callback = subscriber[2]
+        stats = _subscriber_stats.get(subscriber) or _add_statistics(subscriber)
+        failed = False
+        start = perf_counter()
+        try:
+            if typed is not None and getattr(callback, "receives_payload", False):
+                callback(typed)
+            else:
+                if kwargs is None:
+                    kwargs = typed.to_event_dict()
+                callback(**kwargs)
+        except Exception as e:
+            failed = True
+            log.exception("Exception in event call", e)
+        if stats.record(perf_counter() - start, failed):
+            _warn_slow(stats)
+
+
+def _event_dict(payload):
+    """ New keyword argument dict of a payload - a dict or a typed payload """
+    return dict(payload) if isinstance(payload, dict) else payload.to_event_dict()
+
+
+def _skips_coalescing(subscriber):
+    return getattr(subscriber[2], "skip_coalescing", False)
+
+
+def _deliver_batch(subscribers, event_enum, payloads):
+    """
+    Deliver several payloads of one event - as a single call to subscribers that accept
+    batches, one call per payload to the others
+    """
+    for subscriber in subscribers:
+        callback = subscriber[2]
+        if not getattr(callback, "accepts_batches", False):
+            for payload in payloads:
+                _deliver((subscriber,), payload)
+            continue
+        failed = False
+        start = perf_counter()
+        try:
+            callback(_event=event_enum, _batch=[_event_dict(payload) for payload in payloads])
+        except Exception as e:
+            failed = True
+            log.exception("Exception in event call", e)
+        _record_call(subscriber, perf_counter() - start, failed)
+
+
+class _SubscriberStatistics(object):
+    """ Call latency and failures of one event subscriber """
+
+    __slots__ = (
+        "subscriber",
+        "calls",
+        "exceptions",
+        "total_seconds",
+        "max_seconds",
+        "recent_seconds",
+        "slow",
+        "slow_calls",
+        "buckets",
+    )
+
+    # Weight of the newest call in the recent latency (exponentially weighted average)
+    _RECENT_WEIGHT = 0.1
+
+    def __init__(self, subscriber):
+        # The (source, event, callback) tuple
+        self.subscriber = subscriber
+        self.calls = 0
+        self.exceptions = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.recent_seconds = 0.0
+        self.slow = False
+        self.slow_calls = 0
+        # One count per histogram bucket, and one for calls slower than the last bucket
+        self.buckets = [0] * (len(_LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed, failed):
+        """
+        Add one call
+
+        :return: True if this call made the subscriber slow
+        :rtype: bool
+        """
+        self.calls += 1
+        if failed:
+            self.exceptions += 1
+        self.total_seconds += elapsed
+        if elapsed > self.max_seconds:
+            self.max_seconds = elapsed
+        if self.calls == 1:
+            self.recent_seconds = elapsed
+        else:
+            self.recent_seconds += self._RECENT_WEIGHT * (elapsed - self.recent_seconds)
+        self.buckets[bisect_left(_LATENCY_BUCKETS_MS, elapsed * 1000)] += 1
+
+        if elapsed > _slow_subscriber_seconds:
+            self.slow_calls += 1
+        slow = self.recent_seconds > _slow_subscriber_seconds
+        if slow is self.slow:
+            return False
+        self.slow = slow
+        return slow
+
+    def get_status(self):
+        histogram = {
+            "<={0}ms".format(bound): count
+            for bound, count in zip(_LATENCY_BUCKETS_MS, self.buckets)
+        }
+        histogram[">{0}ms".format(_LATENCY_BUCKETS_MS[-1])] = self.buckets[-1]
+        return {
+            "calls": self.calls,
+            "exceptions": self.exceptions,
+            "total_ms": self.total_seconds * 1000,
+            "mean_ms": self.total_seconds * 1000 / self.calls if self.calls else None,
+            "recent_ms": self.recent_seconds * 1000,
+            "max_ms": self.max_seconds * 1000,
+            "slow": self.slow,
+            "slow_calls": self.slow_calls,
+            "histogram": histogram,
+        }
+
+
+def _subscriber_name(callback):
+    if isinstance(callback, AsyncSubscriber):
+        callback = callback.callback
+    return getattr(callback, "__qualname__", repr(callback))
+
+
+# Stand-in subscriber tuples of DataStorage, which receives every Storage and Retrieval event
+_storage_subscribers = {}
+
+
+def _storage_subscriber(event_enum):
+    subscriber = _storage_subscribers.get(event_enum)
+    if subscriber is None:
+        subscriber = _storage_subscribers.setdefault(
+            event_enum, ("DataStorage", event_enum, __trig_callback)
+        )
+    return subscriber
+
+
+def _add_statistics(subscriber):
+    """
+    Statistics of a subscriber's first call. A subscriber that was unregistered while an emit
+    was delivering to it is not added back - its statistics are dropped with the call.
+    """
+    stats = _SubscriberStatistics(subscriber)
+    with _registry_lock:
+        event = subscriber[1]
+        if subscriber in _known_events.get(event, ()) or subscriber is _storage_subscribers.get(
+            event
+        ):
+            stats = _subscriber_stats.setdefault(subscriber, stats)
+    return stats
+
+
+def _warn_slow(stats):
+    source, event, callback = stats.subscriber
+    log.warning(
+        "Slow event subscriber '{0}' ({1}) of {2}: {3:.1f} ms per call".format(
+            _subscriber_name(callback), source, event, stats.recent_seconds * 1000
+        )
+    )
+
+
+def _record_call(subscriber, elapsed, failed):
+    stats = _subscriber_stats.get(subscriber) or _add_statistics(subscriber)
+    if stats.record(elapsed, failed):
+        _warn_slow(stats)
+
+
+def set_slow_subscriber_threshold(seconds):
+    """ Flag subscribers whose recent call latency is above the given seconds as slow """
+    global _slow_subscriber_seconds
+    _slow_subscriber_seconds = float(seconds)
+
+
+def reset_event_statistics():
+    """ Clear all event bus counters """
+    _emit_counts.clear()
+    _deferred_emit_counts.clear()
+    _subscriber_stats.clear()
+    for subscriber in list(_async_subscribers):
+        subscriber.dropped = 0
+        subscriber.coalesced = 0
+    for window in list(_coalescing_windows.values()):
+        window.coalesced = 0
+
+
+def get_event_statistics():
+    """
+    Get the cost of the event bus: emits per event, call latency and exceptions per subscriber,
+    the subscribers flagged as slow, asynchronous subscriber queue depths and coalescing counts
+
+    :rtype: dict
+    """
+    subscribers = []
+    for stats in list(_subscriber_stats.values()):
+        source, event, callback = stats.subscriber
+        status = stats.get_status()
+        status.update(
+            {"source": source, "event": str(event), "callback": _subscriber_name(callback)}
+        )
+        subscribers.append(status)
+    # Costliest first
+    subscribers.sort(key=lambda status: status["total_ms"], reverse=True)
+
+    return {
+        "emits": {str(event): count for event, count in list(_emit_counts.items())},
+        "deferred_emits": {
+            str(event): count for event, count in list(_deferred_emit_counts.items())
+        },
+        "slow_threshold_ms": _slow_subscriber_seconds * 1000,
+        "slow_subscribers": [
+            "{0}:{1}".format(status["event"], status["callback"])
+            for status in subscribers
+            if status["slow"]
+        ],
+        "subscribers": subscribers,
+        "queues": [
+            {
+                "name": subscriber.name,
+                "depth": subscriber.get_depth(),
+                "maxsize": subscriber.maxsize,
+                "overflow": subscriber.overflow.name,
+                "dropped": subscriber.dropped,
+                "coalesced": subscriber.coalesced,
+            }
+            for subscriber in list(_async_subscribers)
+        ],
+        "coalescing": [
+            {
+                "event": str(event),
+                "window_ms": window.window_seconds * 1000,
+                "batch": window.batch,
+                "coalesced": window.coalesced,
+            }
+            for event, window in list(_coalescing_windows.items())
+        ],
+    }
+
+
+def _default_window_key(payload):
+    return payload.get("source"), payload.get("target")
+
+
+class _CoalescingWindow(object):
+    """
+    Holds back the payloads of one event emitted less than a window apart. The first payload
+    after a quiet period is delivered at once and opens a window; payloads emitted during the
+    window are delivered together when it closes, which opens the next window. Windows stop
+    once one passes with nothing emitted.
+    """
+
+    def __init__(self, event_enum, window_seconds, key=None, batch=False):
+        self.event = event_enum
+        self.window_seconds = window_seconds
+        self.batch = batch
+        self._key = key or _default_window_key
+        self._condition = threading.Condition()
+        self._open = False
+        self._stopped = False
+        # Batch: list of payloads; otherwise key to the newest payload, in order first held
+        self._pending = [] if batch else {}
+        # Payloads replaced by a newer one with the same key before being delivered
+        self.coalesced = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name="coalesce-{0}".format(event_enum), daemon=True
+        )
+        self._thread.start()
+
+    def hold(self, payload):
+        """
+        :return: True if the payload is held for the end of the window; False if it opened a
+            window and should be delivered now
+        :rtype: bool
+        """
+        with self._condition:
+            if self._stopped:
+                return False
+            if not self._open:
+                self._open = True
+                self._condition.notify()
+                return False
+            if self.batch:
+                self._pending.append(payload)
+            else:
+                key = self._key(payload)
+                if key in self._pending:
+                    self.coalesced += 1
+                self._pending[key] = payload
+            return True
+
+    def stop(self):
+        """ Deliver what is held and stop holding payloads back """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(self.window_seconds + 1)
+
+    def _take_pending(self):
+        with self._condition:
+            pending = self._pending
+            self._pending = [] if self.batch else {}
+            return pending if self.batch else list(pending.values())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._open or self._stopped)
+                if self._stopped:
+                    break
+                self._condition.wait_for(lambda: self._stopped, self.window_seconds)
+            payloads = self._take_pending()
+            if not payloads:
+                with self._condition:
+                    # Close the window only if nothing was held since the check
+                    if not self._pending:
+                        self._open = False
+                continue
+            self._flush(payloads)
+        self._flush(self._take_pending())
+
+    def _flush(self, payloads):
+        subscribers = [
+            sub for sub in _known_events.get(self.event, ()) if not _skips_coalescing(sub)
+        ]
+        if not payloads or not subscribers:
+            return
+        if self.batch and len(payloads) > 1:
+            _deliver_batch(subscribers, self.event, payloads)
+        else:
+            for payload in payloads:
+                _deliver(subscribers, payload)
+
+
+def set_event_coalescing(event_enum, window_seconds, key=None, batch=False):
+    """
+    Limit how often the subscribers of an event are called during bursts. Within a window of the
+    given length, a state event (batch=False) delivers only the newest payload of each key; an
+    append event (batch=True) delivers all of its payloads at once, as one call with a '_batch'
+    list to subscribers that have a true 'accepts_batches' attribute. Payloads are held back at
+    most one window. Subscribers with a true 'skip_coalescing' attribute still receive every
+    payload as it is emitted.
+
+    :param event_enum: the event, one of `.InfoEvents` or `.ActionEvents`
+    :param float window_seconds: window length; 0 or None delivers every payload as emitted
+    :param key: [optional] function of a payload returning its key; default is the 'source'
+        and 'target' of the payload
+    :param bool batch: batch the payloads instead of keeping the newest of each key
+    """
+    window = _coalescing_windows.pop(event_enum, None)
+    if window is not None:
+        window.stop()
+    if window_seconds:
+        _coalescing_windows[event_enum] = _CoalescingWindow(
+            event_enum, float(window_seconds), key, batch
+        )
+
+
+def configure_event_coalescing(windows=None):
+    """
+    Apply the default coalescing windows, with overrides
+
+    :param dict windows: [optional] event name (as in 'LOG' or 'InfoEvents.LOG') to window
+        seconds; 0 turns coalescing of that event off
+    """
+    settings = dict(DEFAULT_EVENT_COALESCING)
+    for name, window_seconds in (windows or {}).items():
+        event_enum = InfoEvents[str(name).split(".")[-1]]
+        default = settings.get(event_enum, (0, False))
+        settings[event_enum] = (window_seconds, default[1])
+    for event_enum, (window_seconds, batch) in settings.items():
+        set_event_coalescing(event_enum, window_seconds, batch=batch)
+
+
+def stop_event_coalescing():
+    """ Deliver every held payload and stop coalescing events """
+    for event_enum in list(_coalescing_windows):
+        set_event_coalescing(event_enum, 0)
+
+
+@unique
+class Overflow(Enum):
+    """ What an `.AsyncSubscriber` does with a new payload when its queue is full """
+    # Discard the oldest queued payload
+    DROP_OLDEST = 0
+    # Replace the queued payload with the same key (see AsyncSubscriber); drop the oldest if
+    # there is none
+    COALESCE = 1
+    # Make the emitter wait until the subscriber catches up
+    BLOCK = 2
+
+
+# Every AsyncSubscriber created, to drain or close them all at shutdown
+_async_subscribers = weakref.WeakSet()
+
+
+def _default_coalesce_key(payload):
+    return payload.get("_event"), payload.get("source")
+
+
+class AsyncSubscriber(object):
+    """
+    Event subscriber that runs its callback on its own worker thread, fed by a bounded queue,
+    so the thread emitting the event never waits on the callback. Payloads are delivered in the
+    order they were emitted. Register the object in place of the callback::
+
+        register_for_event("logger", InfoEvents.LOG, AsyncSubscriber(self.log_message))
+
+    It compares equal to its callback, so `.unregister_from_event` works with either.
+    Typed payloads are queued as they are and only turned into keyword arguments on the worker.
+    """
+
+    # Called with typed payloads as they are, instead of as keyword arguments
+    receives_payload = True
+
+    def __init__(
+        self,
+        callback,
+        maxsize=1000,
+        overflow=Overflow.DROP_OLDEST,
+        coalesce_key=None,
+        name=None,
+        accepts_batches=False,
+        skip_coalescing=False,
+        droppable=None,
+    ):
+        """
+        :param callback: the subscriber, called with the event payload as keyword arguments
+        :param int maxsize: most payloads waiting for the callback
+        :param Overflow overflow: what to do with a payload that arrives when the queue is full
+        :param coalesce_key: [optional] function of the payload returning the key under which
+            payloads replace each other with `.Overflow.COALESCE`; default is the event and
+            the 'source' of the payload
+        :param str name: [optional] name of the worker thread
+        :param bool accepts_batches: the callback handles batched payloads of coalesced events
+            (see `.set_event_coalescing`)
+        :param bool skip_coalescing: receive every payload of coalesced events as it is emitted
+        :param droppable: [optional] function of a payload, True if it may be discarded. With
+            `.Overflow.DROP_OLDEST`, a full queue discards its oldest droppable payload, and the
+            emitter waits when none is queued - one worker, in emit order, for payloads that
+            may be dropped and payloads that must not be
+        """
+        self.callback = callback
+        self.accepts_batches = accepts_batches
+        self.skip_coalescing = skip_coalescing
+        self.maxsize = max(int(maxsize), 1)
+        self.overflow = overflow
+        self.name = name or getattr(callback, "__qualname__", repr(callback))
+        self._coalesce_key = coalesce_key or _default_coalesce_key
+        self._droppable = droppable
+        # Queue of [key, payload] entries; with COALESCE, the queued entry of each key
+        self._queue = deque()
+        self._entries = {}
+        self._condition = threading.Condition()
+        self._busy = False
+        self._closed = False
+        # Payloads discarded or merged because the subscriber fell behind
+        self.dropped = 0
+        self.coalesced = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name="event-{0}".format(self.name), daemon=True
+        )
+        self._thread.start()
+        _async_subscribers.add(self)
+
+    def __eq__(self, other):
+        return other is self or other == self.callback
+
+    def __hash__(self):
+        return hash(self.callback)
+
+    def __repr__(self):
+        return "<AsyncSubscriber name='{0}' depth={1}>".format(self.name, len(self._queue))
+
+    def __call__(self, *typed_payload, **payload):
+        if typed_payload:
+            payload = typed_payload[0]
+        with self._condition:
+            if self._closed:
+                # Worker stopped - deliver in place so nothing emitted late is lost
+                closed = True
+            else:
+                closed = False
+                self._enqueue(payload)
+        if closed:
+            self.callback(**_event_dict(payload))
+
+    def _enqueue(self, payload):
+        key = None
+        if self.overflow is Overflow.COALESCE:
+            key = self._coalesce_key(payload)
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] = payload
+                self.coalesced += 1
+                return
+
+        while len(self._queue) >= self.maxsize:
+            index = self._drop_index()
+            # The worker itself must never wait on its own queue
+            if index is None and threading.current_thread() is not self._thread:
+                self._condition.wait()
+                if self._closed:
+                    self.callback(**_event_dict(payload))
+                    return
+                continue
+            old_key, _old_payload = self._queue[index or 0]
+            del self._queue[index or 0]
+            if self._entries.get(old_key) is not None:
+                del self._entries[old_key]
+            self.dropped += 1
+
+        entry = [key, payload]
+        self._queue.append(entry)
+        if self.overflow is Overflow.COALESCE:
+            self._entries[key] = entry
+        self._condition.notify_all()
+
+    def _drop_index(self):
+        """ Position of the queued payload to discard for room; None to wait instead """
+        if self.overflow is Overflow.BLOCK:
+            return None
+        if self._droppable is None:
+            return 0
+        for index, (_key, payload) in enumerate(self._queue):
+            if self._droppable(payload):
+                return index
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                key, payload = self._queue.popleft()
+                if self.overflow is Overflow.COALESCE:
+                    self._entries.pop(key, None)
+                self._busy = True
+                # Wake emitters waiting for room
+                self._condition.notify_all()
             try:
-                callback(**data_dict)
+                if isinstance(payload, dict):
+                    self.callback(**payload)
+                else:
+                    self.callback(**payload.to_event_dict())
             except Exception as e:
                 log.exception("Exception in event call", e)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
 
-    # Allow retrieval events to return data immediately - no other events return data
-    return ret_data
+    def get_depth(self):
+        """ Number of payloads waiting for the callback """
+        return len(self._queue)
+
+    def drain(self, timeout=None):
+        """
+        Wait until every queued payload has been delivered
+
+        :param float timeout: [optional] most seconds to wait
+        :return: True if the queue is empty
+        :rtype: bool
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._queue and not self._busy, timeout
+            )
+
+    def close(self, timeout=None):
+        """
+        Deliver what is queued and stop the worker; later payloads are delivered on the
+        emitting thread
+
+        :param float timeout: [optional] most seconds to wait for the queue to drain
+        """
+        self.drain(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+
+def close_event_queues(timeout=1.0):
+    """ Deliver what is queued in every `.AsyncSubscriber` and stop their workers """
+    stop_event_coalescing()
+    for subscriber in list(_async_subscribers):
+        subscriber.close(timeout)
 
 
 def emit_event_non_blocking(event_enum, data_dict=None):
     if not data_dict:
         data_dict = {}
+    with _registry_lock:
+        _deferred_emit_counts[event_enum] = _deferred_emit_counts.get(event_enum, 0) + 1
     IoLoop().current().spawn_callback(emit_event, event_enum, data_dict)
 
 
@@ -149,6 +812,8 @@ class RetrievalEvents(Enum):
     GET_SEQUENCE_RESULTS = 10
     GET_SEQUENCE_DATA = 11
     GET_DUT_DATA = 12
+    GET_OPERATION_TIMING = 13
+    GET_OPERATION_DURATION_STATISTICS = 14
 
 @unique
 class ActionEvents(Enum):
@@ -203,3 +868,15 @@ class InfoEvents(Enum):
     ROUTING_DATA_UPDATE = 35
     PASS_ERROR_CODE = 36
     USER_INPUT_REQUEST = 37
+    STORAGE_LAG = 38
+
+
+# Coalescing windows applied by configure_event_coalescing: event to (window seconds, batch).
+# These events fire many times a second when the station is busy; subscribers only need the
+# newest state, or the log lines in order.
+DEFAULT_EVENT_COALESCING = {
+    InfoEvents.SEQUENCE_UPDATE: (0.1, False),
+    InfoEvents.TOOL_UPDATE: (0.1, False),
+    InfoEvents.OBJECT_UPDATE: (0.1, False),
+    InfoEvents.LOG: (0.05, True),
+}
@@ -1,13 +1,28 @@
 # Copyright 2004-present Facebook. All Rights Reserved.
 
 # @lint-ignore-every PYTHON3COMPATIMPORTS1
+import base64
 import os
 
 import simplejson
-from stationexec.station.events import emit_event, InfoEvents
+from stationexec.station.events import emit_event, get_event_statistics, InfoEvents
 from stationexec.utilities import config
 from stationexec.web.handlers import ExecutiveHandler
 
+_BYTES_KEY = "__bytes__"
+
+
+def _encode_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {_BYTES_KEY: base64.b64encode(value).decode("ascii")}
+    raise TypeError("{0} is not JSON serializable".format(type(value).__name__))
+
+
+def _decode_bytes(obj):
+    if len(obj) == 1 and _BYTES_KEY in obj:
+        return base64.b64decode(obj[_BYTES_KEY])
+    return obj
+
 
 class StationUIHandler(ExecutiveHandler):
     _station_info = None
@@ -35,6 +50,71 @@ class StationStatusHandler(ExecutiveHandler):
         self.write(simplejson.dumps(data))
 
 
+class EventStatisticsHandler(ExecutiveHandler):
+    def get(self):
+        """Write JSON encoded string of the event bus statistics"""
+        self.write(simplejson.dumps(get_event_statistics()))
+
+
+class StorageStatusHandler(ExecutiveHandler):
+    _storage = None
+
+    def initialize(self, **kwargs):
+        self._storage = kwargs.get("storage")
+
+    def get(self):
+        """Write JSON encoded string of the data storage queues, flushes and lag"""
+        self.set_header("Content-Type", "application/json")
+        self.write(simplejson.dumps(self._storage.get_status()))
+
+
+class StorageDeadLetterHandler(ExecutiveHandler):
+    """
+    Inspect, requeue and discard the records in the dead-letter store of data storage. Bytes
+    values are written, and may be sent, as ``{"__bytes__": <base64>}``.
+    """
+
+    _storage = None
+
+    def initialize(self, **kwargs):
+        self._storage = kwargs.get("storage")
+
+    def get(self):
+        """Write JSON encoded list of the dead-letter entries; ?source= to filter by source"""
+        self.set_header("Content-Type", "application/json")
+        source = self.get_query_argument("source", None)
+        self.write(
+            simplejson.dumps(
+                self._storage.get_dead_letters(source), encoding=None, default=_encode_bytes
+            )
+        )
+
+    def post(self):
+        """
+        Requeue an entry - JSON body {"id": <entry id>, "data": <optional fixed data>}
+        """
+        args = {}
+        if self.request.body:
+            args = simplejson.loads(self.request.body, object_hook=_decode_bytes)
+        if "id" not in args:
+            self.set_status(400, "id of the entry is required")
+            return
+        try:
+            found = self._storage.requeue_dead_letter(args["id"], args.get("data"))
+        except KeyError as e:
+            self.set_status(409, str(e))
+            return
+        if not found:
+            self.set_status(404)
+            self.write("404: Not Found")
+
+    def delete(self):
+        """Discard an entry - ?id=<entry id>"""
+        if not self._storage.discard_dead_letter(self.get_argument("id")):
+            self.set_status(404)
+            self.write("404: Not Found")
+
+
 class StationHelpHandler(ExecutiveHandler):
     def get(self):
         """Write JSON encoded string of the sequence executed status"""
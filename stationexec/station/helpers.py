@@ -9,6 +9,7 @@ from stationexec.station.events import (
     ActionEvents,
     StorageEvents
 )
+from stationexec.station.payloads import ObjectUpdatePayload
 from stationexec.utilities import config, pc_info
 
 
@@ -67,9 +68,7 @@ def value_to_ui(target, value, sender="helper"):
     :param value:
     :param sender:
     """
-    emit_event(
-        InfoEvents.OBJECT_UPDATE, {"source": sender, "target": target, "value": value}
-    )
+    emit_event(InfoEvents.OBJECT_UPDATE, ObjectUpdatePayload(sender, target, value))
 
 
 def reload_tool_manifest(new_manifest=None):
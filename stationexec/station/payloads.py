@@ -0,0 +1,124 @@
+# Copyright 2004-present Facebook. All Rights Reserved.
+
+# @lint-ignore-every PYTHON3COMPATIMPORTS1
+
+"""
+Typed payloads of the most frequent events.
+
+Emitting one of these instead of a dict allocates a single slotted object. The dict a
+subscriber receives as keyword arguments is only built for subscribers that are called directly;
+`.AsyncSubscriber` queues the object itself and builds the keyword arguments on its worker, so
+the emitting thread never does. Subscriber signatures do not change.
+
+Payloads also read like the dicts they replace - ``payload["source"]``, ``payload.get("target")``
+and ``dict(payload)`` all work - for code that looks into them, such as coalescing keys.
+"""
+
+from stationexec.station.events import InfoEvents
+
+
+class EventPayload(object):
+    """ Base of the typed payloads - the fields are the slots of the subclass """
+
+    __slots__ = ()
+    # Event the payload belongs to
+    event = None
+
+    def to_dict(self):
+        """ Fields as a new dict, for JSON and storage """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_event_dict(self):
+        """ Fields as a new dict tagged with the event - the keyword arguments of a subscriber """
+        data = self.to_dict()
+        data["_event"] = self.event
+        return data
+
+    def keys(self):
+        return self.__slots__
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            return getattr(self, key)
+        if key == "_event":
+            return self.event
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def get(self, key, default=None):
+        if key in self.__slots__:
+            return getattr(self, key)
+        return self.event if key == "_event" else default
+
+    def __eq__(self, other):
+        if isinstance(other, EventPayload):
+            return type(other) is type(self) and other.to_dict() == self.to_dict()
+        if isinstance(other, dict):
+            return other == self.to_dict()
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__, self.to_dict())
+
+
+class LogPayload(EventPayload):
+    """ `.InfoEvents.LOG` - one log message """
+
+    __slots__ = ("source", "stream", "message", "debug_level", "data", "stack_trace", "pid",
+                 "caller")
+    event = InfoEvents.LOG
+
+    def __init__(self, stream, message, debug_level=None, data=None, stack_trace="", pid=None,
+                 caller=None, source="log"):
+        self.source = source
+        self.stream = stream
+        self.message = message
+        self.debug_level = debug_level
+        self.data = data
+        self.stack_trace = stack_trace
+        self.pid = pid
+        self.caller = caller
+
+
+class SequenceUpdatePayload(EventPayload):
+    """ `.InfoEvents.SEQUENCE_UPDATE` - JSON encoded status of the running sequence """
+
+    __slots__ = ("source", "data")
+    event = InfoEvents.SEQUENCE_UPDATE
+
+    def __init__(self, source, data):
+        self.source = source
+        self.data = data
+
+
+class ToolUpdatePayload(EventPayload):
+    """ `.InfoEvents.TOOL_UPDATE` - status of every tool """
+
+    __slots__ = ("source", "status")
+    event = InfoEvents.TOOL_UPDATE
+
+    def __init__(self, source, status):
+        self.source = source
+        self.status = status
+
+
+class ObjectUpdatePayload(EventPayload):
+    """ `.InfoEvents.OBJECT_UPDATE` - new value of a UI element """
+
+    __slots__ = ("source", "target", "value")
+    event = InfoEvents.OBJECT_UPDATE
+
+    def __init__(self, source, target, value):
+        self.source = source
+        self.target = target
+        self.value = value
@@ -0,0 +1,357 @@
+# Copyright 2004-present Facebook. All Rights Reserved.
+
+# @lint-ignore-every PYTHON3COMPATIMPORTS1
+
+"""
+Write-ahead log of the DataStorage queue.
+
+Every storage event placed into the work queue is first appended to the log, and acknowledged
+in the log once its handler stored it. After a crash or power loss, the entries that were never
+acknowledged are read back at the next start and stored then.
+
+The log is a folder of segment files named ``<number>.log``. Each entry is one frame - a kind
+byte, the length and CRC32 of the body, then the body. A record frame holds one queue entry and
+its id; an ack frame holds a list of record ids. Ids grow in the order the records are
+appended, so every segment holds one range of ids.
+
+Appends are written to the operating system immediately, which survives the station process
+being killed. `os.fsync`, which survives a power loss, runs on a separate thread at most every
+``sync_period`` seconds for all the appends since the last one (group commit). A new segment is
+started when the current one reaches ``segment_bytes``; the oldest segments are deleted once all
+of their records are acknowledged. Acks are always written after their records, so deleting
+segments oldest first never loses an ack of a record that is still in the log.
+
+The body is the length of its JSON text, the JSON text, then each bytes value of the entry as a
+section of its own - its length and the raw bytes - referenced in the JSON as
+``{"__bytes__": <section number>}``. Bytes are copied into the frame as they are, never encoded.
+
+A torn frame at the end of a segment - the write that was running during the crash - fails its
+length or CRC check and ends the reading of that segment.
+"""
+
+import os
+import struct
+import threading
+import zlib
+from bisect import bisect_right
+
+import simplejson
+from stationexec.logger import log
+
+_FRAME_HEADER = struct.Struct("!BII")
+_SECTION_LENGTH = struct.Struct("!I")
+_RECORD = 3
+_ACK = 4
+_SEGMENT_SUFFIX = ".log"
+_BYTES_KEY = "__bytes__"
+
+
+class _Segment(object):
+    """ One segment file and how many of its records are not yet acknowledged """
+
+    __slots__ = ("number", "path", "first_id", "unacked")
+
+    def __init__(self, number, path, first_id):
+        self.number = number
+        self.path = path
+        self.first_id = first_id
+        self.unacked = 0
+
+
+def encode_body(value):
+    """
+    Encode a value that may hold bytes - the JSON text of the rest, then the bytes as raw sections
+
+    :rtype: bytes
+    """
+    sections = []
+
+    def to_section(item):
+        if isinstance(item, (bytes, bytearray)):
+            sections.append(item)
+            return {_BYTES_KEY: len(sections) - 1}
+        raise TypeError("{0} is not JSON serializable".format(type(item).__name__))
+
+    text = simplejson.dumps(value, encoding=None, default=to_section).encode("utf-8")
+    parts = [_SECTION_LENGTH.pack(len(text)), text]
+    for section in sections:
+        parts.append(_SECTION_LENGTH.pack(len(section)))
+        parts.append(section)
+    return b"".join(parts)
+
+
+def decode_body(data):
+    """ Decode a value from `encode_body` """
+    length = _SECTION_LENGTH.unpack_from(data, 0)[0]
+    offset = _SECTION_LENGTH.size + length
+    text = bytes(data[_SECTION_LENGTH.size:offset]).decode("utf-8")
+    sections = []
+    while offset < len(data):
+        length = _SECTION_LENGTH.unpack_from(data, offset)[0]
+        offset += _SECTION_LENGTH.size
+        sections.append(bytes(data[offset:offset + length]))
+        offset += length
+
+    def from_section(obj):
+        if len(obj) == 1 and isinstance(obj.get(_BYTES_KEY), int):
+            return sections[obj[_BYTES_KEY]]
+        return obj
+
+    return simplejson.loads(text, object_hook=from_section)
+
+
+def encode_frame(kind, body):
+    """
+    Frame a body as a log entry
+
+    :param int kind: entry kind
+    :param body: JSON serializable body; bytes values are allowed
+    :rtype: bytes
+    """
+    data = encode_body(body)
+    return _FRAME_HEADER.pack(kind, len(data), zlib.crc32(data)) + data
+
+
+def read_frames(path):
+    """
+    Read the entries of a segment file, stopping at the first torn or corrupt frame
+
+    :param str path: segment file
+    :return: generator of (kind, body)
+    """
+    with open(path, "rb") as f:
+        contents = f.read()
+    offset = 0
+    while offset + _FRAME_HEADER.size <= len(contents):
+        kind, length, crc = _FRAME_HEADER.unpack_from(contents, offset)
+        start = offset + _FRAME_HEADER.size
+        data = contents[start:start + length]
+        if len(data) != length or zlib.crc32(data) != crc or kind not in (_RECORD, _ACK):
+            log.warning(
+                "Storage log segment '{0}' is damaged at byte {1}; ignoring the rest of "
+                "it".format(path, offset)
+            )
+            return
+        yield kind, decode_body(data)
+        offset = start + length
+
+
+def write_segment(path, bodies, append=False):
+    """
+    Write records to a file of their own, in the frames of the log. Not synced - the records
+    are in the log already. Used by DataStorage to move records out of memory.
+
+    :param str path: file to create
+    :param list bodies: JSON serializable dicts; bytes values are allowed
+    :param bool append: add the records to the end of the file instead of replacing it
+    """
+    with open(path, "ab" if append else "wb") as f:
+        f.write(b"".join(encode_frame(_RECORD, body) for body in bodies))
+
+
+def read_segment(path):
+    """
+    Read the records of a file from `write_segment`
+
+    :param str path: the file
+    :return: the record bodies, in order
+    :rtype: list
+    """
+    return [body for kind, body in read_frames(path) if kind == _RECORD]
+
+
+class StorageLog(object):
+    def __init__(self, folder, segment_bytes=4 * 1024 * 1024, sync_period=0.05):
+        """
+        :param str folder: folder of the segment files; created if missing
+        :param int segment_bytes: start a new segment once the current one is this large
+        :param float sync_period: longest time between an append and its `os.fsync`
+        """
+        self._folder = folder
+        self._segment_bytes = int(segment_bytes)
+        self._sync_period = float(sync_period)
+
+        self._lock = threading.Lock()
+        self._sync_condition = threading.Condition(self._lock)
+        # Segments oldest first; the last one is written to
+        self._segments = []
+        self._segment_starts = []
+        self._file = None
+        self._size = 0
+        self._next_id = 1
+        self._dirty = False
+        self._closed = False
+        self._sync_thread = None
+        self.syncs = 0
+
+    def open(self):
+        """
+        Read the existing segments, start a new one and start the sync thread
+
+        :return: bodies of the records that were never acknowledged, oldest first; each has
+            its record id in "id"
+        :rtype: list
+        """
+        if not os.path.isdir(self._folder):
+            os.makedirs(self._folder)
+
+        numbers = sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self._folder)
+            if name.endswith(_SEGMENT_SUFFIX) and name[: -len(_SEGMENT_SUFFIX)].isdigit()
+        )
+        records = {}
+        acked = set()
+        segment_ids = []
+        for number in numbers:
+            path = self._segment_path(number)
+            ids = []
+            for kind, body in read_frames(path):
+                if kind == _RECORD:
+                    records[body["id"]] = body
+                    ids.append(body["id"])
+                else:
+                    acked.update(body)
+            segment_ids.append((number, path, ids))
+
+        for number, path, ids in segment_ids:
+            segment = _Segment(number, path, ids[0] if ids else self._next_id)
+            segment.unacked = sum(1 for record_id in ids if record_id not in acked)
+            self._next_id = max([self._next_id] + [record_id + 1 for record_id in ids])
+            self._segments.append(segment)
+            self._segment_starts.append(segment.first_id)
+
+        with self._lock:
+            self._start_segment(numbers[-1] + 1 if numbers else 1)
+            self._delete_acknowledged()
+
+        self._sync_thread = threading.Thread(name="storage_log_sync", target=self._sync_loop)
+        self._sync_thread.daemon = True
+        self._sync_thread.start()
+
+        return [records[record_id] for record_id in sorted(records) if record_id not in acked]
+
+    def append(self, bodies):
+        """
+        Append records to the log
+
+        :param list bodies: JSON serializable dicts; each is given a record id in "id"
+        :return: the record ids, in order
+        :rtype: list
+        """
+        with self._lock:
+            if self._size >= self._segment_bytes:
+                self._start_segment(self._segments[-1].number + 1)
+                self._delete_acknowledged()
+            ids = []
+            frames = []
+            for body in bodies:
+                body["id"] = self._next_id
+                ids.append(self._next_id)
+                self._next_id += 1
+                frames.append(encode_frame(_RECORD, body))
+            self._write(b"".join(frames))
+            self._segments[-1].unacked += len(ids)
+            return ids
+
+    def ack(self, record_ids):
+        """
+        Acknowledge that records were stored; they will not be read back at the next start
+
+        :param list record_ids: ids returned by `append`, or in the "id" of the records
+            returned by `open`
+        """
+        if not record_ids:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            self._write(encode_frame(_ACK, list(record_ids)))
+            for record_id in record_ids:
+                index = bisect_right(self._segment_starts, record_id) - 1
+                if index >= 0:
+                    self._segments[index].unacked -= 1
+            self._delete_acknowledged()
+
+    def get_status(self):
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "unacknowledged": sum(segment.unacked for segment in self._segments),
+                "segment_bytes": self._size,
+                "syncs": self.syncs,
+            }
+
+    def close(self):
+        """ Sync and close the log; unacknowledged records are read back by the next `open` """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._sync_condition.notify_all()
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+        if self._sync_thread is not None:
+            self._sync_thread.join()
+
+    def _segment_path(self, number):
+        return os.path.join(self._folder, "{0:08d}{1}".format(number, _SEGMENT_SUFFIX))
+
+    def _write(self, data):
+        """ Write to the current segment - call with the lock held """
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        if not self._dirty:
+            self._dirty = True
+            self._sync_condition.notify_all()
+
+    def _start_segment(self, number):
+        """ Close the current segment and start a new one - call with the lock held """
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        segment = _Segment(number, self._segment_path(number), self._next_id)
+        self._file = open(segment.path, "ab")
+        self._size = 0
+        self._segments.append(segment)
+        self._segment_starts.append(segment.first_id)
+
+    def _delete_acknowledged(self):
+        """ Delete the oldest segments while all of their records are acknowledged """
+        while len(self._segments) > 1 and self._segments[0].unacked <= 0:
+            segment = self._segments.pop(0)
+            self._segment_starts.pop(0)
+            try:
+                os.remove(segment.path)
+            except OSError as e:
+                log.exception("Unable to delete storage log segment", e)
+
+    def _sync_loop(self):
+        """ Sync appends to disk at most every sync_period seconds, while there are any """
+        with self._lock:
+            while not self._closed:
+                if not self._dirty:
+                    self._sync_condition.wait()
+                    continue
+                # Gather the appends of the next sync_period into this sync
+                self._sync_condition.wait(self._sync_period)
+                if self._closed:
+                    break
+                self._dirty = False
+                current = self._file
+                fileno = current.fileno()
+                self._lock.release()
+                try:
+                    os.fsync(fileno)
+                except OSError as e:
+                    # A segment that was closed meanwhile was synced when it was closed
+                    if current is self._file:
+                        log.exception("Unable to sync the storage log", e)
+                finally:
+                    self._lock.acquire()
+                self.syncs += 1
@@ -0,0 +1,210 @@
+# Copyright 2004-present Facebook. All Rights Reserved.
+
+# @lint-ignore-every PYTHON3COMPATIMPORTS1
+
+"""
+Micro-benchmarks of station internals. Run from the repository root:
+
+    python stationexec/test/benchmark.py events
+    python stationexec/test/benchmark.py storage
+    python stationexec/test/benchmark.py sqlite
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+se_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(se_path)
+# Built-in tools import their own modules as top level packages
+sys.path.append(os.path.join(se_path, "stationexec", "built_in"))
+
+# The logger must be imported before the event bus - they import each other
+from stationexec.logger import log  # noqa: F401
+from stationexec.station import events
+from stationexec.utilities.time import get_utc_now
+from stationexec.utilities.uuidstr import get_uuid
+
+
+def _subscriber(**kwargs):
+    pass
+
+
+def benchmark_events(subscriber_counts=(0, 1, 10, 100), emits=20000):
+    """
+    Measure emit_event throughput with different numbers of subscribers on one event
+
+    :return: list of (subscriber count, emits per second)
+    """
+    event = events.InfoEvents.OBJECT_UPDATE
+    payload = {"source": "benchmark", "data": {"value": 1}}
+    results = []
+    for count in subscriber_counts:
+        events.clear_event_subscribers("benchmark", event)
+        for _ in range(count):
+            events.register_for_event("benchmark", event, _subscriber)
+
+        start = time.perf_counter()
+        for _ in range(emits):
+            events.emit_event(event, payload)
+        elapsed = time.perf_counter() - start
+        results.append((count, emits / elapsed))
+    events.clear_event_subscribers("benchmark", event)
+    return results
+
+
+def _station_storage(folder, **kwargs):
+    """ A StationStorage tool on a new SQLite file in folder """
+    from station_storage.station_storage import StationStorage
+
+    with mock.patch(
+        "stationexec.utilities.config.get_all_paths", return_value={"data_folder": folder}
+    ):
+        tool = StationStorage(
+            {}, tool_type="station_storage", name="Station Storage", tool_id="storage",
+            version="benchmark", debug=0, dev=True, **kwargs
+        )
+    tool.initialize()
+    return tool
+
+
+def _result_rows(count):
+    """ Storage records of results, as DataStorage passes them to the handler """
+    operation = get_uuid()
+    created = get_utc_now()
+    return [
+        {
+            "uuid": get_uuid(),
+            "operation": operation,
+            "name": "result_{0}".format(index),
+            "identifier": None,
+            "description": "benchmark result",
+            "value": float(index),
+            "passing": True,
+            "operator": "lt",
+            "operand2": 1e9,
+            "operand3": None,
+            "created": created,
+        }
+        for index in range(count)
+    ]
+
+
+def benchmark_storage(batch_sizes=(1, 10, 100, 1000), rows=20000):
+    """
+    Measure results stored per second by StationStorage.on_result_store, against adding one ORM
+    object per row, for different numbers of records per handler call
+
+    :return: list of (batch size, ORM rows per second, on_result_store rows per second)
+    """
+    from station_storage.tables import Result
+
+    def store_orm(tool, batch):
+        with tool.session() as s:
+            for row in batch:
+                s.add(Result(**row))
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        tool = _station_storage(folder)
+        for batch_size in batch_sizes:
+            # Single row transactions are bound by fsync - measure fewer of them
+            count = min(rows, batch_size * 200)
+            rates = []
+            for store in (store_orm, lambda tool, batch: tool.on_result_store(batch)):
+                batches = [
+                    _result_rows(min(batch_size, count - start))
+                    for start in range(0, count, batch_size)
+                ]
+                start = time.perf_counter()
+                for batch in batches:
+                    store(tool, batch)
+                rates.append(count / (time.perf_counter() - start))
+            results.append((batch_size, rates[0], rates[1]))
+        tool._engine.dispose()
+    return results
+
+
+def benchmark_sqlite(profiles=("default", "tuned"), seconds=3.0, batch_size=10):
+    """
+    Measure StationStorage on SQLite with a writer storing result batches while a reader
+    queries them, as the web history endpoints do during a sequence, for each SQLite profile
+
+    :return: list of (profile, rows written per second, reads per second, failed reads)
+    """
+    from sqlalchemy import func
+    from station_storage.tables import Result
+
+    results = []
+    for profile in profiles:
+        with tempfile.TemporaryDirectory() as folder:
+            tool = _station_storage(folder, sqlite_profile=profile)
+            operation = _result_rows(1)[0]["operation"]
+            stop = threading.Event()
+            counts = {"rows": 0, "reads": 0, "failed": 0}
+
+            def write():
+                while not stop.is_set():
+                    batch = _result_rows(batch_size)
+                    for row in batch:
+                        row["operation"] = operation
+                    tool.on_result_store(batch)
+                    counts["rows"] += batch_size
+
+            def read():
+                while not stop.is_set():
+                    try:
+                        with tool.session() as s:
+                            s.query(func.count(Result.uuid)).filter(
+                                Result.operation == operation
+                            ).scalar()
+                        counts["reads"] += 1
+                    except Exception:
+                        # Database is locked - the rollback journal blocks readers
+                        counts["failed"] += 1
+
+            threads = [threading.Thread(target=write), threading.Thread(target=read)]
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            tool.shutdown()
+            tool._engine.dispose()
+            results.append((
+                profile, counts["rows"] / seconds, counts["reads"] / seconds, counts["failed"]
+            ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Station Executive micro-benchmarks")
+    parser.add_argument("benchmark", choices=["events", "storage", "sqlite"])
+    parser.add_argument("-n", "--count", type=int, default=20000, help="iterations per case")
+    args = parser.parse_args()
+
+    if args.benchmark == "events":
+        print("subscribers  emits/sec")
+        for subscribers, rate in benchmark_events(emits=args.count):
+            print("{0:>11}  {1:>9.0f}".format(subscribers, rate))
+    elif args.benchmark == "storage":
+        print("batch  orm rows/sec  core rows/sec  speedup")
+        for batch, orm_rate, core_rate in benchmark_storage(rows=args.count):
+            print("{0:>5}  {1:>12.0f}  {2:>13.0f}  {3:>6.1f}x".format(
+                batch, orm_rate, core_rate, core_rate / orm_rate
+            ))
+    elif args.benchmark == "sqlite":
+        print("profile  rows/sec  reads/sec  failed reads")
+        for profile, write_rate, read_rate, failed in benchmark_sqlite():
+            print("{0:>7}  {1:>8.0f}  {2:>9.0f}  {3:>12}".format(
+                profile, write_rate, read_rate, failed
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,50 @@
 # @lint-ignore-every PYTHON3COMPATIMPORTS1
 
 import os
+import random
+import statistics
 import sys
 import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+
+import simplejson
 
 se_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(se_path)
+# Built-in tools import their own modules as top level packages
+sys.path.append(os.path.join(se_path, "stationexec", "built_in"))
 os.chdir(se_path)
 
+from stationexec.sequencer import analysis, sequence_factory
+from stationexec.sequencer.aggregation import LOOP_SUMMARY_NAME, LoopAggregate
+from stationexec.sequencer.operationstates import OperationState
+from stationexec.sequencer.sequencer import Sequencer
+from stationexec.sequencer.simulator import SequenceSimulator
+from stationexec.station import data_storage, events
+from stationexec.station.data_storage import DataStorage, StorageRecord
+from stationexec.station.storage_log import StorageLog
+from stationexec.station.payloads import ObjectUpdatePayload
+from stationexec.station.event_bridge import EventBridge, EventBridgeClient, decode_value, \
+    encode_value
 from stationexec.utilities import config, result_references
+from stationexec.utilities.cancellation import CancellationToken, current_token
+from stationexec.utilities.exceptions import AbortException, ToolInUseException
+from stationexec.utilities.time import get_utc_now
+from stationexec.utilities.uuidstr import get_uuid, str2uuid
+from stationexec.web.websocket import SocketManager
+from station_storage.duration_statistics import DurationStatistics
+from station_storage.station_storage import StationStorage
+from station_storage.tables import (
+    Logging,
+    OperationEnd,
+    OperationStart,
+    Result,
+    SequenceEnd,
+    SequenceStart,
+)
 
 
 class UtilitiesConfig(unittest.TestCase):
@@ -160,5 +195,1502 @@ class UtilitiesResultReferences(unittest.TestCase):
         )
 
 
+class SequencerAnalysis(unittest.TestCase):
+    # A and B run in parallel after Start; End waits for both; B is the long branch
+    dependencies = {"Start": [], "A": ["Start"], "B": ["Start"], "End": ["A", "B"]}
+    records = [
+        {"opid": "Start", "start": 100.0, "end": 101.0},
+        {"opid": "A", "start": 101.0, "end": 102.0},
+        {"opid": "B", "start": 101.0, "end": 104.0},
+        {"opid": "End", "start": 104.0, "end": 105.0},
+    ]
+
+    def test_analyze_run_critical_path(self):
+        run = analysis.analyze_run(self.records, self.dependencies)
+        self.assertEqual(run["critical_path"], ["Start", "B", "End"])
+        self.assertAlmostEqual(run["makespan_s"], 5.0)
+        self.assertAlmostEqual(run["theoretical_makespan_s"], 5.0)
+
+    def test_analyze_run_slack(self):
+        run = analysis.analyze_run(self.records, self.dependencies)
+        self.assertAlmostEqual(run["operations"]["A"]["slack_s"], 2.0)
+        self.assertAlmostEqual(run["operations"]["B"]["slack_s"], 0.0)
+        self.assertFalse(run["operations"]["A"]["critical"])
+
+    def test_analyze_run_tool_idle(self):
+        run = analysis.analyze_run(
+            self.records, self.dependencies, {"A": ["dmm"], "End": ["dmm"]}
+        )
+        self.assertAlmostEqual(run["tools"]["dmm"]["busy_s"], 2.0)
+        self.assertAlmostEqual(run["tools"]["dmm"]["idle_s"], 3.0)
+
+    def test_merge_loop_iterations(self):
+        timing = analysis.merge_operation_records(
+            [
+                {"opid": "A", "start": 0.0, "end": 1.0, "duration_ms": 900},
+                {"opid": "A", "start": 2.0, "end": 3.0, "duration_ms": 800},
+            ]
+        )
+        self.assertEqual(timing["A"][:2], (0.0, 3.0))
+        self.assertAlmostEqual(timing["A"][2], 1.7)
+
+    def test_analyze_history_candidates(self):
+        history = analysis.analyze_history(
+            {"seq1": self.records, "seq2": self.records}, self.dependencies
+        )
+        self.assertEqual(history["runs"], 2)
+        self.assertEqual(history["candidates"][0], "B")
+        self.assertNotIn("A", history["candidates"])
+
+    def test_topological_order_cycle(self):
+        with self.assertRaises(ValueError):
+            analysis.topological_order({"A": ["B"], "B": ["A"]})
+
+
+class SequencerSimulator(unittest.TestCase):
+    code = (
+        "from stationexec.sequencer.operation import Operation, require_tools\n"
+        "@require_tools('meter')\n"
+        "class A(Operation):\n"
+        "    pass\n"
+        "@require_tools('meter')\n"
+        "class B(Operation):\n"
+        "    pass\n"
+        "class C(Operation):\n"
+        "    pass\n"
+    )
+    sequence = [
+        {"operation": "A"},
+        {"operation": "B"},
+        {"operation": "C", "follows": ["A", "B"]},
+    ]
+    samples = {"A": [10.0], "B": [10.0], "C": [5.0]}
+    configs = {"threads": 2}
+
+    def simulator(self, code, **kwargs):
+        return SequenceSimulator(
+            self.sequence,
+            code,
+            self.configs,
+            lambda key, default=None: self.configs.get(key, default),
+            duration_samples=self.samples,
+            **kwargs
+        )
+
+    def test_parallel_operations(self):
+        # A and B run together from the first scheduler tick, C starts the tick after both end
+        code = self.code.replace("@require_tools('meter')\n", "")
+        result = self.simulator(code).run_once()
+        self.assertTrue(result["completed"])
+        self.assertAlmostEqual(result["makespan_s"], 16.0)
+
+    def test_tool_contention(self):
+        # B waits for A to return the shared tool
+        result = self.simulator(self.code).run_once()
+        self.assertAlmostEqual(result["makespan_s"], 26.5)
+
+    def test_thread_limit(self):
+        code = self.code.replace("@require_tools('meter')\n", "")
+        result = self.simulator(code, threads=1).run_once()
+        self.assertAlmostEqual(result["makespan_s"], 26.5)
+
+    def test_makespan_distribution(self):
+        self.samples = {"A": [10.0, 20.0], "B": [1.0], "C": [1.0]}
+        code = self.code.replace("@require_tools('meter')\n", "")
+        prediction = self.simulator(code, seed=1).run(runs=20)
+        self.assertEqual(prediction["runs"], 20)
+        self.assertEqual(len(prediction["samples"]), 20)
+        self.assertLessEqual(prediction["makespan_s"]["min"], prediction["makespan_s"]["p50"])
+        self.assertLessEqual(prediction["makespan_s"]["p95"], prediction["makespan_s"]["max"])
+
+
+    def test_leaves_event_subscribers(self):
+        # Callback of an operation of the sequence running on the station
+        callback = mock.Mock()
+        events.register_for_event("A", events.InfoEvents.PASS_ERROR_CODE, callback)
+        self.addCleanup(events.clear_event_subscribers, "A", events.InfoEvents.PASS_ERROR_CODE)
+        code = self.code + "loads = globals().get('loads', 0) + 1\n"
+        simulator = self.simulator(code)
+        simulator.run(runs=3)
+        subscribers = events.get_event_subscribers(events.InfoEvents.PASS_ERROR_CODE)
+        self.assertEqual(
+            [subscriber for subscriber in subscribers if subscriber[0] == "A"],
+            [("A", events.InfoEvents.PASS_ERROR_CODE, callback)],
+        )
+        self.assertEqual(simulator._operations_module.loads, 1)
+
+
+class SequencerCancellation(unittest.TestCase):
+    code = (
+        "from stationexec.sequencer.operation import Operation\n"
+        "from stationexec.utilities.cancellation import current_token\n"
+        "class A(Operation):\n"
+        "    def operation_action(self):\n"
+        "        self.sleep(60)\n"
+        "class B(Operation):\n"
+        "    def operation_action(self):\n"
+        "        current_token().wait(60)\n"
+        "class C(Operation):\n"
+        "    pass\n"
+    )
+    sequence = [
+        {"operation": "A"},
+        {"operation": "B"},
+        {"operation": "C", "follows": ["A", "B"]},
+    ]
+
+    def test_parent_cancels_children(self):
+        parent = CancellationToken()
+        child = CancellationToken(parent=parent)
+        called = []
+        child.add_callback(lambda: called.append(True))
+        parent.cancel("stop")
+        self.assertTrue(child.is_cancelled())
+        self.assertEqual(child.reason, "stop")
+        self.assertEqual(called, [True])
+        # Children of an already cancelled token start cancelled
+        self.assertTrue(CancellationToken(parent=parent).is_cancelled())
+
+    def test_detach(self):
+        parent = CancellationToken()
+        child = CancellationToken(parent=parent)
+        child.detach()
+        self.assertEqual(parent._children, [])
+        parent.cancel("stop")
+        self.assertFalse(child.is_cancelled())
+        child.detach()
+
+    def test_sleep_interrupted(self):
+        token = CancellationToken()
+        threading.Timer(0.05, token.cancel).start()
+        start = time.time()
+        with self.assertRaises(AbortException):
+            token.sleep(10)
+        self.assertLess(time.time() - start, 1)
+
+    def test_current_token_never_cancelled(self):
+        current_token().cancel()
+        self.assertFalse(current_token().is_cancelled())
+
+    # Aborted operations record an error code, which reads the station configuration
+    @mock.patch.object(config, "_system_config_data", {})
+    def test_stop_sequence(self):
+        configs = {"threads": 2}
+        sequence = sequence_factory.from_text(
+            self.sequence,
+            self.code,
+            (lambda *args: None, lambda *args: None),
+            configs,
+            runtimedata={},
+        )
+        sequencer = Sequencer(lambda key, default=None: configs.get(key, default))
+        sequencer.active_sequence = sequence
+        thread = threading.Thread(target=sequencer._execute)
+        thread.start()
+        start = time.time()
+        while len(sequencer._running) < 2 and time.time() - start < 5:
+            time.sleep(0.01)
+
+        sequencer.stop("test stop")
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        status = sequence.get_status()
+        self.assertEqual(status["runcode"], "ABORTED")
+        self.assertLess(status["info"]["abort_latency_ms"], 1000)
+        self.assertEqual(sequence.get_op_run_status("A"), OperationState.ABORTED)
+        self.assertEqual(sequence.get_op_run_status("C"), OperationState.ABORTED)
+
+    def test_history_keeps_summaries(self):
+        configs = {"sequence_history_length": 1}
+        sequencer = Sequencer(lambda key, default=None: configs.get(key, default))
+        for _ in range(2):
+            sequence = sequence_factory.from_text(
+                self.sequence,
+                self.code.replace("self.sleep(60)", "pass").replace(
+                    "current_token().wait(60)", "pass"
+                ),
+                (lambda *args: None, lambda *args: None),
+                configs,
+                runtimedata={},
+            )
+            sequencer.active_sequence = sequence
+            sequencer._execute()
+            # Every finished operation let go of the sequence token
+            self.assertEqual(sequence.cancel_token._children, [])
+
+        history = sequencer.get_sequence_history()
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[-1]["uuid"], sequence.uuid)
+        self.assertEqual(sequencer.get_status(), sequence.get_status())
+        # Callers get their own copy of the frozen status
+        sequencer.get_status()["info"]["changed"] = True
+        self.assertNotIn("changed", sequencer.get_status()["info"])
+        self.assertEqual(sequencer.get_sequence_graph()[0]["C"], ["A", "B"])
+        self.assertEqual(sequencer.get_sequence_version(), sequence.version)
+
+
+class SequencerLoopAggregation(unittest.TestCase):
+    def result(self, value, passing=True):
+        return {
+            "name": "v", "value": value, "passing": passing, "is_result": True,
+            "is_processed": True,
+        }
+
+    def test_sampled_iterations(self):
+        aggregate = LoopAggregate(sample_every=4)
+        recorded = [aggregate.start_iteration("A", str(n)) for n in range(1, 11)]
+        self.assertEqual(
+            [n for n, stored in enumerate(recorded, 1) if stored], [1, 4, 8]
+        )
+
+    def test_result_statistics(self):
+        aggregate = LoopAggregate()
+        for n, value in enumerate([2, 4, 9, 4, 6], 1):
+            aggregate.start_iteration("A", "uuid-{0}".format(n))
+            aggregate.add_results("A", [self.result(value, passing=value < 8)])
+
+        stats = aggregate.get_operation_summary("A")["results"][0]
+        self.assertEqual(stats["count"], 5)
+        self.assertEqual((stats["min"], stats["max"]), (2, 9))
+        self.assertAlmostEqual(stats["mean"], 5.0)
+        self.assertAlmostEqual(stats["stddev"], 7 ** 0.5)
+        self.assertEqual(stats["fail_count"], 1)
+        self.assertEqual(stats["first_failure"], {"iteration": 3, "value": 9})
+
+        summary = aggregate.get_summary_data()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]["operation"], "uuid-1")
+
+    def test_sequence_loop_summary(self):
+        code = (
+            "from stationexec.sequencer.operation import Operation\n"
+            "class A(Operation):\n"
+            "    pass\n"
+            "class B(Operation):\n"
+            "    pass\n"
+        )
+        sequence = sequence_factory.from_text(
+            [
+                {"operation": "A"},
+                {
+                    "loop": "repeat _config::repeats",
+                    "aggregate": True,
+                    "operations": [{"operation": "B", "follows": ["A"]}],
+                },
+            ],
+            code,
+            (lambda *args: None, lambda *args: None),
+            {"repeats": 3},
+            runtimedata={},
+        )
+        self.assertTrue(sequence.start_op_iteration("A"))
+        self.assertTrue(sequence.start_op_iteration("B"))
+        self.assertFalse(sequence.start_op_iteration("B"))
+        self.assertFalse(sequence.is_op_iteration_recorded("B"))
+        # Loop still running - nothing to store unless the sequence is stopping
+        self.assertEqual(sequence.pop_loop_summaries(), [])
+        self.assertEqual(len(sequence.pop_loop_summaries(finished_only=False)), 1)
+        self.assertEqual(sequence.pop_loop_summaries(finished_only=False), [])
+
+    # Aborted operations record an error code, which reads the station configuration
+    @mock.patch.object(config, "_system_config_data", {})
+    def test_stop_during_iteration(self):
+        code = (
+            "from stationexec.sequencer.operation import Operation\n"
+            "class B(Operation):\n"
+            "    def operation_action(self):\n"
+            "        self.save_result('v', 5, condition='< 10')\n"
+            "        self.sleep(60)\n"
+        )
+        configs = {"threads": 2}
+        sequence = sequence_factory.from_text(
+            [{"loop": "repeat 3", "aggregate": True, "operations": [{"operation": "B"}]}],
+            code,
+            (lambda *args: None, lambda *args: None),
+            configs,
+            runtimedata={},
+        )
+        sequencer = Sequencer(lambda key, default=None: configs.get(key, default))
+        sequencer.active_sequence = sequence
+        stored = []
+        sequencer._emit_event = lambda event, data: stored.append((event, data))
+        thread = threading.Thread(target=sequencer._execute)
+        thread.start()
+        start = time.time()
+        while not sequencer._running and time.time() - start < 5:
+            time.sleep(0.01)
+
+        sequencer.stop("test stop")
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        # The summary is stored once the stopped iteration is done, with its results
+        summaries = [
+            simplejson.loads(data["value"]) for event, data in stored
+            if event is events.StorageEvents.ON_DATA_STORE and data["name"] == LOOP_SUMMARY_NAME
+        ]
+        self.assertEqual(len(summaries), 1)
+        self.assertEqual(summaries[0]["results"][0]["count"], 1)
+
+
+class EventBus(unittest.TestCase):
+    event = events.InfoEvents.OBJECT_UPDATE
+
+    def tearDown(self):
+        events.clear_event_subscribers("test", self.event)
+
+    def test_payload_not_shared(self):
+        received = []
+
+        def subscriber(**kwargs):
+            kwargs["value"] = 2
+            received.append(kwargs)
+
+        events.register_for_event("test", self.event, subscriber)
+        events.register_for_event("test", self.event, subscriber)
+        payload = {"value": 1}
+        events.emit_event(self.event, payload)
+        self.assertEqual(payload, {"value": 1})
+        self.assertEqual(len(received), 2)
+        self.assertEqual(received[0]["_event"], self.event)
+
+    def test_register_during_emit(self):
+        calls = []
+
+        def subscriber(**kwargs):
+            calls.append(kwargs["_event"])
+            # Changes made while emitting apply to the next emit
+            events.unregister_from_event("test", self.event, subscriber)
+            events.register_for_event("test", self.event, late_subscriber)
+
+        def late_subscriber(**kwargs):
+            calls.append("late")
+
+        events.register_for_event("test", self.event, subscriber)
+        events.emit_event(self.event)
+        self.assertEqual(calls, [self.event])
+        events.emit_event(self.event)
+        self.assertEqual(calls, [self.event, "late"])
+
+    def test_clear_subscribers(self):
+        for _ in range(3):
+            events.register_for_event("test", self.event, lambda **kwargs: None)
+        events.register_for_event("other", self.event, lambda **kwargs: None)
+        events.clear_event_subscribers("test", self.event)
+        self.assertEqual(
+            [source for source, _event, _callback in events.get_event_subscribers(self.event)],
+            ["other"],
+        )
+        events.clear_event_subscribers("other", self.event)
+
+    @staticmethod
+    def _gated_subscriber(overflow, maxsize, **kwargs):
+        """ AsyncSubscriber whose callback waits for a gate - to fill its queue """
+        gate = threading.Event()
+        received = []
+
+        def callback(**payload):
+            gate.wait(5)
+            received.append(payload["value"])
+
+        return events.AsyncSubscriber(callback, maxsize, overflow, **kwargs), gate, received
+
+    def _emit_values(self, subscriber, values, source="test"):
+        events.register_for_event("test", self.event, subscriber)
+        for value in values:
+            events.emit_event(self.event, {"source": source, "value": value})
+            if value == values[0]:
+                # Wait for the worker to pick up the first payload, so the rest queue behind it
+                self.assertTrue(self._wait_for(lambda: subscriber.get_depth() == 0))
+
+    @staticmethod
+    def _wait_for(condition, timeout=5):
+        end = time.time() + timeout
+        while not condition():
+            if time.time() > end:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def test_async_keeps_order(self):
+        subscriber, gate, received = self._gated_subscriber(events.Overflow.BLOCK, 1000)
+        gate.set()
+        self._emit_values(subscriber, list(range(200)))
+        self.assertTrue(subscriber.drain(5))
+        self.assertEqual(received, list(range(200)))
+        subscriber.close()
+
+    def test_async_drop_oldest(self):
+        subscriber, gate, received = self._gated_subscriber(events.Overflow.DROP_OLDEST, 2)
+        self._emit_values(subscriber, [0, 1, 2, 3, 4])
+        gate.set()
+        self.assertTrue(subscriber.drain(5))
+        self.assertEqual(received, [0, 3, 4])
+        self.assertEqual(subscriber.dropped, 2)
+        subscriber.close()
+
+    def test_async_drop_only_droppable(self):
+        subscriber, gate, received = self._gated_subscriber(
+            events.Overflow.DROP_OLDEST, 2, droppable=lambda payload: payload["value"] % 2
+        )
+        self._emit_values(subscriber, [0, 1, 2, 3, 4])
+        emitter = threading.Thread(
+            target=events.emit_event, args=(self.event, {"source": "test", "value": 6})
+        )
+        emitter.start()
+        emitter.join(0.2)
+        # Only even values are queued - nothing may be dropped, so the emitter waits
+        self.assertTrue(emitter.is_alive())
+        gate.set()
+        emitter.join(5)
+        self.assertTrue(subscriber.drain(5))
+        self.assertEqual(received, [0, 2, 4, 6])
+        self.assertEqual(subscriber.dropped, 2)
+        subscriber.close()
+
+    def test_async_coalesce(self):
+        subscriber, gate, received = self._gated_subscriber(events.Overflow.COALESCE, 10)
+        self._emit_values(subscriber, [0, 1, 2])
+        events.emit_event(self.event, {"source": "other", "value": 10})
+        events.emit_event(self.event, {"source": "test", "value": 3})
+        gate.set()
+        self.assertTrue(subscriber.drain(5))
+        # Newest payload of each source, in the position of its first queued payload
+        self.assertEqual(received, [0, 3, 10])
+        self.assertEqual(subscriber.coalesced, 2)
+        subscriber.close()
+
+    def test_async_block(self):
+        subscriber, gate, received = self._gated_subscriber(events.Overflow.BLOCK, 1)
+        self._emit_values(subscriber, [0, 1])
+        emitter = threading.Thread(
+            target=events.emit_event, args=(self.event, {"source": "test", "value": 2})
+        )
+        emitter.start()
+        emitter.join(0.2)
+        # Queue is full - the emitter waits for the subscriber
+        self.assertTrue(emitter.is_alive())
+        gate.set()
+        emitter.join(5)
+        self.assertTrue(subscriber.drain(5))
+        self.assertEqual(received, [0, 1, 2])
+        subscriber.close()
+
+    def test_async_unregister_and_close(self):
+        received = []
+
+        def callback(**payload):
+            received.append(payload["value"])
+
+        subscriber = events.AsyncSubscriber(callback)
+        events.register_for_event("test", self.event, subscriber)
+        subscriber.close(5)
+        # Delivered on the emitting thread once closed
+        events.emit_event(self.event, {"value": 1})
+        self.assertEqual(received, [1])
+        # The registration can be removed with the original callback
+        events.unregister_from_event("test", self.event, callback)
+        self.assertEqual(events.get_event_subscribers(self.event), ())
+
+    def test_websocket_never_drops_one_shot_events(self):
+        manager = SocketManager()
+        manager.initialize()
+
+        subscribers = set()
+        for event in events.InfoEvents:
+            self.addCleanup(events.clear_event_subscribers, "SocketManager", event)
+            subscribers.update(
+                callback for source, _event, callback in events.get_event_subscribers(event)
+                if source == "SocketManager"
+            )
+        # One worker for every event, so the page receives them in emit order
+        subscriber, = subscribers
+        self.addCleanup(subscriber.close)
+        self.assertIs(subscriber.overflow, events.Overflow.DROP_OLDEST)
+        for event in events.InfoEvents:
+            droppable = subscriber._droppable({"_event": event})
+            if event is events.InfoEvents.OBJECT_UPDATE:
+                self.assertTrue(droppable)
+            if event in (
+                events.InfoEvents.LOG, events.InfoEvents.USER_INPUT_REQUEST,
+                events.InfoEvents.POPUP_UPDATE, events.InfoEvents.SEQUENCE_FINISHED,
+                events.InfoEvents.ALERT_UPDATE,
+            ):
+                self.assertFalse(droppable)
+
+    def test_statistics(self):
+        def failing(**kwargs):
+            raise ValueError("test")
+
+        def slow(**kwargs):
+            time.sleep(0.02)
+
+        events.reset_event_statistics()
+        events.register_for_event("test", self.event, failing)
+        events.register_for_event("test", self.event, slow)
+        events.set_slow_subscriber_threshold(0.01)
+        try:
+            for _ in range(3):
+                events.emit_event(self.event)
+        finally:
+            events.set_slow_subscriber_threshold(0.05)
+        stats = events.get_event_statistics()
+        self.assertEqual(stats["emits"][str(self.event)], 3)
+        subscribers = {status["callback"].split(".")[-1]: status for status in stats["subscribers"]}
+        self.assertEqual(subscribers["failing"]["exceptions"], 3)
+        self.assertEqual(subscribers["slow"]["calls"], 3)
+        self.assertEqual(sum(subscribers["slow"]["histogram"].values()), 3)
+        self.assertTrue(subscribers["slow"]["slow"])
+        self.assertIn("{0}:{1}".format(self.event, subscribers["slow"]["callback"]),
+                      stats["slow_subscribers"])
+        # Statistics of removed subscribers are dropped
+        events.clear_event_subscribers("test", self.event)
+        self.assertEqual(events.get_event_statistics()["subscribers"], [])
+
+    def test_statistics_of_unregistered_subscriber(self):
+        received = []
+
+        def callback(**kwargs):
+            received.append(kwargs)
+
+        events.reset_event_statistics()
+        events.register_for_event("test", self.event, callback)
+        subscribers = events.get_event_subscribers(self.event)
+        events.unregister_from_event("test", self.event, callback)
+        # An emit that took its subscribers before the unregister still delivers to it, but its
+        # statistics are not added back
+        events._deliver(subscribers, {"value": 1})
+        self.assertEqual(received, [{"value": 1}])
+        self.assertEqual(events.get_event_statistics()["subscribers"], [])
+        # Emits counted from many threads are all counted
+        threads = [
+            threading.Thread(target=lambda: [events.emit_event(self.event) for _ in range(500)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(events.get_event_statistics()["emits"][str(self.event)], 2000)
+
+    def test_typed_payload(self):
+        received = []
+        typed = []
+
+        class TypedSubscriber(object):
+            receives_payload = True
+
+            def __call__(self, payload):
+                typed.append(payload)
+
+        events.register_for_event("test", self.event, lambda **kwargs: received.append(kwargs))
+        events.register_for_event("test", self.event, TypedSubscriber())
+        payload = ObjectUpdatePayload("test", "field", 3)
+        events.emit_event(self.event, payload)
+        # Plain subscribers still get keyword arguments
+        self.assertEqual(
+            received, [{"source": "test", "target": "field", "value": 3, "_event": self.event}]
+        )
+        self.assertIs(typed[0], payload)
+        self.assertEqual(payload.get("_event"), self.event)
+        self.assertEqual(dict(payload), {"source": "test", "target": "field", "value": 3})
+
+    def test_async_typed_payload(self):
+        subscriber, gate, received = self._gated_subscriber(events.Overflow.COALESCE, 10)
+        events.register_for_event("test", self.event, subscriber)
+        events.emit_event(self.event, ObjectUpdatePayload("test", "field", 0))
+        self.assertTrue(self._wait_for(lambda: subscriber.get_depth() == 0))
+        for value in range(1, 4):
+            events.emit_event(self.event, ObjectUpdatePayload("test", "field", value))
+        gate.set()
+        self.assertTrue(subscriber.drain(5))
+        self.assertEqual(received, [0, 3])
+        subscriber.close()
+
+    def test_coalescing_window(self):
+        received = []
+        events.register_for_event("test", self.event, lambda **kwargs: received.append(kwargs))
+        events.set_event_coalescing(self.event, 0.2)
+        try:
+            for value in range(5):
+                events.emit_event(self.event, {"source": "a", "value": value})
+            events.emit_event(self.event, {"source": "b", "value": 10})
+            # The first payload is delivered at once, the rest when the window closes
+            self.assertEqual([payload["value"] for payload in received], [0])
+            self.assertTrue(self._wait_for(lambda: len(received) == 3))
+            self.assertEqual([payload["value"] for payload in received], [0, 4, 10])
+        finally:
+            events.set_event_coalescing(self.event, 0)
+
+    def test_coalescing_batches(self):
+        batches = []
+        payloads = []
+
+        def batch_subscriber(**kwargs):
+            batches.append([item["value"] for item in kwargs.get("_batch", [kwargs])])
+
+        batch_subscriber.accepts_batches = True
+        events.register_for_event("test", self.event, batch_subscriber)
+        events.register_for_event("test", self.event, lambda **kwargs: payloads.append(kwargs))
+        events.set_event_coalescing(self.event, 0.2, batch=True)
+        try:
+            for value in range(4):
+                events.emit_event(self.event, {"source": "a", "value": value})
+        finally:
+            # Stopping delivers what is held
+            events.set_event_coalescing(self.event, 0)
+        self.assertEqual(batches, [[0], [1, 2, 3]])
+        self.assertEqual([payload["value"] for payload in payloads], [0, 1, 2, 3])
+
+
+
+class EventBridgeTest(unittest.TestCase):
+    event = events.InfoEvents.OBJECT_UPDATE
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "events.sock")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @staticmethod
+    def _wait_for(condition, timeout=5):
+        end = time.time() + timeout
+        while not condition():
+            if time.time() > end:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def test_encoding(self):
+        value = {"a": [1, -2 ** 40, 2.5, None, True, False], "b": b"\x00\x01", "c": "text"}
+        self.assertEqual(decode_value(encode_value(value)), value)
+        # Other objects are sent as their string form
+        self.assertEqual(decode_value(encode_value(self.event)), str(self.event))
+
+    def test_topic_filter(self):
+        bridge = EventBridge(self.path, [self.event, events.InfoEvents.MESSAGE_UPDATE])
+        bridge.start()
+        client = EventBridgeClient(self.path, ["InfoEvents.OBJECT"], timeout=5)
+        try:
+            self.assertTrue(self._wait_for(
+                lambda: [c["topics"] for c in bridge.get_status()["clients"]] ==
+                [["InfoEvents.OBJECT"]]
+            ))
+            events.emit_event(events.InfoEvents.MESSAGE_UPDATE, {"value": 0})
+            # The bridge worker waits for the lock; the event still carries its emit time
+            with bridge._lock:
+                before = time.time()
+                events.emit_event(self.event, {"source": "test", "value": 1})
+                after = time.time()
+                time.sleep(0.05)
+            topic, timestamp, payload = client.receive()
+            self.assertEqual(topic, str(self.event))
+            self.assertEqual(payload, {"source": "test", "value": 1})
+            self.assertTrue(before <= timestamp <= after)
+        finally:
+            client.close()
+            bridge.stop()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_slow_consumer_dropped(self):
+        bridge = EventBridge(self.path, [self.event], max_pending_bytes=1024)
+        bridge.start()
+        client = EventBridgeClient(self.path, timeout=5)
+        try:
+            self.assertTrue(self._wait_for(
+                lambda: [c["topics"] for c in bridge.get_status()["clients"]] == [[]]
+            ))
+            # The client never reads - once the socket buffers fill, it is disconnected
+            for _ in range(2000):
+                events.emit_event(self.event, {"source": "test", "value": "x" * 1000})
+            self.assertTrue(self._wait_for(lambda: bridge.dropped_clients == 1))
+            self.assertEqual(bridge.get_status()["clients"], [])
+        finally:
+            client.close()
+            bridge.stop()
+
+
+class StorageWorker(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patches = [
+            mock.patch("stationexec.station.data_storage._set_storage_callbacks"),
+            mock.patch("stationexec.station.data_storage.emit_event_non_blocking"),
+            mock.patch(
+                "stationexec.station.data_storage.get_all_paths",
+                return_value={"data_folder": self.directory.name},
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.stored = []
+        self.fail_store = False
+        self.fail_event = None
+        self.storage = None
+
+    def tearDown(self):
+        if self.storage is not None:
+            self.storage.shutdown()
+            self.storage.join(5)
+        self.directory.cleanup()
+
+    def _start(self, handlers=(), retrievals=(), tools=None, **kwargs):
+        def store(data, evt):
+            if self.fail_store or evt == self.fail_event:
+                raise IOError("Database offline")
+            if any(record.get("poison") for record in data):
+                raise ValueError("Schema violation")
+            self.stored.extend(data)
+
+        def get_station(data):
+            return None
+
+        self.storage = DataStorage(**kwargs)
+        self.storage.set_tool_management(*(tools or (mock.Mock(), mock.Mock())))
+        self.storage.register_event(
+            "test", events.RetrievalEvents.GET_STATION_DATA_LOCAL, get_station
+        )
+        self.storage.register_event(
+            "test", events.StorageEvents.ON_REGISTER_STATION_LOCAL, store
+        )
+        for event in (events.StorageEvents.ON_OPERATION_END, events.StorageEvents.ON_SEQUENCE_END):
+            self.storage.register_event("test", event, store)
+        for source, method in handlers:
+            self.storage.register_event(source, events.StorageEvents.ON_OPERATION_END, method)
+        for source, event, method in retrievals:
+            self.storage.register_event(source, event, method)
+        self.storage.initialize()
+
+    @staticmethod
+    def _wait_for(condition, timeout=5):
+        end = time.time() + timeout
+        while not condition():
+            if time.time() > end:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _trigger(self, count, event=events.StorageEvents.ON_OPERATION_END):
+        for index in range(count):
+            self.storage.trigger_event(event, {"index": index})
+
+    def test_flush_records(self):
+        self._start(flush_records=3, flush_age=60)
+        self._trigger(2)
+        time.sleep(0.2)
+        self.assertEqual(self.stored, [])
+        self.assertEqual(self.storage.get_status()["pending_records"], 2)
+        self._trigger(1)
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 3))
+        self.assertEqual([record["index"] for record in self.stored], [0, 1, 0])
+        self.assertEqual(self.stored[0]["_source"], "test")
+        status = self.storage.get_status()
+        self.assertEqual((status["pending_records"], status["records_stored"]), (0, 3))
+        self.assertEqual(status["flushes"], 1)
+
+    def test_flush_age_and_sequence_end(self):
+        self._start(flush_records=100, flush_age=0.2)
+        self._trigger(1)
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 1))
+        self.assertGreaterEqual(self.storage.get_status()["max_wait_ms"], 150)
+
+        self.storage._workers["test"].flush_age = 60
+        self._trigger(1)
+        self._trigger(1, events.StorageEvents.ON_SEQUENCE_END)
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 3))
+
+    def test_retry_after_failure(self):
+        self._start(flush_records=1, write_period=0.3)
+        self.fail_store = True
+        self._trigger(1)
+        self.assertTrue(self._wait_for(lambda: self.storage.get_status()["flushes"] == 1))
+        self.fail_store = False
+        # Not retried before write_period
+        time.sleep(0.1)
+        self.assertEqual(self.stored, [])
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 1))
+        self.assertEqual(self.storage.get_status()["pending_records"], 0)
+
+    def test_partial_batch(self):
+        self._start(flush_records=5, write_period=0.2)
+        self.fail_event = events.StorageEvents.ON_SEQUENCE_END
+        self._trigger(2)
+        self._trigger(1, events.StorageEvents.ON_SEQUENCE_END)
+        self._trigger(2)
+        # The run before the failing event is stored; the rest waits, in order
+        self.assertTrue(self._wait_for(lambda: self.storage.get_status()["flushes"] == 1))
+        self.assertEqual(len(self.stored), 2)
+        status = self.storage.get_status()
+        self.assertEqual((status["pending_records"], status["log"]["unacknowledged"]), (3, 3))
+        self.fail_event = None
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 5))
+        self.assertEqual(
+            [record["_event"] for record in self.stored[1:4]],
+            [events.StorageEvents.ON_OPERATION_END, events.StorageEvents.ON_SEQUENCE_END,
+             events.StorageEvents.ON_OPERATION_END],
+        )
+        self.assertEqual(self.storage.get_status()["pending_records"], 0)
+
+    def test_backlog_drain(self):
+        self._start(flush_records=10 ** 6, flush_age=60)
+        self._trigger(20000)
+        self.storage.flush()
+        self.assertTrue(self._wait_for(
+            lambda: self.storage.get_status()["records_stored"] == 20000, timeout=10
+        ))
+        self.assertEqual(len(self.stored), 20000)
+
+    def test_independent_sinks(self):
+        release = threading.Event()
+        remote_calls = []
+
+        def store_remote(data, evt):
+            remote_calls.append(len(data))
+            release.wait(5)
+
+        self._start(
+            handlers=[("remote", store_remote)],
+            flush_records=1,
+            batch_records=2,
+            sinks={"remote": {"flush_records": 5}},
+        )
+        self._trigger(5)
+        self.assertTrue(self._wait_for(lambda: remote_calls == [2]))
+        # The blocked remote source does not hold up the local one
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 5))
+        self._trigger(1)
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 6))
+        release.set()
+        self.assertTrue(self._wait_for(lambda: sum(remote_calls) == 6))
+        status = self.storage.get_status()["sinks"]
+        self.assertEqual(status["remote"]["flush_records"], 5)
+        self.assertEqual(status["test"]["flush_records"], 1)
+
+    def test_spill_to_disk(self):
+        spill_threads = []
+        write_segment = data_storage.write_segment
+
+        def write_and_record(*args):
+            spill_threads.append(threading.current_thread().name)
+            write_segment(*args)
+
+        self._start(flush_records=1, write_period=0.2, memory_records=10)
+        self.fail_store = True
+        patch = mock.patch("stationexec.station.data_storage.write_segment", write_and_record)
+        with patch:
+            self.storage.trigger_event(
+                events.StorageEvents.ON_OPERATION_END, {"blob": b"\xff"}
+            )
+            self._trigger(49)
+            self.assertTrue(self._wait_for(
+                lambda: self.storage.get_status()["sinks"]["test"]["spilled_records"] >= 30
+            ))
+        self.assertEqual(self.storage.get_status()["sinks"]["test"]["pending_records"], 50)
+        # Written by the spill thread, not the triggering thread
+        self.assertEqual(set(spill_threads), {"storage_spill:test"})
+        self.assertTrue(os.listdir(os.path.join(self.directory.name, "storage_spill")))
+
+        # Spilled records are read back, in order, once the sink works again - without
+        # holding the lock that triggering threads append with
+        sink, = self.storage._workers["test"].sinks.values()
+        read_segment = data_storage.read_segment
+        lock_free = []
+
+        def read_and_check(path):
+            lock_free.append(sink._lock.acquire(blocking=False))
+            if lock_free[-1]:
+                sink._lock.release()
+            return read_segment(path)
+
+        self.fail_store = False
+        with mock.patch("stationexec.station.data_storage.read_segment", read_and_check):
+            self.assertTrue(self._wait_for(lambda: len(self.stored) == 50))
+        self.assertTrue(lock_free)
+        self.assertTrue(all(lock_free))
+        self.assertEqual(self.stored[0]["blob"], b"\xff")
+        self.assertEqual([record["index"] for record in self.stored[1:]], list(range(49)))
+        self.assertEqual(self.storage.get_status()["sinks"]["test"]["spilled_records"], 0)
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, "storage_spill")), [])
+
+    def test_hard_limit(self):
+        self._start(flush_records=1, write_period=0.2, max_pending_records=3)
+        self.fail_store = True
+        self._trigger(3)
+        producer = threading.Thread(target=self._trigger, args=(1,))
+        producer.start()
+        producer.join(0.3)
+        # The producer waits until records are stored
+        self.assertTrue(producer.is_alive())
+        self.fail_store = False
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 4))
+        self.assertEqual(self.storage.get_status()["sinks"]["test"]["producer_waits"], 1)
+
+    def test_dead_letter(self):
+        self._start(flush_records=8, flush_age=60)
+        for index in range(8):
+            self.storage.trigger_event(
+                events.StorageEvents.ON_OPERATION_END,
+                {"index": index, "poison": index in (2, 5), "blob": b"\xff"},
+            )
+        # The poison records are isolated; every other record is stored
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 6))
+        self.assertEqual([record["index"] for record in self.stored], [0, 1, 3, 4, 6, 7])
+        entries = self.storage.get_dead_letters("test")
+        self.assertEqual([entry["data"]["index"] for entry in entries], [2, 5])
+        self.assertEqual(entries[0]["exception"], "ValueError")
+        self.assertEqual(entries[0]["data"]["blob"], b"\xff")
+        self.assertTrue(self._wait_for(
+            lambda: self.storage.get_status()["sinks"]["test"]["dead_lettered"] == 2
+        ))
+        self.assertEqual(self.storage.get_status()["log"]["unacknowledged"], 0)
+
+        # Fix and requeue one, discard the other
+        fixed = dict(entries[0]["data"], poison=False)
+        self.assertTrue(self.storage.requeue_dead_letter(entries[0]["id"], fixed))
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 7))
+        self.assertEqual(self.stored[-1]["index"], 2)
+        self.assertTrue(self.storage.discard_dead_letter(entries[1]["id"]))
+        self.assertFalse(self.storage.discard_dead_letter(entries[1]["id"]))
+        self.assertEqual(self.storage.get_dead_letters(), [])
+
+    def test_dead_letter_store_unavailable(self):
+        self._start(flush_records=1, write_period=0.2)
+        with mock.patch.object(self.storage._dead_letters, "add", side_effect=OSError("full")):
+            self.storage.trigger_event(
+                events.StorageEvents.ON_OPERATION_END, {"index": 0, "poison": True}
+            )
+            self.assertTrue(self._wait_for(lambda: self.storage.get_status()["flushes"] >= 1))
+            self.assertEqual(self.storage.get_status()["pending_records"], 1)
+        # The worker kept running and moves the record once the store can be written
+        self.assertTrue(self._wait_for(
+            lambda: self.storage.get_status()["sinks"]["test"]["dead_lettered"] == 1
+        ))
+        self.assertEqual(self.storage.get_status()["pending_records"], 0)
+
+    def test_snapshot(self):
+        self._start(flush_records=2, flush_age=60)
+        blob = b"\x00\xff" * 1000
+        data = {"nested": {"values": [1, 2]}, "blob": blob}
+        self.storage.trigger_event(events.StorageEvents.ON_OPERATION_END, data)
+        # Changes after the event are not stored
+        data["nested"]["values"].append(3)
+        data["added"] = True
+        record = self.storage._workers["test"].sinks[self.storage._storage_events[
+            events.StorageEvents.ON_OPERATION_END][0][2]].records[0]
+        self.assertIsInstance(record, StorageRecord)
+        with self.assertRaises(AttributeError):
+            record.data = {}
+        self.storage.trigger_event(events.StorageEvents.ON_SEQUENCE_END, {})
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 2))
+        stored = self.stored[0]
+        self.assertEqual(stored["nested"], {"values": [1, 2]})
+        self.assertNotIn("added", stored)
+        # Binary values are passed by reference
+        self.assertIs(stored["blob"], blob)
+        self.assertEqual(stored["_event"], events.StorageEvents.ON_OPERATION_END)
+        self.assertNotIn("_source", record.data)
+
+    def test_recovery_from_log(self):
+        self._start(flush_records=1, write_period=60)
+        self.fail_store = True
+        self.storage.trigger_event(
+            events.StorageEvents.ON_OPERATION_END, {"index": 2, "blob": b"\x00\xff"}
+        )
+        self._trigger(2)
+        self.assertTrue(self._wait_for(lambda: self.storage.get_status()["flushes"] >= 1))
+        self.storage.shutdown()
+        self.storage.join(5)
+
+        # The next run stores what the last one could not
+        self.fail_store = False
+        self._start(flush_records=100, flush_age=60)
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 3))
+        self.assertEqual(sorted(record["index"] for record in self.stored), [0, 1, 2])
+        self.assertEqual(self.stored[0]["blob"], b"\x00\xff")
+        self.assertTrue(self._wait_for(
+            lambda: self.storage.get_status()["log"]["unacknowledged"] == 0
+        ))
+
+
+    def test_metrics_and_lag(self):
+        self._start(flush_records=1, write_period=0.2, batch_records=2, lag_warning_s=0.3)
+        self.fail_store = True
+        self._trigger(3)
+        self.assertTrue(self._wait_for(
+            lambda: self.storage.get_status()["sinks"]["test"]["lagging"]
+        ))
+        status = self.storage.get_status()
+        self.assertEqual(status["lagging"], ["test"])
+        self.assertGreater(status["oldest_record_s"], 0.3)
+        self.assertEqual(status["sinks"]["test"]["handlers"]["store"]["pending_records"], 3)
+        self.assertGreaterEqual(status["retries"], 1)
+        self.assertEqual(len(self.storage.get_lag_warnings()), 1)
+        # The status shows the lag at once; the event is emitted when the flush finishes
+        lag_event = mock.call(events.InfoEvents.STORAGE_LAG, mock.ANY)
+        self.assertTrue(self._wait_for(
+            lambda: lag_event in data_storage.emit_event_non_blocking.call_args_list
+        ))
+
+        self.fail_store = False
+        self.assertTrue(self._wait_for(
+            lambda: not self.storage.get_status()["sinks"]["test"]["lagging"]
+        ))
+        self.assertEqual(len(self.stored), 3)
+        self.assertEqual(self.storage.get_lag_warnings(), [])
+        status = self.storage.get_status()["sinks"]["test"]
+        self.assertIsNone(status["oldest_record_s"])
+        self.assertGreater(status["records_per_s"], 0)
+        self.assertEqual(sum(status["batch_histogram"].values()), status["batches"])
+        self.assertGreater(status["batch_histogram"]["<=10"], 0)
+        self.assertEqual(sum(status["flush_histogram"].values()), status["flushes"])
+
+    def test_retrieval_cache(self):
+        calls = []
+
+        def get_operations(**kwargs):
+            calls.append(kwargs)
+            return {"op": [len(calls)]}
+
+        event = events.RetrievalEvents.GET_SEQUENCE_OPERATIONS
+        self._start(
+            retrievals=[("test", event, get_operations)],
+            flush_records=1,
+            retrieval_ttls={"GET_SEQUENCE_OPERATIONS": 0.3},
+        )
+        first = self.storage.trigger_event(event, {"sequence_uuid": "a"})
+        first["op"].append(0)
+        # Same arguments - served from the cache, as a copy
+        self.assertEqual(self.storage.trigger_event(event, {"sequence_uuid": "a"}), {"op": [1]})
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0]["source"], "test")
+        self.storage.trigger_event(event, {"sequence_uuid": "b"})
+        self.assertEqual(len(calls), 2)
+
+        # Storing an operation end drops the cached results
+        self._trigger(1)
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 1))
+        self.assertEqual(self.storage.trigger_event(event, {"sequence_uuid": "a"}), {"op": [3]})
+        # Storing unrelated events does not
+        self._trigger(1, events.StorageEvents.ON_REGISTER_STATION_LOCAL)
+        self.assertTrue(self._wait_for(lambda: len(self.stored) == 2))
+        self.storage.trigger_event(event, {"sequence_uuid": "a"})
+        self.assertEqual(len(calls), 3)
+
+        # Results expire after their TTL
+        time.sleep(0.35)
+        self.storage.trigger_event(event, {"sequence_uuid": "a"})
+        self.assertEqual(len(calls), 4)
+        cache = self.storage.get_status()["retrieval_cache"]
+        self.assertEqual((cache["hits"], cache["misses"]), (2, 4))
+
+    def test_retrieval_not_held_by_flush(self):
+        tool_lock = threading.Lock()
+
+        def checkout_tool(owner, tool_id):
+            if not tool_lock.acquire(False):
+                raise ToolInUseException(tool_id)
+            return tool_id
+
+        def return_tool(owner, tool_ref):
+            tool_lock.release()
+
+        def store_slow(data, evt):
+            time.sleep(0.1)
+
+        self._start(
+            handlers=[("tool.db", store_slow)],
+            retrievals=[
+                ("tool.db", events.RetrievalEvents.GET_SEQUENCES, lambda **kwargs: ["seq"])
+            ],
+            tools=(checkout_tool, return_tool),
+            flush_records=20,
+            batch_records=1,
+        )
+        self._trigger(20)
+        self.assertTrue(self._wait_for(tool_lock.locked))
+        # The worker returns the tool after its current batch instead of the whole flush
+        started = time.monotonic()
+        self.assertEqual(
+            self.storage.trigger_event(events.RetrievalEvents.GET_SEQUENCES, {}), ["seq"]
+        )
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertTrue(self._wait_for(
+            lambda: self.storage.get_status()["sinks"]["tool.db"]["records_stored"] == 20
+        ))
+        self.assertEqual(self.storage.get_status()["sinks"]["tool.db"]["flushes"], 1)
+
+
+class StorageWriteAheadLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay_unacknowledged(self):
+        storage_log = StorageLog(self.directory.name, segment_bytes=200)
+        self.assertEqual(storage_log.open(), [])
+        ids = storage_log.append([{"value": index} for index in range(10)])
+        storage_log.ack(ids[:4])
+        ids += storage_log.append([{"value": 10}])
+        storage_log.ack([ids[5], ids[10]])
+        storage_log.close()
+
+        storage_log = StorageLog(self.directory.name, segment_bytes=200)
+        records = storage_log.open()
+        self.assertEqual([record["value"] for record in records], [4, 6, 7, 8, 9])
+        # New ids continue after the ids of the previous run
+        self.assertGreater(storage_log.append([{"value": 11}])[0], ids[-1])
+        storage_log.close()
+
+    def test_acknowledged_segments_deleted(self):
+        storage_log = StorageLog(self.directory.name, segment_bytes=100)
+        storage_log.open()
+        ids = []
+        for index in range(20):
+            ids += storage_log.append([{"value": index}])
+        self.assertGreater(storage_log.get_status()["segments"], 3)
+        storage_log.ack(ids)
+        storage_log.append([{"value": 20}])
+        status = storage_log.get_status()
+        self.assertEqual((status["segments"], status["unacknowledged"]), (1, 1))
+        storage_log.close()
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+
+    def test_torn_frame(self):
+        storage_log = StorageLog(self.directory.name)
+        storage_log.open()
+        storage_log.append([{"value": 1}, {"value": 2}])
+        storage_log.close()
+        path = os.path.join(self.directory.name, os.listdir(self.directory.name)[0])
+        # Cut the last frame short, as a crash in the middle of a write would
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 3)
+
+        storage_log = StorageLog(self.directory.name)
+        with mock.patch("stationexec.station.storage_log.log") as log_mock:
+            records = storage_log.open()
+        self.assertEqual([record["value"] for record in records], [1])
+        self.assertTrue(log_mock.warning.called)
+        storage_log.close()
+
+    def test_bytes_sections(self):
+        blob = bytes(range(256)) * 4
+        storage_log = StorageLog(self.directory.name)
+        storage_log.open()
+        storage_log.append([{"blob": blob, "nested": [b"", {"value": b"\x00"}]}])
+        storage_log.close()
+        path = os.path.join(self.directory.name, os.listdir(self.directory.name)[0])
+        with open(path, "rb") as f:
+            contents = f.read()
+        # Written as it is, not as base64
+        self.assertIn(blob, contents)
+        self.assertLess(len(contents), len(blob) + 200)
+
+        storage_log = StorageLog(self.directory.name)
+        records = storage_log.open()
+        self.assertEqual(records[0]["blob"], blob)
+        self.assertEqual(records[0]["nested"], [b"", {"value": b"\x00"}])
+        storage_log.close()
+
+
+
+class StationStorageDurationStatistics(unittest.TestCase):
+    def test_first_durations_exact(self):
+        stats = DurationStatistics()
+        for seconds in (3, 1, 2, 5, 4):
+            stats.add(seconds)
+        self.assertEqual((stats.count, stats.mean, stats.p50, stats.p95), (5, 3.0, 3.0, 5.0))
+        self.assertAlmostEqual(stats.variance, 2.5)
+        self.assertAlmostEqual(stats.ewma, 3.1872)
+
+    def test_streaming_estimates(self):
+        durations = [random.Random(7).lognormvariate(1, 0.5) for _ in range(2000)]
+        stats = DurationStatistics()
+        for seconds in durations:
+            stats.add(seconds)
+        quantiles = statistics.quantiles(durations, n=100)
+        self.assertAlmostEqual(stats.mean, statistics.mean(durations))
+        self.assertAlmostEqual(stats.variance, statistics.variance(durations))
+        self.assertLess(abs(stats.p50 - quantiles[49]) / quantiles[49], 0.05)
+        self.assertLess(abs(stats.p95 - quantiles[94]) / quantiles[94], 0.05)
+        self.assertEqual(len(stats.markers["p95"]["heights"]), 5)
+
+
+class StationStorageDatabase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tool = self._create_tool()
+
+    def tearDown(self):
+        self.tool._engine.dispose()
+        self.directory.cleanup()
+
+    def _create_tool(self, **kwargs):
+        with mock.patch(
+            "stationexec.utilities.config.get_all_paths",
+            return_value={"data_folder": self.directory.name},
+        ):
+            tool = StationStorage(
+                {}, tool_type="station_storage", name="Station Storage", tool_id="storage",
+                version="test", debug=0, dev=True, **kwargs
+            )
+        tool.initialize()
+        return tool
+
+    def _store_sequence(self, operations=2, results=3, station=None, version="1.0"):
+        """ Store a finished sequence the way the sequencer reports it """
+        created = get_utc_now()
+        station = station or get_uuid()
+        sequence = get_uuid()
+        self.tool.on_sequence_start([{
+            "uuid": sequence, "station": station, "info": {"a": 1}, "version": version,
+            "created": created,
+        }])
+        op_uuids = [get_uuid() for _ in range(operations)]
+        self.tool.on_operation_start([
+            {"uuid": op, "opid": "op{0}".format(index), "sequence": sequence, "name": "Op",
+             "priority": 0, "created": created}
+            for index, op in enumerate(op_uuids)
+        ])
+        self.tool.on_result_store([
+            {"uuid": get_uuid(), "operation": op, "name": "r{0}".format(index),
+             "value": float(index), "passing": True, "operator": "lt", "operand2": 10,
+             "created": created}
+            for op in op_uuids for index in range(results)
+        ])
+        self.tool.on_operation_end([
+            {"uuid": op, "passing": True, "duration_ms": 1000 * (index + 1),
+             "waittime_ms": 0, "exitcode": 100, "created": created}
+            for index, op in enumerate(op_uuids)
+        ])
+        self.tool.on_sequence_end([{
+            "uuid": sequence, "passing": True, "duration_ms": 5000, "created": created,
+        }])
+        return station, sequence
+
+    def _count(self, table):
+        with self.tool.session() as s:
+            return s.query(table).count()
+
+    def test_bulk_inserts(self):
+        station, sequence = self._store_sequence()
+        self.tool.on_log_data([
+            {"stream": "info", "message": "stored", "created": get_utc_now()},
+            {"stream": "debug", "debug_level": 9, "message": "filtered"},
+        ])
+        counts = {
+            table.__tablename__: self._count(table)
+            for table in (SequenceStart, SequenceEnd, OperationStart, OperationEnd, Result, Logging)
+        }
+        self.assertEqual(counts, {
+            "sequence_starts": 1, "sequence_ends": 1, "operation_starts": 2,
+            "operation_ends": 2, "results": 6, "logging": 1,
+        })
+        results = self.tool.get_sequence_results(stationuuid=station, sequenceuuid=sequence)
+        self.assertEqual(sorted(results), ["op0", "op1"])
+        self.assertEqual([result["value"] for result in results["op0"]], [0.0, 1.0, 2.0])
+        self.assertEqual(
+            sorted(self.tool.get_operation_average_duration(stationuuid=station)),
+            [("op0", 1.0), ("op1", 2.0)],
+        )
+
+
+    def test_insert_defaults(self):
+        station, sequence = self._store_sequence(operations=1, results=0)
+        operation = get_uuid()
+        self.tool.on_operation_start([{
+            "uuid": operation, "opid": "op", "sequence": sequence, "name": "Op", "priority": 0,
+        }])
+        # Missing "passing" and "waittime_ms" - the column defaults are stored, as with the ORM
+        self.tool.on_operation_end([{"uuid": operation, "duration_ms": 10, "exitcode": 100}])
+        with self.tool.session() as s:
+            end = s.query(OperationEnd).filter(OperationEnd.uuid == operation).one()
+            start = s.query(OperationStart).filter(OperationStart.uuid == operation).one()
+        self.assertEqual((end.passing, end.waittime), (0, 0))
+        self.assertIsNotNone(end.created)
+        self.assertIsNotNone(start.created)
+
+    def test_sqlite_profile(self):
+        self.tool._engine.dispose()
+        self.tool = self._create_tool(
+            sqlite_profile="tuned", sqlite_pragmas={"busy_timeout": 1234}
+        )
+        self._store_sequence()
+        connection = self.tool._engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            pragmas = {}
+            for name in ("journal_mode", "synchronous", "busy_timeout", "temp_store"):
+                cursor.execute("PRAGMA {0}".format(name))
+                pragmas[name] = cursor.fetchone()[0]
+        finally:
+            connection.close()
+        # synchronous NORMAL is 1, temp_store MEMORY is 2
+        self.assertEqual(
+            pragmas,
+            {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 1234, "temp_store": 2},
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, "storage.sqlite-wal")))
+        busy, _pages, _checkpointed = self.tool.wal_checkpoint("TRUNCATE")
+        self.assertEqual(busy, 0)
+        self.assertEqual(
+            os.path.getsize(os.path.join(self.directory.name, "storage.sqlite-wal")), 0
+        )
+
+        with self.assertRaises(Exception):
+            self._create_tool(sqlite_profile="fastest")
+
+
+    def test_operation_timing_by_version(self):
+        station, first = self._store_sequence(version="1.0")
+        _, second = self._store_sequence(operations=3, station=station, version="2.0")
+        timing = self.tool.get_operation_timing(stationuuid=station, version="2.0")
+        self.assertEqual(list(timing), [second])
+        self.assertEqual(len(timing[second]), 3)
+        self.assertEqual(
+            sorted(self.tool.get_operation_timing(stationuuid=station)), sorted([first, second])
+        )
+
+    def _execute(self, sql):
+        connection = self.tool._engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql)
+            rows = cursor.fetchall()
+            connection.commit()
+            return rows
+        finally:
+            connection.close()
+
+    def _index_names(self, table):
+        return [row[1] for row in self._execute("PRAGMA index_list({0})".format(table))]
+
+    def test_index_migration(self):
+        self._store_sequence()
+        # A database of an older version, without the lookup indexes
+        self._execute("DROP INDEX ix_results_operation")
+        self._execute("DROP INDEX ix_sequence_starts_station_created")
+        self.tool._engine.dispose()
+
+        self.tool = self._create_tool()
+        self.assertIn("ix_results_operation", self._index_names("results"))
+        self.assertIn("ix_sequence_starts_station_created", self._index_names("sequence_starts"))
+        self.assertIn("ix_operation_starts_sequence", self._index_names("operation_starts"))
+        plan = self._execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM results WHERE operation = 'x'"
+        )
+        self.assertIn("ix_results_operation", " ".join(row[-1] for row in plan))
+
+    def _store_runs(self, station, version, durations, exitcode=100):
+        """ Store a sequence that ran operation "op" once for each duration """
+        sequence = get_uuid()
+        self.tool.on_sequence_start([{
+            "uuid": sequence, "station": station, "version": version, "created": get_utc_now(),
+        }])
+        op_uuids = [get_uuid() for _ in durations]
+        self.tool.on_operation_start([
+            {"uuid": op, "opid": "op", "sequence": sequence, "name": "Op", "priority": 0}
+            for op in op_uuids
+        ])
+        self.tool.on_operation_end([
+            {"uuid": op, "passing": True, "duration_ms": seconds * 1000, "exitcode": exitcode}
+            for op, seconds in zip(op_uuids, durations)
+        ])
+
+    def test_operation_durations(self):
+        station = get_uuid()
+        self._store_runs(station, "v1", [1, 2, 3, 4, 5])
+        self._store_runs(station, "v1", [6, 7, 8, 9, 10])
+        self._store_runs(station, "v1", [100], exitcode=0)
+        self._store_runs(station, "v2", [20])
+
+        stats, = self.tool.get_operation_duration_statistics(stationuuid=station, version="v1")
+        self.assertEqual((stats["opid"], stats["version"], stats["count"]), ("op", "v1", 10))
+        self.assertAlmostEqual(stats["mean"], 5.5)
+        self.assertAlmostEqual(stats["stdev"], statistics.stdev(range(1, 11)))
+        self.assertLess(abs(stats["p50"] - 5.5), 1)
+        # Ten runs are few for the P-square markers of the 95th percentile
+        self.assertTrue(stats["p50"] < stats["p95"] <= 10)
+        self.assertGreater(stats["ewma"], stats["mean"])
+        self.assertEqual(
+            self.tool.get_operation_average_duration(stationuuid=station), [("op", 75 / 11)]
+        )
+        self.assertEqual(
+            self.tool.get_operation_average_duration(stationuuid=station, version="v2"),
+            [("op", 20.0)],
+        )
+
+        # A database of an older version has the history, but no statistics
+        before = self.tool.get_operation_duration_statistics(stationuuid=station)
+        self._execute("DELETE FROM operation_durations")
+        self._execute("DROP TABLE storage_metadata")
+        self.tool._engine.dispose()
+        self.tool = self._create_tool()
+        after = self.tool.get_operation_duration_statistics(stationuuid=station)
+        for stats in before + after:
+            del stats["updated"]
+        self.assertEqual(len(after), 2)
+        for old, new in zip(before, after):
+            self.assertEqual(sorted(old), sorted(new))
+            for name in old:
+                if isinstance(old[name], float):
+                    self.assertAlmostEqual(old[name], new[name])
+                else:
+                    self.assertEqual(old[name], new[name])
+
+    def test_duration_before_start_stored(self):
+        station = get_uuid()
+        # The sequencer sends the station, opid and version with the end of the operation, so
+        # the duration counts even if the start is stored later, or in another database
+        self.tool.on_operation_end([
+            {"uuid": get_uuid(), "passing": True, "duration_ms": 2000, "exitcode": 100,
+             "opid": "op", "station": station, "version": "v1"}
+        ])
+        stats, = self.tool.get_operation_duration_statistics(stationuuid=station, version="v1")
+        self.assertEqual((stats["opid"], stats["count"], stats["mean"]), ("op", 1, 2.0))
+
+    def test_durations_computed_once(self):
+        # No successful runs yet - the empty statistics are not computed again at every start
+        self.tool._engine.dispose()
+        with mock.patch.object(StationStorage, "rebuild_operation_durations") as rebuild:
+            self.tool = self._create_tool()
+        self.assertFalse(rebuild.called)
+
+    def test_uuid_lookup(self):
+        station, sequence = self._store_sequence()
+        dashed = str(str2uuid(sequence)).upper()
+        sequences = self.tool.get_sequences(stationuuid=station, sequenceuuid=dashed)
+        self.assertEqual([found["uuid"] for found in sequences], [sequence])
+        operations = self.tool.get_sequence_operations(stationuuid=station, sequenceuuid=dashed)
+        self.assertEqual(len(operations), 2)
+
+        # The start of a UUID is not a UUID - prefixes are searched for separately
+        short = sequence[:8]
+        self.assertEqual(
+            self.tool.get_sequence_results(stationuuid=station, sequenceuuid=short), {}
+        )
+        self.assertEqual(
+            self.tool.get_sequence_operations(stationuuid=station, sequenceuuid=short), []
+        )
+        results = self.tool.get_sequence_results(
+            stationuuid=station, sequenceuuid_prefix=short.upper()
+        )
+        self.assertEqual(sorted(results), ["op0", "op1"])
+        self.assertEqual(
+            self.tool.get_sequences(stationuuid=station, sequenceuuid_prefix="xyz"), []
+        )
+
+        plan = self._execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM operation_starts "
+            "WHERE sequence >= 'abc' AND sequence < 'abcg'"
+        )
+        self.assertIn("ix_operation_starts_sequence", " ".join(row[-1] for row in plan))
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -8,10 +8,9 @@ Serial or TCP can inherit from this class.
 """
 
 import socket
-import time
 from collections import deque
 from datetime import datetime
-from threading import Lock
+from threading import Event, Lock
 
 # noinspection PyPackageRequirements
 import serial
@@ -20,6 +19,8 @@ from serial.serialutil import Timeout
 from stationexec.logger import log
 from stationexec.toolbox.tool import Tool
 from stationexec.utilities.byte_conversion import to_bytes
+from stationexec.utilities.cancellation import current_token
+from stationexec.utilities.exceptions import AbortException
 from stationexec.utilities.ioloop_ref import IoLoop
 from tornado import gen
 
@@ -78,9 +79,12 @@ class AsyncToolBase(Tool):
         :param bool wait:
         :param datetime after:
         :return:
+        :raise AbortException: if the calling operation is asked to stop while waiting
         """
         try:
             return self._asynctool.read(wait, after)
+        except AbortException:
+            raise
         except Exception as e:
             log.exception(
                 "Error while receiving async data in {0}".format(self.tool_id), e
@@ -94,13 +98,17 @@ class AsyncToolBase(Tool):
         :param str data:
         :param bool clear_buffer:
         :return:
+        :raise AbortException: if the calling operation is asked to stop while waiting
         """
         try:
             if clear_buffer:
                 self._asynctool.clear_rx_queue()
+            current_token().raise_if_cancelled()
             now = datetime.now()
             self.send(data)
             return self.receive(wait=True, after=now)
+        except AbortException:
+            raise
         except Exception as e:
             log.exception(
                 "Error while doing async send_receive in {0}".format(self.tool_id), e
@@ -168,6 +176,8 @@ class AsyncTool(object):
         self._rx_queue = deque([], maxlen=100)
         self._tx_queue = deque([], maxlen=100)
         self._rx_queue_lock = Lock()
+        # Set when a message is added to the rx queue, to wake up a waiting read
+        self._rx_ready = Event()
         # Time window in seconds for which rx messages are deemed valid
         self.rx_time_to_live = 10
         self.msg_id = 1
@@ -522,17 +532,26 @@ class AsyncTool(object):
         If wait, wait until timeout expires for available data
         If after, message must be received after specified time
 
+        A waiting read returns as soon as a message arrives, and is interrupted when the
+        cancellation token of the calling operation is cancelled
+
         :param bool wait:
         :param datetime after:
         :return: data string or None
+        :raise AbortException: if the calling operation is asked to stop while waiting
         """
         if wait:
+            token = current_token()
             timeout_timer = Timeout(self.timeout)
-            while not timeout_timer.expired():
-                self._cleanup_rx_queue(after)
-                if self._rx_queue:
-                    return self._rx_queue.popleft().data
-                time.sleep(0.1)
+            with token.on_cancel(self._rx_ready.set):
+                while not timeout_timer.expired():
+                    # Clear before looking so a message added after the look still wakes the wait
+                    self._rx_ready.clear()
+                    token.raise_if_cancelled()
+                    self._cleanup_rx_queue(after)
+                    if self._rx_queue:
+                        return self._rx_queue.popleft().data
+                    self._rx_ready.wait(timeout_timer.time_left())
             return None
         else:
             self._cleanup_rx_queue(after)
@@ -593,6 +612,7 @@ class AsyncTool(object):
         with self._rx_queue_lock:
             self._rx_queue.append(AsyncMessage(self.msg_id, data))
             self.msg_id += 1
+        self._rx_ready.set()
 
     def _cleanup_rx_queue(self, after):
         """
@@ -26,6 +26,7 @@ import threading
 
 from stationexec.logger import log
 from stationexec.station.events import InfoEvents, emit_event
+from stationexec.station.payloads import ObjectUpdatePayload
 from stationexec.utilities.error_codes import ErrorCode
 from stationexec.utilities.exceptions import (
     ToolUnavailableException,
@@ -166,11 +167,7 @@ class Tool(object):
     def value_to_ui(self, target, value):
         self.emit_event(
             InfoEvents.OBJECT_UPDATE,
-            {
-                "source": "tool.{0}".format(self.tool_id),
-                "target": target,
-                "value": value,
-            },
+            ObjectUpdatePayload("tool.{0}".format(self.tool_id), target, value),
         )
 
     def _get_current_status_message(self):
@@ -7,7 +7,9 @@ from functools import wraps, partial
 
 from addict import Dict as Addict
 from stationexec.logger import log
-from stationexec.station.events import emit_event, register_for_event, InfoEvents, ActionEvents, unregister_from_event
+from stationexec.station.events import emit_event, register_for_event, InfoEvents, ActionEvents, unregister_from_event, \
+    AsyncSubscriber, Overflow
+from stationexec.station.payloads import ToolUpdatePayload
 from stationexec.toolbox.handlers import ToolCommand, ToolboxStatus, ToolUI, _set_tool_routes
 from stationexec.toolbox.tool import Tool
 from stationexec.toolbox.tool_utilities import load_tool_object
@@ -122,6 +124,17 @@ class ToolBox(object):
         self._manifest_data = config.load_config(system_paths["tool_manifest"])
         self._tool_events = {}
 
+        # Tools report status changes from their own threads; rebuilding and publishing the
+        # toolbox status happens on a worker, and changes reported while it is busy merge into
+        # one refresh
+        self._tool_status_changed = AsyncSubscriber(
+            self.tool_status_listener,
+            maxsize=1,
+            overflow=Overflow.COALESCE,
+            coalesce_key=lambda payload: None,
+            name="toolbox-status",
+        )
+
         tool_types = [tool["tool_type"] for tool in self._manifest_data]
         for tool in REQUIRED_TOOLS:
             if tool['id'] not in tool_types: 
@@ -232,7 +245,7 @@ class ToolBox(object):
             "debug": self._debug,
             "dev": self._dev,
             "db_config": self.system_db_config,
-            "_tool_status_changed": self.tool_status_listener,
+            "_tool_status_changed": self._tool_status_changed,
             "_register_for_event": partial(self._register_for_event, tool_cfg.tool_id),
             "_emit_event": emit_event
         }
@@ -365,10 +378,7 @@ class ToolBox(object):
         :return:
         """
         # Tell UI to refresh tool status
-        emit_event(InfoEvents.TOOL_UPDATE, {
-            "source": "Toolbox",
-            "status": self.get_status()
-        })
+        emit_event(InfoEvents.TOOL_UPDATE, ToolUpdatePayload("Toolbox", self.get_status()))
 
     def get_status(self):
         """
@@ -34,8 +34,8 @@ this.fetchToolUrl()}},{key:"componentDidUpdate",value:function(a){0===this.props
 a.pageOptions)})})}else 0<this.props.dataCache.tools.length&&(this.firstRender=!0,b="/tool/ui/"+this.props.dataCache.tools[0].tool_id,this.setState({activetool:this.props.dataCache.tools[0].tool_id}),fetch(b).then(function(b){return b.text()}).then(function(b){return a.setState({html:HTMLReactParser(b,a.pageOptions)})}))}},{key:"componentWillUnmount",value:function(){ws_unregister(this.id);this.script_tags.forEach(function(a){a=document.getElementById(a);a.parentNode.removeChild(a)})}},{key:"onButton",
 value:function(a){if(a=a.target.id){var b={arguments:{command:a}};document.querySelectorAll("."+a).forEach(function(a){b.arguments[a.name]=a.value});b.type="tool_command";b.target="tool."+(this.props.extras.pages[0]||this.props.dataCache.tools[0].tool_id);send_websocket(this.id,"InfoEvents.TOOL_COMMAND",b)}}},{key:"render",value:function(){return React.createElement("div",null,React.createElement(ToolStatus,{allTools:this.props.dataCache.tools,route:this.props.extras.route,handleClick:this.props.extras.handleClick,
 active:this.state.activetool}),React.createElement("div",{className:"tool-page-user-ui"},this.state.html),React.createElement(MessageView,{messages:this.props.dataCache.messages}))}}]);return a}(React.Component),Report=function(d){function a(c){_classCallCheck(this,a);var b=_possibleConstructorReturn(this,(a.__proto__||Object.getPrototypeOf(a)).call(this,c));b.buttonClick=function(a){if("report-search-by-date"===a.target.id){a=document.getElementById("report-search-by-date-start").value;var c=document.getElementById("report-search-by-date-end").value;
-b.searchByDate(a,c)}else"report-search-by-value"===a.target.id&&(a=document.getElementById("report-search-by-value-input").value,b.searchByValue(a))};b.searchByDate=function(a,c){b.fetchData({starttime:a,endtime:c,number:null})};b.searchByValue=function(a){b.fetchData({sequenceuuid:a})};b.fetchData=function(a){send_websocket(b.id,"RetrievalEvents.GET_SEQUENCES",a)};b.formatTimeString=function(){return(0<arguments.length&&void 0!==arguments[0]?arguments[0]:new Date).toISOString().split("T")[0]};b.dateChange=
-function(a){"end"===a.target.name?b.setState({end:a.target.value}):"start"===a.target.name&&b.setState({start:a.target.value})};b.onSeqSelect=function(a){var c=a.target.value.split(" ")[0],d={},e;for(e in b.state.sequences)if(b.state.sequences[e].uuid.startsWith(c)){d=b.state.sequences[e];break}b.setState({selectedSequence:a.target.value,activeSequence:d});send_websocket(b.id,"RetrievalEvents.GET_SEQUENCE_OPERATIONS",{sequenceuuid:c});send_websocket(b.id,"RetrievalEvents.GET_SEQUENCE_RESULTS",{sequenceuuid:c})};
+b.searchByDate(a,c)}else"report-search-by-value"===a.target.id&&(a=document.getElementById("report-search-by-value-input").value,b.searchByValue(a))};b.searchByDate=function(a,c){b.fetchData({starttime:a,endtime:c,number:null})};b.searchByValue=function(a){b.fetchData(32===a.replace(/-/g,"").length?{sequenceuuid:a}:{sequenceuuid_prefix:a})};b.fetchData=function(a){send_websocket(b.id,"RetrievalEvents.GET_SEQUENCES",a)};b.formatTimeString=function(){return(0<arguments.length&&void 0!==arguments[0]?arguments[0]:new Date).toISOString().split("T")[0]};b.dateChange=
+function(a){"end"===a.target.name?b.setState({end:a.target.value}):"start"===a.target.name&&b.setState({start:a.target.value})};b.onSeqSelect=function(a){var c=a.target.value.split(" ")[0],d={},e;for(e in b.state.sequences)if(b.state.sequences[e].uuid.startsWith(c)){d=b.state.sequences[e];break}b.setState({selectedSequence:a.target.value,activeSequence:d});send_websocket(b.id,"RetrievalEvents.GET_SEQUENCE_OPERATIONS",{sequenceuuid:d.uuid});send_websocket(b.id,"RetrievalEvents.GET_SEQUENCE_RESULTS",{sequenceuuid:d.uuid})};
 b.onDataArrival=function(a){a.target===b.id&&("RetrievalEvents.GET_SEQUENCES"===a.request_event?b.setState({sequences:a.result||[]}):"RetrievalEvents.GET_SEQUENCE_OPERATIONS"===a.request_event?b.setState({operations:a.result||[]}):"RetrievalEvents.GET_SEQUENCE_RESULTS"===a.request_event&&b.setState({results:a.result||{}}))};b.id=random_id(b.constructor.name);b.state={end:b.formatTimeString(),start:b.formatTimeString(new Date((new Date).setDate((new Date).getDate()-7))),sequences:[],operations:[],
 results:{},selectedSequence:null,activeSequence:{}};return b}_inherits(a,d);_createClass(a,[{key:"componentDidMount",value:function(){ws_register(this.id,this.onDataArrival,"InfoEvents.UI_DATA_DELIVERY");0<this.props.extras.pages.length?(document.getElementById("report-search-by-value-input").value=this.props.extras.pages[0],this.searchByValue(this.props.extras.pages[0])):this.buttonClick({target:{id:"report-search-by-date"}})}},{key:"componentWillUnmount",value:function(){ws_unregister(this.id)}},
 {key:"render",value:function(){var a=function(a,b){return 100===a&&0===b?140:a},b=this.state.sequences?this.state.sequences.map(function(a){return React.createElement("option",{key:a.uuid},a.uuid.substr(0,8)+" "+(new Date(1E3*a.created)).toLocaleTimeString([],{year:"numeric",month:"short",day:"2-digit",hour:"2-digit",minute:"2-digit"})+" "+(1===a.passing?"Pass":"Fail"))}):null,d={0:"Ready",100:"Complete",105:"Waiting on Tool",120:"Requeued",130:"Error in Execution",140:"Result Failed",150:"Skipped",
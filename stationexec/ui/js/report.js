@@ -46,7 +46,8 @@ class Report extends React.Component {
     };
 
     searchByValue = (uuid) => {
-        let args = {sequenceuuid: uuid};
+        // A whole UUID is looked up exactly; anything shorter is the start of one
+        let args = uuid.replace(/-/g, "").length === 32 ? {sequenceuuid: uuid} : {sequenceuuid_prefix: uuid};
         this.fetchData(args)
     };
 
@@ -82,8 +83,8 @@ class Report extends React.Component {
             selectedSequence: e.target.value,
             activeSequence: activeSequence
         });
-        send_websocket(this.id, "RetrievalEvents.GET_SEQUENCE_OPERATIONS",  {sequenceuuid: seqid});
-        send_websocket(this.id, "RetrievalEvents.GET_SEQUENCE_RESULTS",  {sequenceuuid: seqid});
+        send_websocket(this.id, "RetrievalEvents.GET_SEQUENCE_OPERATIONS",  {sequenceuuid: activeSequence.uuid});
+        send_websocket(this.id, "RetrievalEvents.GET_SEQUENCE_RESULTS",  {sequenceuuid: activeSequence.uuid});
     };
 
     onDataArrival = (objectData) => {
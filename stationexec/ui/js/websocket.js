@@ -27,12 +27,16 @@ var ws_events = {};
 
 function receive_websocket(evt) {
     let data = JSON.parse(evt.data);
+    // Bursts of some events arrive as one message holding a batch of them
+    let messages = data.hasOwnProperty("_batch") ? data._batch : [data];
     let type = data._event;
     if (!(ws_events.hasOwnProperty(type))) {
         return
     }
-    for (let sub in ws_events[type]) {
-        ws_events[type][sub](data);
+    for (let m in messages) {
+        for (let sub in ws_events[type]) {
+            ws_events[type][sub](messages[m]);
+        }
     }
 }
 
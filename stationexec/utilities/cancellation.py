@@ -0,0 +1,185 @@
+# Copyright 2004-present Facebook. All Rights Reserved.
+
+# @lint-ignore-every PYTHON3COMPATIMPORTS1
+
+"""
+Cooperative cancellation of sequence work.
+
+A `.CancellationToken` is handed to every running `.Operation`. Cancelling the token of a
+sequence cancels the tokens of all of its operations in one step. The token of the running
+operation is bound to its thread, so tool code can find it with `.current_token` without it being
+passed through every call - blocking waits (`time.sleep`, polling for a response) should use
+`.CancellationToken.wait` or `.CancellationToken.sleep` so they return as soon as a stop is
+requested instead of running to their timeout. Code blocked somewhere a token cannot wake it (a
+socket, a serial port) can register a callback with `.CancellationToken.on_cancel` that closes
+or interrupts the resource.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from stationexec.logger import log
+from stationexec.utilities.exceptions import AbortException
+
+
+class CancellationToken(object):
+    """ Thread-safe flag that is set once, when the work it guards should stop """
+
+    def __init__(self, parent=None):
+        """
+        :param CancellationToken parent: [optional] token whose cancellation also cancels
+            this one
+        """
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._children = []
+        self._callbacks = []
+        self._parent = parent
+        # Why and when the token was cancelled
+        self.reason = None
+        self.cancelled_at = None
+        if parent is not None:
+            parent._add_child(self)
+
+    def cancel(self, reason=None):
+        """
+        Cancel the token, all of its children and run the registered callbacks. Cancelling an
+        already cancelled token does nothing.
+
+        :param str reason: [optional] explanation of why the work is cancelled
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self.cancelled_at = time.time()
+            self._event.set()
+            children, self._children = self._children, []
+            callbacks, self._callbacks = self._callbacks, []
+
+        for child in children:
+            child.cancel(reason)
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def is_cancelled(self):
+        """ Returns True if the token was cancelled """
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the token is cancelled or the timeout expires - a `time.sleep` that returns
+        early on cancellation
+
+        :param float timeout: [optional] maximum seconds to wait; wait forever if None
+        :return: True if the token was cancelled
+        :rtype: bool
+        """
+        return self._event.wait(timeout)
+
+    def sleep(self, seconds):
+        """
+        Sleep for the given time, unless the token is cancelled first
+
+        :param float seconds: seconds to sleep
+        :raise AbortException: if the token is or becomes cancelled
+        """
+        if self._event.wait(seconds):
+            raise AbortException()
+
+    def raise_if_cancelled(self):
+        """ :raise AbortException: if the token was cancelled """
+        if self._event.is_set():
+            raise AbortException()
+
+    def add_callback(self, callback):
+        """
+        Call a function (with no arguments) when the token is cancelled. Called immediately if
+        the token is already cancelled.
+
+        :param callback: function to call
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def remove_callback(self, callback):
+        """ Remove a callback registered with `.add_callback`, if still registered """
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    @contextmanager
+    def on_cancel(self, callback):
+        """ Call a function if the token is cancelled while inside of the ``with`` block """
+        self.add_callback(callback)
+        try:
+            yield self
+        finally:
+            self.remove_callback(callback)
+
+    def detach(self):
+        """
+        Stop following the parent token - the parent no longer holds on to this token once the
+        work it guards is done
+        """
+        parent, self._parent = self._parent, None
+        if parent is not None:
+            parent._remove_child(self)
+
+    def _add_child(self, child):
+        with self._lock:
+            if not self._event.is_set():
+                self._children.append(child)
+                return
+        child.cancel(self.reason)
+
+    def _remove_child(self, child):
+        with self._lock:
+            if child in self._children:
+                self._children.remove(child)
+
+    @staticmethod
+    def _run_callback(callback):
+        try:
+            callback()
+        except Exception as e:
+            log.exception("Exception in cancellation callback", e)
+
+
+class _NeverCancelled(CancellationToken):
+    """ Token of threads that are not running an operation - it can not be cancelled """
+
+    def cancel(self, reason=None):
+        pass
+
+    def add_callback(self, callback):
+        pass
+
+
+_NEVER_CANCELLED = _NeverCancelled()
+_thread_tokens = threading.local()
+
+
+def current_token():
+    """
+    Get the cancellation token of the operation running on this thread
+
+    :return: the token bound with `.set_current_token`; a token that is never cancelled if
+        there is none
+    :rtype: CancellationToken
+    """
+    token = getattr(_thread_tokens, "token", None)
+    return token if token is not None else _NEVER_CANCELLED
+
+
+def set_current_token(token):
+    """
+    Bind a cancellation token to this thread
+
+    :param CancellationToken token: the token; None to unbind
+    """
+    _thread_tokens.token = token
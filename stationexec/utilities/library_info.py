@@ -2,7 +2,16 @@ import subprocess
 import sys
 import re
 
+# Libraries installed when first queried - code already imported into this process does not
+# change if packages are installed later, so the lookup (a 'pip list' call) only happens once
+_installed_libraries = None
+
+
 def get_installed_library_versions() -> dict:
+        global _installed_libraries
+        if _installed_libraries is not None:
+            return dict(_installed_libraries)
+
         try:
             output = subprocess.check_output([sys.executable, "-m", "pip", "list"], encoding='UTF-8')
         except subprocess.CalledProcessError as e:
@@ -11,7 +20,7 @@ def get_installed_library_versions() -> dict:
         library_pattern = r'(.\S+) +([0-9.]+)'
         output_lines = output.split('\n')
         installed_libraries = {}
-        
+
         for line in output_lines:
             # check if line contains a library / version
             match = re.findall(string=line, pattern=library_pattern, flags=re.IGNORECASE)
@@ -20,4 +29,5 @@ def get_installed_library_versions() -> dict:
                 version = match[0][1]
                 installed_libraries[library_name] = version
 
-        return installed_libraries
\ No newline at end of file
+        _installed_libraries = installed_libraries
+        return dict(installed_libraries)
@@ -9,7 +9,7 @@ import threading
 from functools import partial
 
 from stationexec.logger import log
-from stationexec.station.events import emit_event_non_blocking, ActionEvents
+from stationexec.station.events import emit_event_non_blocking, close_event_queues, ActionEvents
 from stationexec.utilities.ioloop_ref import IoLoop
 
 MAX_WAIT_SECONDS_TILL_SHUTDOWN = 2
@@ -88,6 +88,8 @@ def sig_handler(self, signum, frame):
 def stop_loop():
     IoLoop().current().stop()
     log.info('HTTP Shutdown finally')
+    # Deliver queued log messages and events; later ones are delivered as they are emitted
+    close_event_queues()
 
     # tell user about remaining threads, since they will cause a hang.
     # don't report this thread (MainThread)
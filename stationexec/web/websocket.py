@@ -4,7 +4,9 @@ import simplejson
 from stationexec.logger import log
 from stationexec.station.events import (
     emit_event,
-    register_for_event_group,
+    register_for_events,
+    AsyncSubscriber,
+    Overflow,
     InfoEvents,
     ActionEvents,
     RetrievalEvents,
@@ -19,6 +21,19 @@ from tornado.websocket import WebSocketClosedError, WebSocketHandler
 
 is_shutting_down = False
 
+# Events that only carry the latest state of something - a newer one makes the queued ones
+# obsolete, so they may be dropped when the UI falls behind. Every other InfoEvent is delivered,
+# log lines included.
+LATEST_STATE_EVENTS = (
+    InfoEvents.SEQUENCE_UPDATE,
+    InfoEvents.TOOL_UPDATE,
+    InfoEvents.OBJECT_UPDATE,
+)
+
+
+def _is_latest_state(payload):
+    return payload.get("_event") in LATEST_STATE_EVENTS
+
 
 class StationSocket(WebSocketHandler):
     """Tornado endpoint handler for requesting a new web socket"""
@@ -92,7 +107,22 @@ class SocketManager(object):
 
     def initialize(self):
         """Get socket manager ready for operation."""
-        register_for_event_group("SocketManager", InfoEvents, self.send_all)
+        # Serializing the events happens on one worker thread, so the page receives them in
+        # the order they were emitted. If the UI can not keep up, the oldest state updates are
+        # dropped rather than slowing down the station. Other events - prompts, popups, alerts,
+        # sequence finished, log lines - are never dropped; when only they are queued, the
+        # emitter waits for room.
+        register_for_events(
+            "SocketManager",
+            list(InfoEvents),
+            AsyncSubscriber(
+                self.send_all,
+                overflow=Overflow.DROP_OLDEST,
+                name="websocket",
+                accepts_batches=True,
+                droppable=_is_latest_state,
+            ),
+        )
 
     def shutdown(self):
         global is_shutting_down
@@ -116,6 +146,9 @@ class SocketManager(object):
         if is_shutting_down:
             return
         event_data["_event"] = str(event_data["_event"])
+        # Coalesced events arrive batched - sent as one message for the page to unpack
+        for payload in event_data.get("_batch", ()):
+            payload["_event"] = event_data["_event"]
         # Schedule it to execute on the main Tornado thread to avoid socket corruption
         IoLoop().current().spawn_callback(self._send_all, simplejson.dumps(event_data))
 